@@ -0,0 +1,99 @@
+"""
+In-process persona agents, configured from config/agents.json.
+
+Replaces exec() of the per-persona agent_*.py scripts: each Agent reads its persona
+prompt and the shared sys_prompt.txt once, then answers any number of turns.
+"""
+import json
+import re
+from pathlib import Path
+
+import utils
+import history_writer
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+CONFIG_DIR = REPO_ROOT / "config"
+AGENTS_CONFIG = CONFIG_DIR / "agents.json"
+
+_config = None
+_agents: dict = {}
+
+
+class Agent:
+    """One persona: prompts loaded once, respond() per turn."""
+
+    def __init__(self, person_name: str, role: str, persona_prompt_path: Path, sys_prompt_path: Path):
+        self.person_name = person_name
+        self.role = role
+        if not persona_prompt_path.exists():
+            raise FileNotFoundError(f"Persona prompt not found: {persona_prompt_path}")
+        if not sys_prompt_path.exists():
+            raise FileNotFoundError(f"System prompt not found: {sys_prompt_path}")
+        self.persona_prompt = persona_prompt_path.read_text(encoding="utf-8")
+        self.sys_prompt = self.persona_prompt + sys_prompt_path.read_text(encoding="utf-8")
+
+    def respond(self, history: str) -> str:
+        """Return this persona's next message given the formatted conversation history."""
+        try:
+            agent_resp = utils.agent_sim(utils.PRIMARY_MODEL, self.sys_prompt, history)
+        except Exception:
+            agent_resp = utils.agent_sim(utils.FALLBACK_MODEL, self.sys_prompt, history)
+        # Drop a leading "Name:" the model sometimes adds
+        return re.sub(r"^[^:\n]+\s*:\s*", "", agent_resp, count=1)
+
+    def speak(self, channel: str, turns: int = 10) -> str:
+        """Respond to the last `turns` messages of channel and append the reply to it."""
+        history = utils.format_history_as_string(turns=turns, channel=channel)
+        text = self.respond(history)
+        history_writer.append(channel, [{"role": self.role, "content": text}])
+        return text
+
+    async def respond_async(self, history: str) -> str:
+        """respond() on the async client pool (engine.py)."""
+        try:
+            agent_resp = await utils.agent_sim_async(utils.PRIMARY_MODEL, self.sys_prompt, history)
+        except Exception:
+            agent_resp = await utils.agent_sim_async(utils.FALLBACK_MODEL, self.sys_prompt, history)
+        return re.sub(r"^[^:\n]+\s*:\s*", "", agent_resp, count=1)
+
+    async def speak_async(self, channel: str, turns: int = 10) -> str:
+        """speak() without blocking the event loop."""
+        history = utils.format_history_as_string(turns=turns, channel=channel)
+        text = await self.respond_async(history)
+        await history_writer.get_writer().append_async(channel, [{"role": self.role, "content": text}])
+        return text
+
+    def __repr__(self):
+        return f"Agent({self.person_name!r}, role={self.role!r})"
+
+
+def load_config() -> dict:
+    """Parsed config/agents.json (cached)."""
+    global _config
+    if _config is None:
+        with open(AGENTS_CONFIG, "r", encoding="utf-8") as f:
+            _config = json.load(f)
+    return _config
+
+
+def person_roles() -> dict:
+    """Person key -> display role, in config order (e.g. Gaurav_Atavale -> Gaurav)."""
+    return {a["person"]: a["role"] for a in load_config()["agents"]}
+
+
+def get_agent(person_name: str) -> Agent:
+    """Return the cached Agent for person_name, building it on first use."""
+    agent = _agents.get(person_name)
+    if agent is None:
+        config = load_config()
+        entry = next((a for a in config["agents"] if a["person"] == person_name), None)
+        if entry is None:
+            raise KeyError(f"No agent configured for {person_name} in {AGENTS_CONFIG}")
+        agent = Agent(
+            person_name,
+            entry["role"],
+            CONFIG_DIR / entry.get("persona_prompt", f"{person_name}_persona_prompt.txt"),
+            CONFIG_DIR / config.get("sys_prompt", "sys_prompt.txt"),
+        )
+        _agents[person_name] = agent
+    return agent
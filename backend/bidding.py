@@ -0,0 +1,275 @@
+"""
+Bid collection for one bidding round (used by run.py, simulation_stream.py and engine.py).
+
+In concurrent mode every persona with credits bids at the same time on a bounded
+thread pool, so a round takes as long as the slowest single bid instead of the sum
+of all of them. A bid that does not come back within the timeout counts as 0.
+collect_bids_async() does the same with asyncio tasks for the in-process engine.
+
+Two pre-filters skip bid calls that cannot change the outcome, or are unlikely to:
+  - The last speaker cannot speak twice in a row (select_speaker), so their bid only
+    matters when every other bid is 0. Given last_person, it is requested only then.
+    Results are identical; BID_DEFER_LAST_SPEAKER=0 turns this off.
+  - relevance.py can drop personas whose interests do not match the recent messages
+    (off unless BID_RELEVANCE_THRESHOLD is set).
+
+BID_BATCH=1 scores all personas asked in a round with one request (the bidding prompt
+and history sent once, plus a summary per persona) instead of one request each.
+Personas the batched reply does not score, or all of them if it cannot be parsed, are
+then asked one by one as usual.
+"""
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import relevance
+import utils
+from history_store import get_store
+
+# Per-bid timeout (seconds); covers the primary call plus the fallback retry
+BID_TIMEOUT_SECONDS = float(os.environ.get("BID_TIMEOUT_SECONDS", "30"))
+MAX_BID_WORKERS = int(os.environ.get("MAX_BID_WORKERS", "8"))
+DEFER_LAST_SPEAKER = os.environ.get("BID_DEFER_LAST_SPEAKER", "1") != "0"
+BATCH_BIDS = os.environ.get("BID_BATCH", "0") == "1"
+
+_executor = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Shared pool, created on first use and reused for every round."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=MAX_BID_WORKERS, thread_name_prefix="bid")
+    return _executor
+
+
+def _score_to_bid(llm_bid_score: str, credits: int) -> int:
+    """Turn the model's {"score": 0-100} reply into a bid in credits."""
+    return int(0.01 * float(json.loads(llm_bid_score)["score"]) * credits)
+
+
+def _plan_bids(persons, credits: dict, channel: str, last_person: str):
+    """
+    (first, deferred): the personas to ask now, and the last speaker to ask only if all
+    of them bid 0 (None when not deferring). Personas without credits are in neither.
+    """
+    eligible = [p for p in persons if credits.get(p, 0) > 0]
+    deferred = last_person if DEFER_LAST_SPEAKER and last_person in eligible and len(eligible) > 1 else None
+    first = [p for p in eligible if p != deferred]
+    filt = relevance.get_filter()
+    if filt.enabled and len(first) > 1:
+        records = get_store().tail(channel or utils.CHANNEL, filt.recent_turns)
+        keep = filt.contenders(first, records)
+        first = [p for p in first if p in keep]
+    return first, deferred
+
+
+def _parse_batch_scores(text: str, persons) -> dict:
+    """
+    {person: score 0-100} from a batched reply ({"scores": {...}} or a bare map, keyed by
+    person id or first name). Persons it does not score are left out. Raises ValueError
+    when there is no JSON object at all.
+    """
+    text = (text or "").strip()
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        match = re.search(r"\{[\s\S]*\}", text)
+        if not match:
+            raise ValueError("no JSON object in batched bid reply")
+        data = json.loads(match.group(0))
+    scores = data.get("scores", data) if isinstance(data, dict) else None
+    if not isinstance(scores, dict):
+        raise ValueError("batched bid reply has no scores map")
+    lookup = {str(k).strip().lower(): v for k, v in scores.items()}
+    out = {}
+    for p in persons:
+        value = lookup.get(p.lower(), lookup.get(p.split("_")[0].lower()))
+        try:
+            out[p] = min(100.0, max(0.0, float(value)))
+        except (TypeError, ValueError):
+            continue
+    return out
+
+
+def batch_bids(persons, credits_left: dict, channel: str = None) -> dict:
+    """Bids for persons from one batched request on the primary model; {} if it fails."""
+    try:
+        reply = utils.generate_bid_scores_batch(persons, credits_left, utils.PRIMARY_MODEL, channel)
+        scores = _parse_batch_scores(reply, persons)
+    except Exception as e:
+        print(f"[bidding] batched bid failed, asking each persona ({e})", file=sys.stderr, flush=True)
+        return {}
+    return {p: int(0.01 * score * credits_left[p]) for p, score in scores.items()}
+
+
+async def batch_bids_async(persons, credits_left: dict, channel: str = None) -> dict:
+    """batch_bids on the async client pool."""
+    try:
+        reply = await utils.generate_bid_scores_batch_async(persons, credits_left, utils.PRIMARY_MODEL, channel)
+        scores = _parse_batch_scores(reply, persons)
+    except Exception as e:
+        print(f"[bidding] batched bid failed, asking each persona ({e})", file=sys.stderr, flush=True)
+        return {}
+    return {p: int(0.01 * score * credits_left[p]) for p, score in scores.items()}
+
+
+def bid_for_person(person_name: str, credits_left: dict, channel: str = None) -> int:
+    """Ask the primary model for a bid, retrying once with the fallback model. Returns 0 on failure."""
+    credits = credits_left[person_name]
+    if credits <= 0:
+        return 0
+    try:
+        llm_bid_score = utils.generate_bid_score_each_user(person_name, credits_left, utils.PRIMARY_MODEL, channel)
+        return _score_to_bid(llm_bid_score, credits)
+    except Exception:
+        pass
+    try:
+        llm_bid_score = utils.generate_bid_score_each_user(person_name, credits_left, utils.FALLBACK_MODEL, channel)
+        return _score_to_bid(llm_bid_score, credits)
+    except Exception as e:
+        print(f"[bidding] {person_name}: both models failed, bid 0 ({e})", file=sys.stderr, flush=True)
+        return 0
+
+
+def _collect(persons, credits: dict, bids: dict, concurrent: bool, timeout: float, channel: str) -> None:
+    if BATCH_BIDS and len(persons) > 1:
+        if not concurrent:
+            batched = batch_bids(persons, credits, channel)
+        else:
+            fut = _get_executor().submit(batch_bids, persons, credits, channel)
+            done, _ = wait([fut], timeout=timeout)
+            if not done:
+                fut.cancel()
+                print(f"[bidding] no batched bid within {timeout:.0f}s, counting all as 0", file=sys.stderr, flush=True)
+                return
+            batched = fut.result()
+        bids.update(batched)
+        persons = [p for p in persons if p not in batched]
+        if not persons:
+            return
+    if not concurrent:
+        for p in persons:
+            bids[p] = bid_for_person(p, credits, channel)
+        return
+    pool = _get_executor()
+    futures = {pool.submit(bid_for_person, p, credits, channel): p for p in persons}
+    done, not_done = wait(futures, timeout=timeout)
+    for fut in done:
+        bids[futures[fut]] = fut.result()
+    for fut in not_done:
+        # Running threads cannot be interrupted; the late result is simply discarded
+        fut.cancel()
+        print(f"[bidding] {futures[fut]}: no bid within {timeout:.0f}s, counting as 0", file=sys.stderr, flush=True)
+
+
+def collect_bids(persons, credits_left: dict, concurrent: bool = True, timeout: float = BID_TIMEOUT_SECONDS,
+                 channel: str = None, last_person: str = None) -> dict:
+    """
+    Collect one bid per person. Persons without credits (or skipped by the pre-filters)
+    bid 0 without an LLM call. concurrent=False keeps the original one-after-another behaviour.
+    """
+    # Snapshot so in-flight bids never see this round's credit deductions
+    credits = dict(credits_left)
+    bids = {p: 0 for p in persons}
+    first, deferred = _plan_bids(persons, credits, channel, last_person)
+    if not first and deferred is None:
+        return bids
+
+    started = time.monotonic()
+    _collect(first, credits, bids, concurrent, timeout, channel)
+    if deferred is not None and all(bids[p] == 0 for p in first):
+        _collect([deferred], credits, bids, concurrent, timeout, channel)
+    print(f"[bidding] round bids {bids} in {time.monotonic() - started:.2f}s", file=sys.stderr, flush=True)
+    return bids
+
+
+async def bid_for_person_async(person_name: str, credits_left: dict, channel: str = None) -> int:
+    """bid_for_person on the async client pool."""
+    credits = credits_left[person_name]
+    if credits <= 0:
+        return 0
+    try:
+        llm_bid_score = await utils.generate_bid_score_each_user_async(person_name, credits_left, utils.PRIMARY_MODEL, channel)
+        return _score_to_bid(llm_bid_score, credits)
+    except Exception:
+        pass
+    try:
+        llm_bid_score = await utils.generate_bid_score_each_user_async(person_name, credits_left, utils.FALLBACK_MODEL, channel)
+        return _score_to_bid(llm_bid_score, credits)
+    except Exception as e:
+        print(f"[bidding] {person_name}: both models failed, bid 0 ({e})", file=sys.stderr, flush=True)
+        return 0
+
+
+async def collect_bids_async(persons, credits_left: dict, timeout: float = BID_TIMEOUT_SECONDS,
+                             channel: str = None, slot=None, last_person: str = None) -> dict:
+    """
+    collect_bids as concurrent asyncio tasks. slot, if given, is a factory for an async
+    context manager held around each bid (the engine's concurrency and rate limits).
+    Unlike threads, a bid that times out is cancelled.
+    """
+    credits = dict(credits_left)
+    bids = {p: 0 for p in persons}
+    first, deferred = await asyncio.to_thread(_plan_bids, persons, credits, channel, last_person)
+    if not first and deferred is None:
+        return bids
+
+    async def one(person):
+        if slot is None:
+            return await bid_for_person_async(person, credits, channel)
+        async with slot():
+            return await bid_for_person_async(person, credits, channel)
+
+    async def collect(group):
+        if not group:
+            return
+        if BATCH_BIDS and len(group) > 1:
+            try:
+                if slot is None:
+                    batched = await asyncio.wait_for(batch_bids_async(group, credits, channel), timeout)
+                else:
+                    async with slot():
+                        batched = await asyncio.wait_for(batch_bids_async(group, credits, channel), timeout)
+            except asyncio.TimeoutError:
+                print(f"[bidding] no batched bid within {timeout:.0f}s, counting all as 0", file=sys.stderr, flush=True)
+                return
+            bids.update(batched)
+            group = [p for p in group if p not in batched]
+            if not group:
+                return
+        tasks = {asyncio.ensure_future(one(p)): p for p in group}
+        done, not_done = await asyncio.wait(tasks, timeout=timeout)
+        for task in done:
+            bids[tasks[task]] = task.result()
+        for task in not_done:
+            task.cancel()
+            print(f"[bidding] {tasks[task]}: no bid within {timeout:.0f}s, counting as 0", file=sys.stderr, flush=True)
+
+    started = time.monotonic()
+    await collect(first)
+    if deferred is not None and all(bids[p] == 0 for p in first):
+        await collect([deferred])
+    print(f"[bidding] round bids {bids} in {time.monotonic() - started:.2f}s", file=sys.stderr, flush=True)
+    return bids
+
+
+def select_speaker(bids: dict, last_person: str):
+    """
+    run.py's turn rule: the highest bidder speaks, unless they spoke last, in which case
+    the second-highest does. Returns (person, bid), or None if nobody bid.
+    """
+    if all(v == 0 for v in bids.values()):
+        return None
+    selected = max(bids, key=bids.get)
+    if bids[selected] > 0 and selected != last_person:
+        return selected, bids[selected]
+    if selected == last_person:
+        second = max((k for k in bids if k != selected), key=bids.get, default=None)
+        if second is not None:
+            return second, bids[second]
+    return None
@@ -0,0 +1,181 @@
+"""
+One watcher per channel history, fanned out to every SSE subscriber.
+
+Each ChannelBroadcaster follows its channel once (a history_store follower: the JSONL
+file's offset index, or seq queries against SQLite) and pushes every new event into
+bounded per-subscriber asyncio queues, so history I/O stays constant however many
+browser tabs are watching. A subscriber whose queue is full is disconnected (the browser's
+EventSource reconnects and reloads history) rather than slowing down everyone else.
+"""
+import asyncio
+import json
+from datetime import datetime
+
+from file_watch import watch_file
+
+QUEUE_SIZE = 256
+# Idle connections get an SSE comment this often so proxies keep them open
+HEARTBEAT_SECONDS = 15.0
+# Most events replayed to a reconnecting client (Last-Event-ID); a bigger gap gets a
+# "reset" event instead, and the client reloads /api/history
+REPLAY_LIMIT = 1000
+
+
+class Subscriber:
+    """One SSE connection: a bounded queue of (seq, preformatted SSE chunk)."""
+
+    def __init__(self, maxsize: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.closed = False
+
+
+class ChannelBroadcaster:
+    def __init__(self, channel: str, follower, queue_size: int = QUEUE_SIZE):
+        self.channel = channel
+        self.index = follower
+        self.queue_size = queue_size
+        self.subscribers: set = set()
+        self.events_published = 0
+        self.dropped_events = 0
+        self.disconnected_slow = 0
+        self.replayed_events = 0
+        self.replay_resets = 0
+        self._ready = asyncio.Event()
+        self._task = None
+
+    def subscribe(self) -> Subscriber:
+        sub = Subscriber(self.queue_size)
+        self.subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        if sub.closed:
+            return
+        sub.closed = True
+        self.subscribers.discard(sub)
+        # Wake the stream so it ends now; make room if the queue is full (slow consumer)
+        while sub.queue.full():
+            sub.queue.get_nowait()
+        sub.queue.put_nowait(None)
+
+    @staticmethod
+    def format_event(entry: dict) -> str:
+        """One history record as an SSE chunk; the record's seq is the event id."""
+        timestamp = entry.get("timestamp") or datetime.utcnow().isoformat() + "Z"
+        ev = {
+            "type": "message",
+            "role": entry.get("role", ""),
+            "content": entry.get("content", ""),
+            "timestamp": timestamp,
+            "seq": entry["seq"],
+        }
+        return f"id: {entry['seq']}\ndata: {json.dumps(ev)}\n\n"
+
+    @staticmethod
+    def format_reset(last_seq: int) -> str:
+        """
+        SSE "reset" event: the client missed more than REPLAY_LIMIT records and must reload
+        /api/history. Its id is the latest seq, so a client that ignores it reconnects from
+        now rather than asking for the same gap again.
+        """
+        ev = {"type": "reset", "reason": "replay_gap", "last_seq": last_seq}
+        return f"event: reset\nid: {last_seq}\ndata: {json.dumps(ev)}\n\n"
+
+    def publish(self, entry: dict) -> None:
+        """Format one history record as an SSE chunk (once) and hand it to every subscriber."""
+        item = (entry["seq"], self.format_event(entry))
+        self.events_published += 1
+        for sub in list(self.subscribers):
+            try:
+                sub.queue.put_nowait(item)
+            except asyncio.QueueFull:
+                # Slow consumer: drop the event and cut the connection
+                self.dropped_events += 1
+                self.disconnected_slow += 1
+                self.unsubscribe(sub)
+
+    async def run(self) -> None:
+        """Index the history file, then publish new records whenever the watcher reports a change."""
+        watcher = watch_file(self.index.watch_path)
+        try:
+            # First pass indexes what is already there (for replay) without publishing it
+            await asyncio.to_thread(self.index.refresh)
+            self._ready.set()
+            while True:
+                await watcher.wait()
+                try:
+                    records = await asyncio.to_thread(self.index.refresh)
+                except OSError:
+                    records = []
+                for entry in records:
+                    self.publish(entry)
+        finally:
+            watcher.close()
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run(), name=f"broadcast-{self.channel}")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for sub in list(self.subscribers):
+            self.unsubscribe(sub)
+
+    async def stream(self, sub: Subscriber, after_seq: int = None, is_disconnected=None, heartbeat: float = HEARTBEAT_SECONDS):
+        """
+        Async generator of SSE chunks for one subscriber. If after_seq is given (from
+        Last-Event-ID), first replays the records after it from the offset index, so a
+        reconnect costs the size of the gap; a gap of more than REPLAY_LIMIT records gets
+        a single "reset" event and the stream ends. Ends when the subscriber is dropped, or when
+        is_disconnected() (e.g. Request.is_disconnected) reports the client has gone;
+        Starlette also cancels it on disconnect, which unsubscribes too.
+        """
+        try:
+            # Comment line so the response (and its headers) is flushed right away
+            yield ": connected\n\n"
+            last_sent = 0
+            if after_seq is not None:
+                await self._ready.wait()
+                # sub is already subscribed, so anything published meanwhile waits in its queue
+                missed = await asyncio.to_thread(self.index.read_after, after_seq, REPLAY_LIMIT + 1)
+                if len(missed) > REPLAY_LIMIT:
+                    self.replay_resets += 1
+                    yield self.format_reset(max(self.index.last_seq, missed[-1]["seq"]))
+                    return
+                for entry in missed:
+                    self.replayed_events += 1
+                    last_sent = entry["seq"]
+                    yield self.format_event(entry)
+            while True:
+                try:
+                    item = await asyncio.wait_for(sub.queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    if is_disconnected is not None and await is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"
+                    continue
+                if item is None:
+                    break
+                seq, chunk = item
+                if seq <= last_sent:
+                    continue  # already sent during replay
+                yield chunk
+        finally:
+            self.unsubscribe(sub)
+
+    def metrics(self) -> dict:
+        return {
+            "subscribers": len(self.subscribers),
+            "events_published": self.events_published,
+            "dropped_events": self.dropped_events,
+            "disconnected_slow_subscribers": self.disconnected_slow,
+            "replayed_events": self.replayed_events,
+            "replay_resets": self.replay_resets,
+            "last_seq": self.index.last_seq,
+        }
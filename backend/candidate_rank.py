@@ -0,0 +1,198 @@
+"""
+Local candidate ranking for coffee-chat recommendations (recommendation.py), run before
+the LLM call so the prompt carries a shortlist instead of the raw history.
+
+Every candidate (a persona who spoke in the last REC_RANK_TURNS messages) is one document:
+their profile (data/<person>.json), persona prompt (config/<person>_persona_prompt.txt) and
+messages. The user asking is the query, built the same way. Documents become hashed TF-IDF
+vectors: tokens (relevance.tokenize) are hashed into REC_RANK_DIM buckets, so no vocabulary
+is kept and any number of profiles fits one fixed-width float32 matrix; IDF comes from the
+candidate documents. Cosine similarity is one matrix-vector product in NumPy.
+
+The REC_TOP_K best candidates go into the prompt with a short profile summary and their
+REC_SNIPPETS messages most similar to the user. REC_TOP_K=0 sends the raw history instead.
+Measure with scripts/bench_candidate_rank.py.
+"""
+import functools
+import json
+import os
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+import agent
+from relevance import tokenize
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DATA_DIR = REPO_ROOT / "data"
+CONFIG_DIR = REPO_ROOT / "config"
+
+DIM = int(os.environ.get("REC_RANK_DIM", "1024"))
+TOP_K = int(os.environ.get("REC_TOP_K", "5"))
+SNIPPETS = int(os.environ.get("REC_SNIPPETS", "3"))
+RANK_TURNS = int(os.environ.get("REC_RANK_TURNS", "200"))
+SUMMARY_CHARS = 400
+
+# Profile fields that say nothing about a person's interests
+_SKIP_KEYS = frozenset({"email", "dob", "timestamp", "profilePhoto", "linkedinUrl", "instagram", "twitter", "socialLinks"})
+
+
+def _bucket(token: str, dim: int) -> int:
+    return zlib.crc32(token.encode("utf-8")) % dim
+
+
+@functools.lru_cache(maxsize=65536)
+def _counts(text: str, dim: int) -> tuple:
+    """(buckets, counts) of text's tokens hashed into dim buckets; cached, as profiles and messages recur every call."""
+    buckets, counts = np.unique(np.array([_bucket(t, dim) for t in tokenize(text)], dtype=np.int64), return_counts=True)
+    return buckets, counts.astype(np.float32)
+
+
+def hashed_counts(docs, dim: int = DIM) -> np.ndarray:
+    """(len(docs), dim) float32 raw term counts; each doc is a text or a list of texts counted together."""
+    cells, weights = [], []
+    for i, doc in enumerate(docs):
+        for text in ([doc] if isinstance(doc, str) else doc):
+            buckets, counts = _counts(text, dim)
+            cells.append(buckets + i * dim)
+            weights.append(counts)
+    if not cells:
+        return np.zeros((len(docs), dim), dtype=np.float32)
+    flat = np.bincount(np.concatenate(cells), weights=np.concatenate(weights), minlength=len(docs) * dim)
+    return flat.reshape(len(docs), dim).astype(np.float32)
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class CandidateIndex:
+    """Hashed TF-IDF vectors of candidate documents, ranked against a query by cosine similarity."""
+
+    def __init__(self, names, docs, dim: int = DIM):
+        """docs: one text, or list of texts, per name."""
+        self.names = list(names)
+        self.dim = dim
+        counts = hashed_counts(docs, dim)
+        df = np.count_nonzero(counts, axis=0)
+        self.idf = (np.log((1 + len(self.names)) / (1 + df)) + 1).astype(np.float32)
+        self.matrix = self._weigh(counts)
+
+    def _weigh(self, counts: np.ndarray) -> np.ndarray:
+        return _normalize(np.log1p(counts) * self.idf)
+
+    def vectorize(self, docs) -> np.ndarray:
+        """Unit TF-IDF rows for docs, with this index's IDF."""
+        return self._weigh(hashed_counts(docs, self.dim))
+
+    def top(self, query, k: int) -> list:
+        """[(name, score)] of the k documents most similar to query (a text or list of texts), best first."""
+        scores = self.matrix @ self.vectorize([query])[0]
+        k = min(k, len(self.names))
+        if k <= 0:
+            return []
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [(self.names[i], float(scores[i])) for i in best]
+
+
+def profile_fields(obj, prefix=""):
+    """(key, text) pairs from a profile JSON, skipping contact details."""
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            if key not in _SKIP_KEYS:
+                yield from profile_fields(value, key)
+    elif isinstance(obj, list):
+        if obj and all(isinstance(v, str) for v in obj):
+            yield prefix, ", ".join(obj)
+        else:
+            for value in obj:
+                yield from profile_fields(value, prefix)
+    elif isinstance(obj, str) and obj.strip() and "@" not in obj and not obj.startswith("http"):
+        yield prefix, obj.strip()
+    elif isinstance(obj, (int, float)) and not isinstance(obj, bool):
+        yield prefix, str(obj)
+
+
+_profiles = {}  # person -> (file mtimes, (summary, full text))
+
+
+def _mtime_ns(path: Path):
+    try:
+        return path.stat().st_mtime_ns
+    except OSError:
+        return None
+
+
+def profile(person: str) -> tuple:
+    """
+    (summary, full text) of a person's profile JSON and persona prompt; empty if neither
+    exists. Cached until either file's modification time changes.
+    """
+    path = DATA_DIR / f"{person}.json"
+    persona_path = CONFIG_DIR / f"{person}_persona_prompt.txt"
+    mtimes = (_mtime_ns(path), _mtime_ns(persona_path))
+    cached = _profiles.get(person)
+    if cached is None or cached[0] != mtimes:
+        fields = []
+        if mtimes[0] is not None:
+            try:
+                fields = list(profile_fields(json.loads(path.read_text(encoding="utf-8"))))
+            except json.JSONDecodeError:
+                pass
+        summary = "; ".join(f"{k}: {v}" for k, v in fields if k)
+        if len(summary) > SUMMARY_CHARS:
+            cut = summary.rfind("; ", 0, SUMMARY_CHARS)
+            summary = summary[:cut] if cut > 0 else summary[:SUMMARY_CHARS]
+        persona = persona_path.read_text(encoding="utf-8") if mtimes[1] is not None else ""
+        cached = _profiles[person] = (mtimes, (summary, " ".join(v for _, v in fields) + "\n" + persona))
+    return cached[1]
+
+
+def shortlist(profile_user: str, records, top_k: int = TOP_K, snippets: int = SNIPPETS) -> list:
+    """
+    The top_k people profile_user should meet among those who spoke in records, best first:
+    [{"user", "person", "score", "summary", "snippets"}].
+    """
+    role_person = {role: person for person, role in agent.person_roles().items()}
+    user_role = agent.person_roles().get(profile_user, profile_user)
+    messages = {}
+    for r in records:
+        role = r.get("role")
+        if role and role != "Human" and r.get("content"):
+            messages.setdefault(role, []).append(r["content"])
+    user_messages = messages.pop(user_role, [])
+    if not messages:
+        return []
+
+    roles = list(messages)
+    persons = [role_person.get(role, role) for role in roles]
+    index = CandidateIndex(roles, [[profile(p)[1], *messages[r]] for r, p in zip(roles, persons)])
+    query = [profile(profile_user)[1], *user_messages]
+    query_vec = index.vectorize([query])[0]
+    out = []
+    for role, score in index.top(query, top_k):
+        texts = messages[role]
+        best = np.argsort(-(index.vectorize(texts) @ query_vec))[:snippets]
+        out.append({
+            "user": role,
+            "person": role_person.get(role, role),
+            "score": round(score, 3),
+            "summary": profile(role_person.get(role, role))[0],
+            "snippets": [texts[i] for i in sorted(best)],  # in conversation order
+        })
+    return out
+
+
+def format_shortlist(candidates) -> str:
+    blocks = []
+    for c in candidates:
+        lines = [f"{c['user']} (similarity {c['score']:.2f})"]
+        if c["summary"]:
+            lines.append(f"Profile: {c['summary']}")
+        lines += [f"- \"{s}\"" for s in c["snippets"]]
+        blocks.append("\n".join(lines))
+    return "\n\n".join(blocks)
@@ -0,0 +1,112 @@
+"""
+Persona credits for continuous simulation (run.py --continuous, SIM_CONTINUOUS=1).
+
+The classic game gives every persona 100 credits and ends the channel when they are all
+spent. In continuous mode each persona's credits are a token bucket instead: they refill
+at SIM_CREDIT_REFILL_PER_MINUTE up to SIM_CREDIT_CAPACITY, and speaking costs the winning
+bid but at least SIM_MIN_TURN_COST. A channel therefore settles at no more than
+  personas * refill_per_minute / min_turn_cost
+turns per minute; when nobody can afford a turn it waits for the refill rather than ending.
+
+Balances are saved per channel to <SIM_CREDITS_DIR>/<channel>.json (default: credits/
+under HISTORY_DIR or data/) after every turn. A restarted run.py or engine task resumes
+from the saved balances, refilled for the time it was down.
+"""
+import json
+import os
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DATA_DIR = REPO_ROOT / "data"
+
+CAPACITY = float(os.environ.get("SIM_CREDIT_CAPACITY", "100"))
+REFILL_PER_MINUTE = float(os.environ.get("SIM_CREDIT_REFILL_PER_MINUTE", "10"))
+MIN_TURN_COST = float(os.environ.get("SIM_MIN_TURN_COST", "10"))
+
+
+def continuous_from_env() -> bool:
+    return os.environ.get("SIM_CONTINUOUS", "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def credits_dir() -> Path:
+    configured = os.environ.get("SIM_CREDITS_DIR")
+    if configured:
+        return Path(configured)
+    return Path(os.environ.get("HISTORY_DIR", DATA_DIR)) / "credits"
+
+
+class CreditBank:
+    """Refilling, persisted credit balances for the personas of one channel."""
+
+    def __init__(self, channel: str, personas, capacity: float = CAPACITY,
+                 refill_per_minute: float = REFILL_PER_MINUTE, min_turn_cost: float = MIN_TURN_COST,
+                 path: Path = None):
+        self.channel = channel
+        self.capacity = capacity
+        self.rate = refill_per_minute / 60.0  # credits per second, per persona
+        self.min_turn_cost = min(min_turn_cost, capacity)
+        self.path = Path(path) if path is not None else credits_dir() / f"{channel}.json"
+        self.balances = {p: capacity for p in personas}
+        self.updated_at = time.time()
+        self._load()
+
+    def _load(self) -> None:
+        """Saved balances for personas we still have; new personas start full."""
+        try:
+            saved = json.loads(self.path.read_text(encoding="utf-8"))
+            for person, balance in saved.get("credits", {}).items():
+                if person in self.balances:
+                    self.balances[person] = min(self.capacity, max(0.0, float(balance)))
+            self.updated_at = min(time.time(), float(saved.get("updated_at", self.updated_at)))
+        except (OSError, ValueError, TypeError, AttributeError):
+            pass  # missing or unreadable: start everyone full
+        self._refill()
+
+    def save(self) -> None:
+        """Write balances atomically (a crash leaves the previous file, never a torn one)."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(json.dumps({
+            "updated_at": self.updated_at,
+            "credits": {p: round(b, 3) for p, b in self.balances.items()},
+        }), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    def _refill(self) -> None:
+        now = time.time()
+        elapsed = max(0.0, now - self.updated_at)
+        for person, balance in self.balances.items():
+            self.balances[person] = min(self.capacity, balance + elapsed * self.rate)
+        self.updated_at = now
+
+    def credits(self) -> dict:
+        """Whole credits per persona, as the bidding prompt shows them."""
+        self._refill()
+        return {p: int(b) for p, b in self.balances.items()}
+
+    def biddable(self) -> dict:
+        """credits(), with personas who cannot afford a turn at 0 (bidding skips them)."""
+        return {p: c if c >= self.min_turn_cost else 0 for p, c in self.credits().items()}
+
+    def spend(self, person: str, bid: int) -> int:
+        """Charge person for speaking (the bid, at least min_turn_cost), save, and return the charge."""
+        self._refill()
+        charge = min(self.balances[person], max(float(bid), self.min_turn_cost))
+        self.balances[person] -= charge
+        self.save()
+        return int(round(charge))
+
+    def seconds_until_biddable(self) -> float:
+        """How long until the richest persona can afford a turn (0 if someone already can)."""
+        self._refill()
+        if self.rate <= 0:
+            return float("inf")
+        short = self.min_turn_cost - max(self.balances.values(), default=0.0)
+        return max(0.0, short / self.rate)
+
+    def turn_interval(self) -> float:
+        """Seconds between turns at the sustained rate (all personas' refill spent on minimum turns)."""
+        if self.rate <= 0 or not self.balances:
+            return float("inf")
+        return self.min_turn_cost / (self.rate * len(self.balances))
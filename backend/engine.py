@@ -0,0 +1,219 @@
+"""
+In-process simulation engine: any number of channel simulations as asyncio tasks.
+
+Instead of one run.py process per channel (each importing anthropic/groq/dotenv and
+building its own clients), every channel runs run.py's bidding loop as a task on one
+event loop, sharing utils' async client pool and the history writer. LLM calls are
+bounded by:
+  SIM_CHANNEL_CONCURRENCY  calls in flight per channel (default 4: one round's bids)
+  SIM_MAX_INFLIGHT         calls in flight across all channels (default 32)
+  SIM_CALLS_PER_SECOND     global call rate, as a token bucket (default 0 = unlimited)
+With SIM_CONTINUOUS=1 channels run forever on refilling, persisted credits (credits.py).
+
+The server uses it with SIMULATION_MODE=engine. Standalone:
+  python backend/engine.py --channels world finance technology
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+from contextlib import asynccontextmanager
+
+import agent
+import bidding
+import credits
+import utils
+from history_store import get_store
+from rate_limit import AsyncTokenBucket
+
+CHANNEL_CONCURRENCY = int(os.environ.get("SIM_CHANNEL_CONCURRENCY", "4"))
+MAX_INFLIGHT = int(os.environ.get("SIM_MAX_INFLIGHT", "32"))
+CALLS_PER_SECOND = float(os.environ.get("SIM_CALLS_PER_SECOND", "0"))
+INITIAL_CREDITS = 100
+
+
+class ChannelSimulation:
+    """run.py's loop for one channel: bid, pick a speaker, reply, until credits run out."""
+
+    def __init__(self, engine: "SimulationEngine", channel: str):
+        self.engine = engine
+        self.channel = channel
+        self.state = "starting"  # running, finished, failed, stopped
+        self.rounds = 0
+        self.turns = 0
+        self.started_at = None
+        self.last_error = None
+        self.credits = {}
+        self.bank = None
+        self.task = None
+        self._stop_requested = False
+        self._semaphore = asyncio.Semaphore(engine.channel_concurrency)
+
+    def request_stop(self) -> None:
+        """Finish the current turn, then end (the graceful counterpart of cancelling the task)."""
+        self._stop_requested = True
+
+    @asynccontextmanager
+    async def slot(self):
+        """Held around each LLM-backed step (a bid or a reply): channel limit, then the engine's."""
+        async with self._semaphore:
+            async with self.engine.slot():
+                yield
+
+    async def run(self) -> None:
+        self.started_at = time.time()
+        try:
+            store = get_store()
+            await asyncio.to_thread(store.ensure_seed, self.channel)
+            person_roles = agent.person_roles()
+            role_person = {v: k for k, v in person_roles.items()}
+            last = await asyncio.to_thread(store.last_record, self.channel)
+            init_person = role_person.get((last or {}).get("role")) or next(iter(person_roles))
+            if self.engine.continuous:
+                self.bank = await asyncio.to_thread(credits.CreditBank, self.channel, person_roles)
+                self.credits = self.bank.credits()
+            else:
+                self.credits = {p: INITIAL_CREDITS for p in person_roles}
+            self.state = "running"
+
+            while not self._stop_requested and (self.bank is not None or any(c > 0 for c in self.credits.values())):
+                if self.bank is not None:
+                    self.credits = self.bank.biddable()
+                    if not any(self.credits.values()):
+                        await self._pause(self.bank.seconds_until_biddable())
+                        continue
+                bids = await bidding.collect_bids_async(
+                    list(person_roles), self.credits,
+                    timeout=self.engine.bid_timeout, channel=self.channel, slot=self.slot,
+                    last_person=init_person,
+                )
+                self.rounds += 1
+                if all(v == 0 for v in bids.values()):
+                    if self.bank is None:
+                        break
+                    await self._pause(self.bank.turn_interval())
+                    continue
+                choice = bidding.select_speaker(bids, init_person)
+                if choice is None:
+                    continue
+                person, bid = choice
+                if self.bank is not None:
+                    await asyncio.to_thread(self.bank.spend, person, bid)
+                    self.credits = self.bank.credits()
+                else:
+                    self.credits[person] = max(0, self.credits[person] - bid)
+                async with self.slot():
+                    await agent.get_agent(person).speak_async(self.channel)
+                self.turns += 1
+                init_person = person
+            self.state = "stopped" if self._stop_requested else "finished"
+        except asyncio.CancelledError:
+            self.state = "stopped"
+            raise
+        except Exception as e:
+            self.state = "failed"
+            self.last_error = f"{type(e).__name__}: {e}"
+            print(f"[engine channel={self.channel}] failed: {self.last_error}", file=sys.stderr, flush=True)
+
+    async def _pause(self, seconds: float) -> None:
+        """Wait for credits to refill, in short steps so request_stop() still ends us promptly."""
+        deadline = time.monotonic() + seconds
+        while not self._stop_requested and time.monotonic() < deadline:
+            await asyncio.sleep(min(1.0, deadline - time.monotonic()))
+
+    def status(self) -> dict:
+        return {
+            "state": self.state,
+            "rounds": self.rounds,
+            "turns": self.turns,
+            "uptime_seconds": round(time.time() - self.started_at, 1) if self.started_at else None,
+            "credits": self.credits,
+            "last_error": self.last_error,
+        }
+
+
+class SimulationEngine:
+    """Runs ChannelSimulations on the current event loop under shared call limits."""
+
+    def __init__(self, channel_concurrency: int = CHANNEL_CONCURRENCY, max_inflight: int = MAX_INFLIGHT,
+                 calls_per_second: float = CALLS_PER_SECOND, bid_timeout: float = bidding.BID_TIMEOUT_SECONDS,
+                 continuous: bool = None):
+        self.channel_concurrency = channel_concurrency
+        self.continuous = credits.continuous_from_env() if continuous is None else continuous
+        self.max_inflight = max_inflight
+        self.bid_timeout = bid_timeout
+        self.channels: dict = {}
+        self.inflight = 0
+        self.calls = 0
+        self._inflight = asyncio.Semaphore(max_inflight)
+        self._bucket = AsyncTokenBucket(calls_per_second) if calls_per_second > 0 else None
+
+    @asynccontextmanager
+    async def slot(self):
+        async with self._inflight:
+            if self._bucket is not None:
+                await self._bucket.acquire()
+            self.inflight += 1
+            self.calls += 1
+            try:
+                yield
+            finally:
+                self.inflight -= 1
+
+    def start_channel(self, channel: str) -> ChannelSimulation:
+        """Start (or return the already running) simulation for channel."""
+        sim = self.channels.get(channel)
+        if sim is not None and sim.task is not None and not sim.task.done():
+            return sim
+        sim = ChannelSimulation(self, channel)
+        sim.task = asyncio.create_task(sim.run(), name=f"sim-{channel}")
+        self.channels[channel] = sim
+        return sim
+
+    async def wait(self) -> None:
+        """Until every channel has finished (or failed)."""
+        await asyncio.gather(*(s.task for s in self.channels.values() if s.task), return_exceptions=True)
+
+    async def stop(self) -> None:
+        """Cancel all channels; an in-flight reply is abandoned, not written."""
+        tasks = [s.task for s in self.channels.values() if s.task is not None and not s.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def status(self) -> dict:
+        return {
+            "channels": {ch: s.status() for ch, s in self.channels.items()},
+            "llm_slots_in_use": self.inflight,
+            "llm_slots_max": self.max_inflight,
+            "llm_slot_acquisitions": self.calls,
+            "rate_limited_waits": self._bucket.waits if self._bucket else 0,
+        }
+
+
+async def _main(channels, continuous: bool = None) -> None:
+    engine = SimulationEngine(continuous=continuous)
+    for ch in channels:
+        engine.start_channel(ch)
+    print(f"[engine] running {len(channels)} channels", file=sys.stderr, flush=True)
+    try:
+        await engine.wait()
+    finally:
+        await engine.stop()
+        print(f"[engine] {json.dumps(engine.status())}", file=sys.stderr, flush=True)
+        print(f"[engine] LLM metrics: {json.dumps(utils.llm_metrics())}", file=sys.stderr, flush=True)
+
+
+def main():
+    import argparse
+    from history_store import CHANNEL_FILES
+    parser = argparse.ArgumentParser(description="Run several channel simulations in one process")
+    parser.add_argument("--channels", nargs="+", default=[c for c in CHANNEL_FILES if c != "human"], help="Channels to simulate")
+    parser.add_argument("--continuous", action="store_true", default=None, help="Refill credits and never end (default: SIM_CONTINUOUS)")
+    args = parser.parse_args()
+    asyncio.run(_main(args.channels, args.continuous))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Change notification for history files.
+
+On Linux, InotifyWatcher uses inotify (through ctypes, no extra dependency) on the
+file's directory, so a line appended by run.py wakes the watcher within milliseconds
+and an idle channel costs no wakeups at all. Elsewhere (or if inotify is unavailable)
+PollingWatcher stats the file with adaptive backoff: fast right after a change,
+slowing down to max_interval while the channel is quiet.
+
+Both expose `await watcher.wait()`, which returns when the file may have changed.
+"""
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import struct
+import sys
+from pathlib import Path
+
+# inotify event bits (see <sys/inotify.h>)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+_EVENT_HEADER = struct.Struct("iIII")
+
+_libc = None
+
+
+def _get_libc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+    return _libc
+
+
+class PollingWatcher:
+    """Stat-based fallback: poll every min_interval after a change, backing off to max_interval when idle."""
+
+    def __init__(self, path: Path, min_interval: float = 0.05, max_interval: float = 2.0):
+        self.path = Path(path)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self._interval = min_interval
+        self._last = self._signature()
+
+    def _signature(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_ino, st.st_size, st.st_mtime_ns)
+        except FileNotFoundError:
+            return None
+
+    async def wait(self) -> None:
+        while True:
+            await asyncio.sleep(self._interval)
+            sig = self._signature()
+            if sig != self._last:
+                self._last = sig
+                self._interval = self.min_interval
+                return
+            self._interval = min(self._interval * 2, self.max_interval)
+
+    def close(self) -> None:
+        pass
+
+
+class InotifyWatcher:
+    """inotify on the parent directory, filtered to one file name (so rotation is seen too)."""
+
+    # Re-check even without events, in case one was missed (e.g. directory replaced)
+    SAFETY_TIMEOUT = 30.0
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        libc = _get_libc()
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        wd = libc.inotify_add_watch(self._fd, os.fsencode(str(self.path.parent)), _WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(err, f"inotify_add_watch failed for {self.path.parent}")
+        self._name = os.fsencode(self.path.name)
+        self._changed = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self._loop.add_reader(self._fd, self._on_readable)
+
+    def _on_readable(self) -> None:
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            _wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + _EVENT_HEADER.size: offset + _EVENT_HEADER.size + length].rstrip(b"\0")
+            offset += _EVENT_HEADER.size + length
+            if name == self._name or mask & IN_Q_OVERFLOW:
+                self._changed.set()
+
+    async def wait(self) -> None:
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout=self.SAFETY_TIMEOUT)
+        except asyncio.TimeoutError:
+            pass
+        self._changed.clear()
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            self._loop.remove_reader(self._fd)
+            os.close(self._fd)
+            self._fd = -1
+
+
+def watch_file(path: Path):
+    """Best available watcher for path. Must be called from a running event loop."""
+    if sys.platform.startswith("linux") and os.environ.get("HISTORY_WATCH", "inotify") != "poll":
+        try:
+            return InotifyWatcher(path)
+        except (OSError, AttributeError) as e:
+            print(f"inotify unavailable for {path} ({e}); falling back to polling", file=sys.stderr)
+    return PollingWatcher(path)
@@ -0,0 +1,345 @@
+"""
+Shared helpers for reading channel history files (one JSON object per line).
+
+Readers only ever need the last few turns, so tail_lines() seeks backward from EOF
+in fixed-size blocks instead of reading the whole file: the cost depends on how many
+lines are requested, not on how old the channel is.
+
+Every record carries a monotonically increasing "seq". write_records() stamps it, called
+under locked_append() from history_segments.SegmentedLog.append; older lines written
+without one are numbered implicitly as previous seq + 1, so the numbering is the same
+whether it is read back from a stamped or a legacy file.
+"""
+import bisect
+import json
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are not locked
+    fcntl = None
+
+BLOCK_SIZE = 8192
+
+
+def _iter_lines_backward(f, block_size: int = BLOCK_SIZE):
+    """Yield the non-empty lines of an open binary file as bytes, last line first."""
+    pos = f.seek(0, os.SEEK_END)
+    head = b""  # bytes before the first newline seen so far (possibly a partial line)
+    while pos > 0:
+        step = min(block_size, pos)
+        pos -= step
+        f.seek(pos)
+        parts = (f.read(step) + head).split(b"\n")
+        head = parts[0]
+        for ln in reversed(parts[1:]):
+            if ln.strip():
+                yield ln
+    if head.strip():
+        yield head
+
+
+def tail_lines(path: Path, n: int, block_size: int = BLOCK_SIZE) -> list:
+    """Return the last n non-empty lines of path (stripped, oldest first)."""
+    if n <= 0:
+        return []
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return []
+    lines = []
+    with f:
+        for ln in _iter_lines_backward(f, block_size):
+            lines.append(ln)
+            if len(lines) >= n:
+                break
+    return [ln.decode("utf-8", errors="replace").strip() for ln in reversed(lines)]
+
+
+def _parse(line: bytes):
+    """Parse one history line; None for blank, torn or non-object lines."""
+    if not line.strip():
+        return None
+    try:
+        entry = json.loads(line)
+    except json.JSONDecodeError:
+        return None
+    return entry if isinstance(entry, dict) else None
+
+
+def tail_records(path: Path, n: int) -> list:
+    """Return the last n valid JSON records of path, oldest first. Invalid lines are skipped."""
+    out = []
+    for line in tail_lines(path, n):
+        entry = _parse(line.encode("utf-8"))
+        if entry is not None:
+            out.append(entry)
+    return out
+
+
+def last_record(path: Path):
+    """Return the last record of path, or None if the file is missing, empty or its last line is invalid."""
+    records = tail_records(path, 1)
+    return records[0] if records else None
+
+
+def _last_seq_in(f) -> int:
+    """Seq of the last valid record: walk back to the newest stamped record and count forward from it."""
+    unstamped = 0
+    for line in _iter_lines_backward(f):
+        entry = _parse(line)
+        if entry is None:
+            continue
+        if isinstance(entry.get("seq"), int):
+            return entry["seq"] + unstamped
+        unstamped += 1
+    return unstamped
+
+
+def last_seq(path: Path) -> int:
+    """Seq of the last record in path (0 if there is none)."""
+    try:
+        with open(path, "rb") as f:
+            return _last_seq_in(f)
+    except FileNotFoundError:
+        return 0
+
+
+def _write_all(fd: int, data: bytes) -> None:
+    """os.write until all of data is written (a regular-file write is rarely short, but may be)."""
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+@contextmanager
+def locked_append(path: Path):
+    """
+    Open path for appending (unbuffered) under an exclusive flock. If the file was
+    replaced while waiting for the lock (segment rotation), retry on the new file, so
+    nothing is ever appended to a sealed one.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    while True:
+        f = open(path, "ab+", buffering=0)
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            current = os.fstat(f.fileno()).st_ino == os.stat(path).st_ino
+        except FileNotFoundError:
+            current = False
+        if current:
+            break
+        f.close()  # also releases the lock
+    try:
+        yield f
+    finally:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_UN)
+        f.close()
+
+
+def write_records(f, records, fsync: bool = False, seq_base: int = 0) -> list:
+    """
+    Stamp records with the seqs following the last one in f (or seq_base if f has none)
+    and append them in a single unbuffered write, so readers never see half of it unless
+    the write is short. f must come from locked_append. With fsync=True the data is on
+    disk before this returns. Returns the records as written.
+    """
+    seq = _last_seq_in(f) or seq_base
+    written = []
+    for record in records:
+        seq += 1
+        written.append(dict(record, seq=seq))
+    _write_all(f.fileno(), "".join(json.dumps(entry) + "\n" for entry in written).encode("utf-8"))
+    if fsync:
+        os.fsync(f.fileno())
+    return written
+
+
+class HistoryTailer:
+    """
+    Follows one history file by byte offset: each read_new() returns only the records
+    appended since the previous call. A trailing line without its newline is held back
+    until the writer finishes it. If the file shrinks or is replaced (new inode), the
+    tailer starts over from the beginning of the new file.
+    """
+
+    def __init__(self, path: Path, from_end: bool = True):
+        self.path = Path(path)
+        self.offset = 0
+        self._partial = b""
+        self._inode = None
+        if from_end:
+            try:
+                st = os.stat(self.path)
+                self.offset = st.st_size
+                self._inode = st.st_ino
+            except FileNotFoundError:
+                pass
+
+    @property
+    def watch_path(self) -> Path:
+        """File whose changes mean new records (for file_watch)."""
+        return self.path
+
+    def _reset(self, inode):
+        self.offset = 0
+        self._partial = b""
+        self._inode = inode
+
+    def _read_new_lines(self) -> list:
+        """Return (byte offset, line) for each complete line appended since the last call."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            # Deleted or mid-rotation: whatever appears next is a new file
+            self._reset(None)
+            return []
+        if st.st_ino != self._inode or st.st_size < self.offset:
+            self._reset(st.st_ino)
+        if st.st_size == self.offset:
+            return []
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            chunk = f.read(st.st_size - self.offset)
+        start = self.offset - len(self._partial)
+        self.offset += len(chunk)
+        lines = (self._partial + chunk).split(b"\n")
+        self._partial = lines.pop()
+        out = []
+        for line in lines:
+            out.append((start, line))
+            start += len(line) + 1
+        return out
+
+    def read_new(self) -> list:
+        """Return records appended since the last call (oldest first)."""
+        out = []
+        for _, line in self._read_new_lines():
+            entry = _parse(line)
+            if entry is not None:
+                out.append(entry)
+        return out
+
+
+class HistoryIndex(HistoryTailer):
+    """
+    A tailer that also remembers the byte offset of every record by seq, so records
+    after a given seq (e.g. an SSE Last-Event-ID) can be read without scanning the file.
+    The first refresh() indexes the existing file; later ones only read appended bytes.
+    """
+
+    def __init__(self, path: Path):
+        super().__init__(path, from_end=False)
+        self._seqs = []
+        self._offsets = []
+        self._end = 0  # byte offset just past the last indexed line
+        self._lock = threading.Lock()
+
+    def _reset(self, inode):
+        super()._reset(inode)
+        self._seqs = []
+        self._offsets = []
+        self._end = 0
+
+    @property
+    def last_seq(self) -> int:
+        return self._seqs[-1] if self._seqs else 0
+
+    def refresh(self) -> list:
+        """Index newly appended lines; return their records with "seq" filled in."""
+        with self._lock:
+            out = []
+            for offset, line in self._read_new_lines():
+                self._end = offset + len(line) + 1
+                entry = _parse(line)
+                if entry is None:
+                    continue
+                if not isinstance(entry.get("seq"), int):
+                    entry["seq"] = self.last_seq + 1
+                self._seqs.append(entry["seq"])
+                self._offsets.append(offset)
+                out.append(entry)
+            return out
+
+    def read_after(self, after_seq: int, limit: int = None) -> list:
+        """Indexed records with seq > after_seq (oldest first, at most limit). Reads only those bytes."""
+        with self._lock:
+            i = bisect.bisect_right(self._seqs, after_seq)
+            seqs = self._seqs[i:i + limit] if limit else self._seqs[i:]
+            if not seqs:
+                return []
+            start = self._offsets[i]
+            j = i + len(seqs)
+            end = self._offsets[j] if j < len(self._offsets) else self._end
+            inode = self._inode
+        try:
+            with open(self.path, "rb") as f:
+                if os.fstat(f.fileno()).st_ino != inode:
+                    return []  # replaced (rotated) since it was indexed; the offsets are stale
+                f.seek(start)
+                chunk = f.read(end - start)
+        except FileNotFoundError:
+            return []
+        out = []
+        for line in chunk.split(b"\n"):
+            entry = _parse(line)
+            if entry is None:
+                continue
+            entry["seq"] = seqs[len(out)]
+            out.append(entry)
+            if len(out) == len(seqs):
+                break
+        return out
+
+
+class RecordCache(HistoryIndex):
+    """
+    All parsed records of one history file, kept in memory for paging. sync() re-reads
+    only when the file's (inode, size, mtime) changed, and then only the appended bytes.
+    """
+
+    def __init__(self, path: Path):
+        super().__init__(path)
+        self.records = []
+        self.signature = None
+        self._sync_lock = threading.Lock()
+
+    def _reset(self, inode):
+        super()._reset(inode)
+        self.records = []
+
+    def sync(self):
+        """Bring the cache up to date; return the file signature (None if the file is missing)."""
+        with self._sync_lock:
+            try:
+                st = os.stat(self.path)
+                sig = (st.st_ino, st.st_size, st.st_mtime_ns)
+            except FileNotFoundError:
+                sig = None
+            if sig != self.signature:
+                new = self.refresh()
+                self.records.extend(new)
+                self.signature = sig
+            return sig
+
+    def page(self, limit: int, before: int = None, after: int = None):
+        """
+        One page of records, oldest first: the first `limit` after `after`, else the last
+        `limit` before `before` (or the latest `limit`). Returns (records, has_older, has_newer).
+        """
+        with self._sync_lock:
+            records = self.records
+            seqs = self._seqs
+            if after is not None:
+                lo = bisect.bisect_right(seqs, after)
+                hi = min(len(records), lo + limit)
+            else:
+                hi = bisect.bisect_left(seqs, before) if before is not None else len(records)
+                lo = max(0, hi - limit)
+            return records[lo:hi], lo > 0, hi < len(records)
@@ -0,0 +1,383 @@
+"""
+Segmented JSONL channel history: the active file plus sealed, immutable segments.
+
+  data/<channel file>                         active segment; every append goes here
+  data/segments/<stem>/manifest.json          sealed segments, in seq order
+  data/segments/<stem>/<stem>.<first>-<last>.jsonl[.gz|.zst]
+
+When the active file grows past HISTORY_SEGMENT_BYTES (default 8 MiB), or has been
+active for more than HISTORY_SEGMENT_MAX_AGE hours (default 0 = never), the appender
+that notices seals it while still holding the file lock: its records are written
+(with seq) to a new segment, compressed if HISTORY_SEGMENT_COMPRESSION is gzip or zstd,
+the manifest is updated, and an empty file replaces the active one. Seqs continue
+across segments.
+
+Reads of recent turns only touch the active file; anything older is found through
+the manifest. compact() merges small sealed segments and (re)compresses them.
+"""
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+import history
+
+try:
+    import fcntl
+except ImportError:  # Windows: manifest updates are not locked
+    fcntl = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+SEGMENT_BYTES = int(os.environ.get("HISTORY_SEGMENT_BYTES", str(8 * 1024 * 1024)))
+SEGMENT_MAX_AGE_HOURS = float(os.environ.get("HISTORY_SEGMENT_MAX_AGE", "0"))
+COMPRESSION = os.environ.get("HISTORY_SEGMENT_COMPRESSION", "none").strip().lower()
+# Decompressed sealed segments kept in memory per log
+SEGMENT_CACHE_SIZE = 4
+
+_SUFFIXES = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+
+
+def _check_compression(compression: str) -> str:
+    if compression not in _SUFFIXES:
+        raise ValueError(f"Unknown segment compression {compression!r} (expected none, gzip or zstd)")
+    if compression == "zstd" and zstandard is None:
+        print("zstandard is not installed (pip install zstandard); compressing segments with gzip", file=sys.stderr)
+        return "gzip"
+    return compression
+
+
+def _compress(data: bytes, compression: str) -> bytes:
+    if compression == "gzip":
+        return gzip.compress(data, compresslevel=6)
+    if compression == "zstd":
+        return zstandard.ZstdCompressor(level=9).compress(data)
+    return data
+
+
+def _decompress(data: bytes, name: str) -> bytes:
+    if name.endswith(".gz"):
+        return gzip.decompress(data)
+    if name.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError(f"{name} is zstd-compressed; pip install zstandard to read it")
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return data
+
+
+def _atomic_write(path: Path, data: bytes) -> None:
+    """Write path via a temporary file + rename, synced, so readers see all of it or none."""
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _parse_lines(data: bytes, seq_base: int) -> list:
+    """Records of a JSONL blob; lines written before seqs existed are numbered previous + 1."""
+    out = []
+    last = seq_base
+    for line in data.split(b"\n"):
+        entry = history._parse(line)
+        if entry is None:
+            continue
+        if not isinstance(entry.get("seq"), int):
+            entry["seq"] = last + 1
+        last = entry["seq"]
+        out.append(entry)
+    return out
+
+
+class SegmentedLog:
+    """One channel's history: the active JSONL file at path plus its sealed segments."""
+
+    def __init__(self, path: Path, segment_bytes: int = SEGMENT_BYTES,
+                 max_age_hours: float = SEGMENT_MAX_AGE_HOURS, compression: str = COMPRESSION):
+        self.path = Path(path)
+        self.dir = self.path.parent / "segments" / self.path.stem
+        self.manifest_path = self.dir / "manifest.json"
+        self.segment_bytes = segment_bytes
+        self.max_age = max_age_hours * 3600
+        self.compression = _check_compression(compression)
+        self._manifest = {"segments": []}
+        self._manifest_sig = None
+        self._segment_cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Manifest
+
+    def manifest(self) -> dict:
+        """The manifest, re-read only when the file changed."""
+        try:
+            st = os.stat(self.manifest_path)
+            sig = (st.st_ino, st.st_size, st.st_mtime_ns)
+        except FileNotFoundError:
+            sig = None
+        with self._lock:
+            if sig != self._manifest_sig:
+                if sig is None:
+                    self._manifest = {"segments": []}
+                else:
+                    with open(self.manifest_path, "r", encoding="utf-8") as f:
+                        self._manifest = json.load(f)
+                self._manifest_sig = sig
+            return self._manifest
+
+    @contextmanager
+    def _manifest_locked(self):
+        """Exclusive lock for read-modify-write of the manifest (rotation, compaction)."""
+        self.dir.mkdir(parents=True, exist_ok=True)
+        with open(self.dir / ".lock", "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self._manifest_sig = None  # another process may have changed it
+                yield dict(self.manifest())
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _write_manifest(self, manifest: dict) -> None:
+        _atomic_write(self.manifest_path, json.dumps(manifest, indent=1).encode("utf-8"))
+        self._manifest_sig = None
+
+    def segments(self) -> list:
+        return self.manifest()["segments"]
+
+    def sealed_seq(self) -> int:
+        """Seq of the last sealed record (0 if nothing has been sealed)."""
+        segments = self.segments()
+        return segments[-1]["last_seq"] if segments else 0
+
+    # Reads
+
+    def _read_segment(self, seg: dict) -> list:
+        name = seg["file"]
+        with self._lock:
+            records = self._segment_cache.get(name)
+            if records is not None:
+                self._segment_cache.move_to_end(name)
+                return records
+        data = _decompress((self.dir / name).read_bytes(), name)
+        records = _parse_lines(data, seg["first_seq"] - 1)
+        with self._lock:
+            self._segment_cache[name] = records
+            while len(self._segment_cache) > SEGMENT_CACHE_SIZE:
+                self._segment_cache.popitem(last=False)
+        return records
+
+    def read_sealed(self, after: int = None, before: int = None, limit: int = None) -> list:
+        """
+        Sealed records, oldest first: the first `limit` with seq > after, else the last
+        `limit` with seq < before (or the last `limit` overall). Only opens the segments needed.
+        """
+        for attempt in range(2):
+            try:
+                return self._read_sealed(after, before, limit)
+            except FileNotFoundError:
+                if attempt:
+                    raise
+                self._manifest_sig = None  # compacted meanwhile: reload the manifest and retry
+
+    def _read_sealed(self, after, before, limit) -> list:
+        segments = self.segments()
+        out = []
+        if after is not None:
+            for seg in segments:
+                if seg["last_seq"] <= after:
+                    continue
+                out.extend(r for r in self._read_segment(seg) if r["seq"] > after)
+                if limit and len(out) >= limit:
+                    return out[:limit]
+            return out
+        for seg in reversed(segments):
+            if before is not None and seg["first_seq"] >= before:
+                continue
+            records = self._read_segment(seg)
+            if before is not None:
+                records = [r for r in records if r["seq"] < before]
+            out[:0] = records
+            if limit and len(out) >= limit:
+                return out[-limit:]
+        return out
+
+    def _read_active(self) -> list:
+        """All records of the active file not already sealed (seqs filled in)."""
+        sealed = self.sealed_seq()
+        try:
+            data = self.path.read_bytes()
+        except FileNotFoundError:
+            return []
+        return [r for r in _parse_lines(data, sealed) if r["seq"] > sealed]
+
+    def read_after(self, after_seq: int, limit: int = None) -> list:
+        """Records with seq > after_seq across sealed segments and the active file."""
+        out = self.read_sealed(after=after_seq, limit=limit) if after_seq < self.sealed_seq() else []
+        if limit is None or len(out) < limit:
+            active = [r for r in self._read_active() if r["seq"] > after_seq]
+            out.extend(active[:limit - len(out)] if limit else active)
+        return out
+
+    def last_seq(self) -> int:
+        """Seq of the newest record, sealed or active."""
+        return max(history.last_seq(self.path), self.sealed_seq())
+
+    def tail(self, n: int) -> list:
+        """Last n records, oldest first; sealed segments are only read if the active file has fewer than n."""
+        if n <= 0:
+            return []
+        sealed = self.sealed_seq()
+        # Lines from before seqs existed only occur while nothing is sealed
+        records = [r for r in history.tail_records(self.path, n) if r.get("seq", sealed + 1) > sealed]
+        if len(records) < n and sealed:
+            records[:0] = self.read_sealed(limit=n - len(records))
+        return records
+
+    # Writes
+
+    def append(self, records, fsync: bool = False) -> list:
+        """Append records (see history.write_records), sealing the active file if it is due."""
+        with history.locked_append(self.path) as f:
+            written = history.write_records(f, records, fsync, seq_base=self.sealed_seq())
+            if self._rotation_due(f):
+                self._seal(f)
+        return written
+
+    def _rotation_due(self, f) -> bool:
+        if self.segment_bytes and os.fstat(f.fileno()).st_size >= self.segment_bytes:
+            return True
+        if self.max_age:
+            since = self.manifest().get("active_since")
+            if since is None:
+                # Start the clock on the first append after age-based rotation is enabled
+                with self._manifest_locked() as manifest:
+                    manifest.setdefault("active_since", time.time())
+                    self._write_manifest(manifest)
+                return False
+            return time.time() - since >= self.max_age
+        return False
+
+    def rotate(self) -> dict:
+        """Seal the active file now (if it has unsealed records). Returns the new segment entry or None."""
+        with history.locked_append(self.path) as f:
+            return self._seal(f)
+
+    def _seal(self, f) -> dict:
+        """Called with the active file locked: move its records into a new sealed segment."""
+        with self._manifest_locked() as manifest:
+            sealed = manifest["segments"][-1]["last_seq"] if manifest["segments"] else 0
+            f.seek(0)
+            records = [r for r in _parse_lines(f.read(), sealed) if r["seq"] > sealed]
+            entry = None
+            if records:
+                entry = self._write_segment(records, self.compression)
+                manifest["segments"] = manifest["segments"] + [entry]
+            manifest["active_since"] = time.time()
+            # Manifest first: a crash before the swap below leaves records in both places,
+            # and readers skip active records with seq <= the last sealed seq.
+            self._write_manifest(manifest)
+            if records:
+                empty = self.path.with_name(self.path.name + ".rotating")
+                open(empty, "wb").close()
+                os.replace(empty, self.path)
+            return entry
+
+    def _write_segment(self, records: list, compression: str) -> dict:
+        first, last = records[0]["seq"], records[-1]["seq"]
+        raw = "".join(json.dumps(r) + "\n" for r in records).encode("utf-8")
+        data = _compress(raw, compression)
+        name = f"{self.path.stem}.{first:010d}-{last:010d}.jsonl{_SUFFIXES[compression]}"
+        _atomic_write(self.dir / name, data)
+        return {
+            "file": name,
+            "first_seq": first,
+            "last_seq": last,
+            "records": len(records),
+            "bytes": len(data),
+            "raw_bytes": len(raw),
+            "compression": compression,
+            "sealed_at": time.time(),
+        }
+
+    def compact(self, compression: str = None, target_bytes: int = None) -> dict:
+        """
+        Merge runs of adjacent sealed segments up to target_bytes (uncompressed; default
+        segment_bytes) and rewrite them with compression (default the log's setting).
+        Returns {"before": n_segments, "after": n_segments}.
+        """
+        compression = _check_compression(compression or self.compression)
+        target_bytes = target_bytes or self.segment_bytes
+        with self._manifest_locked() as manifest:
+            old = manifest["segments"]
+            groups = []
+            for seg in old:
+                if groups and sum(s["raw_bytes"] for s in groups[-1]) + seg["raw_bytes"] <= target_bytes:
+                    groups[-1].append(seg)
+                else:
+                    groups.append([seg])
+            new = []
+            for group in groups:
+                if len(group) == 1 and group[0]["compression"] == compression:
+                    new.append(group[0])
+                    continue
+                records = [r for seg in group for r in self._read_segment(seg)]
+                new.append(self._write_segment(records, compression))
+            manifest["segments"] = new
+            self._write_manifest(manifest)
+        kept = {seg["file"] for seg in new}
+        for seg in old:
+            if seg["file"] not in kept:
+                try:
+                    os.remove(self.dir / seg["file"])
+                except FileNotFoundError:
+                    pass
+        return {"before": len(old), "after": len(new)}
+
+
+class SegmentFollower:
+    """
+    history_store follower over a SegmentedLog: new records come from the active file's
+    HistoryIndex; records sealed away before the index read them, and replays older
+    than the active file, come from the sealed segments.
+    """
+
+    def __init__(self, log: SegmentedLog):
+        self.log = log
+        self.index = history.HistoryIndex(log.path)
+        self.last_seq = 0
+        self.watch_path = log.path
+        self._positioned = False
+
+    def refresh(self) -> list:
+        new = self.index.refresh()
+        sealed = self.log.sealed_seq()  # after the index: a rotation it saw is already in the manifest
+        if not self._positioned:
+            # The first call indexes what exists and positions the feed at its end
+            self._positioned = True
+            self.last_seq = max(self.index.last_seq, sealed)
+            return []
+        out = self.log.read_sealed(after=self.last_seq) if sealed > self.last_seq else []
+        last = out[-1]["seq"] if out else self.last_seq
+        for entry in new:
+            if entry["seq"] > last:
+                out.append(entry)
+                last = entry["seq"]
+        self.last_seq = last
+        return out
+
+    def read_after(self, after_seq: int, limit: int = None) -> list:
+        sealed = self.log.sealed_seq()
+        out = self.log.read_sealed(after=after_seq, limit=limit) if after_seq < sealed else []
+        if limit is None or len(out) < limit:
+            out.extend(self.index.read_after(max(after_seq, sealed), limit - len(out) if limit else None))
+        return out
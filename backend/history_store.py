@@ -0,0 +1,414 @@
+"""
+Pluggable storage for channel conversation history.
+
+Everything that reads or writes history (server, run.py, agents, bidding, recommendations)
+goes through get_store(), chosen by the HISTORY_BACKEND environment variable:
+
+  jsonl   (default) one *_convers_history.txt file per channel under data/ (or HISTORY_DIR; see history.py),
+          rotated into sealed, optionally compressed segments (see history_segments.py)
+  sqlite  one SQLite database in WAL mode (data/history.db, or HISTORY_DB), with
+          (channel, seq) as the primary key; appends are transactions and range reads
+          are index lookups, so concurrent writers and readers no longer race.
+
+Records are dicts with role, content and seq (plus timestamp when known); tail() on an
+old JSONL file may return lines written before seqs existed, without one.
+
+Import the existing text files into SQLite once with:
+  python backend/history_store.py import
+Seal or compact JSONL segments by hand with the rotate / compact subcommands.
+"""
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+from pathlib import Path
+
+import history
+from history_segments import SegmentFollower, SegmentedLog
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DATA_DIR = REPO_ROOT / "data"
+BACKUP_DIR = REPO_ROOT / "backup_previous"
+
+# Channel -> history filename (under data/); the single list of channels
+CHANNEL_FILES = {
+    "world": "conversational_history.txt",
+    "finance": "finance_convers_history.txt",
+    "technology": "tech_convers_history.txt",
+    "healthcare": "healthcare_convers_history.txt",
+    "architecture": "architecture_convers_history.txt",
+    "computer_science": "computer_science_convers_history.txt",
+    "human": "human_convers_history.txt",
+}
+
+SEED_RECORD = {"role": "Gaurav", "content": "Conversation started."}
+
+
+# Names accepted for channels beyond CHANNEL_FILES (the in-process engine can run any number)
+CHANNEL_NAME = re.compile(r"[A-Za-z0-9_\-]{1,64}")
+
+
+def normalize_channel(channel: str) -> str:
+    """Unknown channels fall back to world (for channel names coming from requests)."""
+    return channel if channel in CHANNEL_FILES else "world"
+
+
+def channel_filename(channel: str) -> str:
+    """History filename for channel: the CHANNEL_FILES name, else <channel>_convers_history.txt."""
+    filename = CHANNEL_FILES.get(channel)
+    if filename is None:
+        if not CHANNEL_NAME.fullmatch(channel):
+            raise ValueError(f"Invalid channel name {channel!r}")
+        filename = f"{channel}_convers_history.txt"
+    return filename
+
+
+class HistoryStore:
+    """Interface shared by the backends. Channel names are normalized by callers via normalize_channel."""
+
+    def append(self, channel: str, records, durable: bool = False) -> list:
+        """
+        Append records with consecutive seqs in one batch; return them as stored.
+        durable=True returns only once the batch is on disk (fsync). Writers normally
+        go through history_writer, which serializes and batches these calls.
+        """
+        raise NotImplementedError
+
+    def tail(self, channel: str, n: int) -> list:
+        """Last n records, oldest first."""
+        raise NotImplementedError
+
+    def page(self, channel: str, limit: int, before: int = None, after: int = None):
+        """(records, has_older, has_newer); see history.RecordCache.page."""
+        raise NotImplementedError
+
+    def version(self, channel: str):
+        """Value that changes whenever the channel's history does (for ETags); None if empty."""
+        raise NotImplementedError
+
+    def last_seq(self, channel: str) -> int:
+        """Seq of the channel's newest record (0 if it has none)."""
+        raise NotImplementedError
+
+    def follower(self, channel: str):
+        """
+        Change feed for one channel (used by the SSE broadcaster), with:
+          refresh() -> records appended since the last call (the first call only positions it)
+          read_after(seq, limit) -> records with seq > seq
+          last_seq, watch_path (file whose changes signal new records)
+        """
+        raise NotImplementedError
+
+    def last_record(self, channel: str):
+        records = self.tail(channel, 1)
+        return records[0] if records else None
+
+    def ensure_seed(self, channel: str) -> None:
+        """Give an empty channel one opening line so run.py can derive the last speaker."""
+        if self.last_record(channel) is None:
+            self.append(channel, [SEED_RECORD])
+
+
+class JsonlHistoryStore(HistoryStore):
+    """
+    One segmented JSONL log per channel (history_segments). Pages of the active file are
+    served from an in-memory RecordCache; older pages come from the sealed segments.
+    """
+
+    def __init__(self, data_dir: Path = DATA_DIR, **segment_options):
+        self.data_dir = Path(data_dir)
+        self.segment_options = segment_options
+        self._caches = {}
+        self._logs = {}
+        self._lock = threading.Lock()
+
+    def _path(self, channel: str) -> Path:
+        return (self.data_dir / channel_filename(channel)).resolve()
+
+    def log(self, channel: str) -> SegmentedLog:
+        with self._lock:
+            log = self._logs.get(channel)
+            if log is None:
+                log = self._logs[channel] = SegmentedLog(self._path(channel), **self.segment_options)
+            return log
+
+    def _cache(self, channel: str) -> history.RecordCache:
+        with self._lock:
+            cache = self._caches.get(channel)
+            if cache is None:
+                cache = self._caches[channel] = history.RecordCache(self._path(channel))
+            return cache
+
+    def append(self, channel, records, durable=False):
+        return self.log(channel).append(records, fsync=durable)
+
+    def tail(self, channel, n):
+        return self.log(channel).tail(n)
+
+    def last_seq(self, channel):
+        return self.log(channel).last_seq()
+
+    def page(self, channel, limit, before=None, after=None):
+        log = self.log(channel)
+        cache = self._cache(channel)
+        cache.sync()
+        sealed = log.sealed_seq()
+        if after is not None:
+            records = log.read_sealed(after=after, limit=limit) if after < sealed else []
+            if len(records) < limit:
+                records += cache.page(limit - len(records), after=max(after, sealed))[0]
+        else:
+            records = [r for r in cache.page(limit, before=before)[0] if r["seq"] > sealed]
+            if len(records) < limit and sealed:
+                upto = records[0]["seq"] if records else min(before or sealed + 1, sealed + 1)
+                records[:0] = log.read_sealed(before=upto, limit=limit - len(records))
+        if not records:
+            return [], False, False
+        segments = log.segments()
+        first_seq = segments[0]["first_seq"] if segments else (cache.records[0]["seq"] if cache.records else 1)
+        last_seq = max(cache.last_seq, sealed)
+        return records, records[0]["seq"] > first_seq, records[-1]["seq"] < last_seq
+
+    def version(self, channel):
+        sig = self._cache(channel).sync()
+        return "%s-%s-%s" % sig if sig else None
+
+    def follower(self, channel):
+        return SegmentFollower(self.log(channel))
+
+
+class SqliteFollower:
+    """Change feed over the messages table: polls by seq when the WAL file changes."""
+
+    def __init__(self, store: "SqliteHistoryStore", channel: str):
+        self.store = store
+        self.channel = channel
+        self.last_seq = 0
+        self._positioned = False
+        self.watch_path = Path(str(store.path) + "-wal")
+
+    def refresh(self) -> list:
+        if not self._positioned:
+            self.last_seq = self.store.last_seq(self.channel)
+            self._positioned = True
+            return []
+        out = self.store.read_after(self.channel, self.last_seq)
+        if out:
+            self.last_seq = out[-1]["seq"]
+        return out
+
+    def read_after(self, after_seq: int, limit: int = None) -> list:
+        return self.store.read_after(self.channel, after_seq, limit)
+
+
+class SqliteHistoryStore(HistoryStore):
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS messages (
+            channel   TEXT    NOT NULL,
+            seq       INTEGER NOT NULL,
+            role      TEXT    NOT NULL,
+            content   TEXT    NOT NULL,
+            timestamp TEXT,
+            extra     TEXT,
+            PRIMARY KEY (channel, seq)
+        ) WITHOUT ROWID
+    """
+    _COLUMNS = ("role", "content", "timestamp", "seq")
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(self.SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread (sqlite3 connections are not shared across threads)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+            self._local.synchronous = None
+        return conn
+
+    def _set_synchronous(self, conn: sqlite3.Connection, durable: bool) -> None:
+        """
+        In WAL mode, NORMAL syncs only at checkpoints (a commit can be lost on power
+        failure, never corrupted); FULL syncs the WAL on every commit.
+        """
+        level = "FULL" if durable else "NORMAL"
+        if self._local.synchronous != level:
+            conn.execute(f"PRAGMA synchronous={level}")
+            self._local.synchronous = level
+
+    _INSERT = "INSERT INTO messages (channel, seq, role, content, timestamp, extra) VALUES (?, ?, ?, ?, ?, ?)"
+
+    @classmethod
+    def _to_row(cls, channel: str, entry: dict) -> tuple:
+        """Fields other than role/content/timestamp/seq are kept as JSON in `extra`."""
+        extra = {k: v for k, v in entry.items() if k not in cls._COLUMNS}
+        return (
+            channel, entry["seq"], str(entry.get("role", "")), str(entry.get("content", "")),
+            entry.get("timestamp"), json.dumps(extra) if extra else None,
+        )
+
+    @staticmethod
+    def _row_to_record(row) -> dict:
+        role, content, timestamp, seq, extra = row
+        entry = json.loads(extra) if extra else {}
+        entry.update(role=role, content=content, seq=seq)
+        if timestamp is not None:
+            entry["timestamp"] = timestamp
+        return entry
+
+    def _select(self, where: str, params, order: str = "ASC", limit: int = None) -> list:
+        sql = f"SELECT role, content, timestamp, seq, extra FROM messages WHERE channel = ? {where} ORDER BY seq {order}"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        rows = self._conn().execute(sql, params).fetchall()
+        if order == "DESC":
+            rows.reverse()
+        return [self._row_to_record(r) for r in rows]
+
+    def append(self, channel, records, durable=False):
+        conn = self._conn()
+        self._set_synchronous(conn, durable)
+        # IMMEDIATE takes the write lock up front, so reading MAX(seq) and inserting is atomic
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM messages WHERE channel = ?", (channel,)).fetchone()[0]
+            written = []
+            for record in records:
+                seq += 1
+                written.append(dict(record, seq=seq))
+            conn.executemany(self._INSERT, [self._to_row(channel, entry) for entry in written])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return written
+
+    def last_seq(self, channel) -> int:
+        return self._conn().execute(
+            "SELECT COALESCE(MAX(seq), 0) FROM messages WHERE channel = ?", (channel,)
+        ).fetchone()[0]
+
+    def tail(self, channel, n):
+        if n <= 0:
+            return []
+        return self._select("", (channel,), order="DESC", limit=n)
+
+    def read_after(self, channel, after_seq, limit=None):
+        return self._select("AND seq > ?", (channel, after_seq), limit=limit)
+
+    def page(self, channel, limit, before=None, after=None):
+        if after is not None:
+            records = self._select("AND seq > ?", (channel, after), limit=limit)
+        elif before is not None:
+            records = self._select("AND seq < ?", (channel, before), order="DESC", limit=limit)
+        else:
+            records = self._select("", (channel,), order="DESC", limit=limit)
+        if not records:
+            return [], False, False
+        conn = self._conn()
+        has_older = conn.execute(
+            "SELECT 1 FROM messages WHERE channel = ? AND seq < ? LIMIT 1", (channel, records[0]["seq"])
+        ).fetchone() is not None
+        has_newer = conn.execute(
+            "SELECT 1 FROM messages WHERE channel = ? AND seq > ? LIMIT 1", (channel, records[-1]["seq"])
+        ).fetchone() is not None
+        return records, has_older, has_newer
+
+    def version(self, channel):
+        seq = self.last_seq(channel)
+        return f"sqlite-{seq}" if seq else None
+
+    def follower(self, channel):
+        return SqliteFollower(self, channel)
+
+    def import_jsonl(self, channel: str, path: Path, replace: bool = False) -> int:
+        """Load one JSONL history file into channel, keeping its seq numbering. Returns rows imported."""
+        conn = self._conn()
+        if self.last_seq(channel) and not replace:
+            return 0
+        records = SegmentedLog(path).read_after(0)  # sealed segments too; fills in seq for legacy lines
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM messages WHERE channel = ?", (channel,))
+            conn.executemany(self._INSERT, [self._to_row(channel, r) for r in records])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return len(records)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> HistoryStore:
+    """The process-wide history store (HISTORY_BACKEND=jsonl|sqlite)."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            backend = os.environ.get("HISTORY_BACKEND", "jsonl").strip().lower()
+            if backend == "sqlite":
+                _store = SqliteHistoryStore(Path(os.environ.get("HISTORY_DB", DATA_DIR / "history.db")))
+            elif backend == "jsonl":
+                _store = JsonlHistoryStore(Path(os.environ.get("HISTORY_DIR", DATA_DIR)))
+            else:
+                raise ValueError(f"Unknown HISTORY_BACKEND {backend!r} (expected jsonl or sqlite)")
+        return _store
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="History store tools")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    imp = sub.add_parser("import", help="Import data/ (and backup_previous/) JSONL histories into SQLite")
+    imp.add_argument("--db", default=os.environ.get("HISTORY_DB", str(DATA_DIR / "history.db")), help="SQLite database path")
+    imp.add_argument("--replace", action="store_true", help="Re-import channels that already have rows")
+    imp.add_argument("--no-backup", action="store_true", help="Skip backup_previous/ (imported as backup_previous/<channel>)")
+    rot = sub.add_parser("rotate", help="Seal the active JSONL file of each channel into a segment")
+    rot.add_argument("channels", nargs="*", help="Channels (default: all)")
+    comp = sub.add_parser("compact", help="Merge small sealed JSONL segments and (re)compress them")
+    comp.add_argument("channels", nargs="*", help="Channels (default: all)")
+    comp.add_argument("--compression", choices=("none", "gzip", "zstd"), help="Default: HISTORY_SEGMENT_COMPRESSION")
+    comp.add_argument("--target-bytes", type=int, help="Merged segment size (uncompressed); default HISTORY_SEGMENT_BYTES")
+    args = parser.parse_args()
+
+    if args.cmd in ("rotate", "compact"):
+        store = JsonlHistoryStore(Path(os.environ.get("HISTORY_DIR", DATA_DIR)))
+        for channel in args.channels or list(CHANNEL_FILES):
+            log = store.log(normalize_channel(channel))
+            if args.cmd == "rotate":
+                entry = log.rotate()
+                status = f"sealed {entry['file']} ({entry['records']} records)" if entry else "nothing to seal"
+            else:
+                result = log.compact(args.compression, args.target_bytes)
+                status = f"{result['before']} -> {result['after']} segments"
+            print(f"{channel}: {status}", file=sys.stderr)
+        return
+
+    store = SqliteHistoryStore(Path(args.db))
+    sources = [(DATA_DIR, "")]
+    if not args.no_backup:
+        sources.append((BACKUP_DIR, "backup_previous/"))
+    for src_dir, prefix in sources:
+        for channel, filename in CHANNEL_FILES.items():
+            path = src_dir / filename
+            if not path.exists():
+                continue
+            n = store.import_jsonl(prefix + channel, path, replace=args.replace)
+            status = f"{n} records" if n else "skipped (already imported; use --replace)"
+            print(f"{path.relative_to(REPO_ROOT)} -> {prefix + channel}: {status}", file=sys.stderr)
+    print(f"Done. Set HISTORY_BACKEND=sqlite (and HISTORY_DB={args.db} if not the default) to use it.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
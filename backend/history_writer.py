@@ -0,0 +1,198 @@
+"""
+Single writer per channel for history appends, with group commit.
+
+Every append in a process (agents in run.py, simulation_stream, the server's human
+channel) is handed to that channel's writer thread and waits for it. The thread takes
+everything queued since its last write and stores it as one batch: a single locked
+write for JSONL, or a single transaction for SQLite. Bursts therefore cost one
+write (and one fsync) instead of one per message, and a process never has two
+appends to the same channel in flight. Across processes the store's own locking
+(flock, or SQLite's write lock) keeps seqs unique.
+
+HISTORY_DURABILITY picks when data must be on disk before append() returns:
+  none    (default) handed to the OS; survives a process crash, not a power cut
+  batch   one fsync per group-committed batch (SQLite: synchronous=FULL per transaction)
+  record  one fsync per record (each record is its own write / transaction)
+"""
+import asyncio
+import os
+import queue
+import sys
+import threading
+from concurrent.futures import Future
+
+from history_store import get_store
+
+DURABILITY_MODES = ("none", "batch", "record")
+# Most records written in one group commit
+MAX_BATCH = 512
+# A writer thread exits after this long without appends (restarted on the next one)
+IDLE_SECONDS = 30.0
+
+
+def _durability_from_env() -> str:
+    mode = os.environ.get("HISTORY_DURABILITY", "none").strip().lower()
+    if mode not in DURABILITY_MODES:
+        print(f"Unknown HISTORY_DURABILITY {mode!r}; using 'none'", file=sys.stderr)
+        return "none"
+    return mode
+
+
+class ChannelWriter:
+    """
+    The writer thread for one channel: drains its queue and stores each drain as one batch.
+    The thread only runs while there are appends, so idle channels cost no thread.
+    """
+
+    def __init__(self, store, channel: str, durability: str = "none", max_batch: int = MAX_BATCH):
+        self.store = store
+        self.channel = channel
+        self.durability = durability
+        self.max_batch = max_batch
+        self.batches = 0
+        self.records = 0
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _put(self, item) -> None:
+        with self._lock:
+            self._queue.put(item)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"history-writer-{self.channel}", daemon=True)
+                self._thread.start()
+
+    def submit(self, records) -> Future:
+        """Queue records for the next batch; the future resolves to them as stored (with seq)."""
+        future = Future()
+        self._put((list(records), future))
+        return future
+
+    def close(self) -> None:
+        """Write what is queued, then stop the thread."""
+        with self._lock:
+            thread = self._thread
+            if thread is not None:
+                self._queue.put(None)
+        if thread is not None:
+            thread.join()
+
+    def _take_batch(self):
+        """
+        Wait for one request, then add whatever else is already queued (up to max_batch
+        records). Returns None once the queue has been idle for IDLE_SECONDS.
+        """
+        try:
+            first = self._queue.get(timeout=IDLE_SECONDS)
+        except queue.Empty:
+            with self._lock:
+                if self._queue.empty():
+                    self._thread = None  # the next _put starts a new thread
+                    return None
+            first = self._queue.get()
+        pending = [first]
+        count = len(pending[0][0]) if pending[0] else 0
+        while pending[-1] is not None and count < self.max_batch:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            pending.append(item)
+            if item is not None:
+                count += len(item[0])
+        return pending
+
+    def _write(self, pending) -> None:
+        # Requests cancelled while queued (e.g. a cancelled asyncio task) are dropped unwritten
+        pending = [(recs, future) for recs, future in pending if future.set_running_or_notify_cancel()]
+        if not pending:
+            return
+        records = [r for recs, _ in pending for r in recs]
+        if self.durability == "record":
+            written = [self.store.append(self.channel, [r], durable=True)[0] for r in records]
+        else:
+            written = self.store.append(self.channel, records, durable=self.durability == "batch")
+        self.batches += 1
+        self.records += len(written)
+        start = 0
+        for recs, future in pending:
+            future.set_result(written[start:start + len(recs)])
+            start += len(recs)
+
+    def _run(self) -> None:
+        while True:
+            pending = self._take_batch()
+            if pending is None:
+                return
+            stop = pending[-1] is None
+            if stop:
+                pending.pop()
+            if pending:
+                try:
+                    self._write(pending)
+                except Exception as e:
+                    for _, future in pending:
+                        if not future.done():
+                            future.set_exception(e)
+            if stop:
+                with self._lock:
+                    if self._queue.empty():
+                        self._thread = None
+                        return
+
+
+class HistoryWriter:
+    """Per-channel ChannelWriters over one store, created on first use."""
+
+    def __init__(self, store=None, durability: str = None):
+        self.store = store if store is not None else get_store()
+        self.durability = durability or _durability_from_env()
+        self._writers = {}
+        self._lock = threading.Lock()
+
+    def _writer(self, channel: str) -> ChannelWriter:
+        with self._lock:
+            writer = self._writers.get(channel)
+            if writer is None:
+                writer = self._writers[channel] = ChannelWriter(self.store, channel, self.durability)
+            return writer
+
+    def append(self, channel: str, records) -> list:
+        """Append records to channel and wait until they are stored; returns them with seq."""
+        return self._writer(channel).submit(records).result()
+
+    async def append_async(self, channel: str, records) -> list:
+        """append() for the event loop: awaits the batch without blocking the loop or a worker thread."""
+        return await asyncio.wrap_future(self._writer(channel).submit(records))
+
+    def close(self) -> None:
+        with self._lock:
+            writers, self._writers = list(self._writers.values()), {}
+        for writer in writers:
+            writer.close()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            writers = dict(self._writers)
+        return {
+            "durability": self.durability,
+            "channels": {ch: {"batches": w.batches, "records": w.records} for ch, w in writers.items()},
+        }
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer() -> HistoryWriter:
+    """The process-wide HistoryWriter over get_store()."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = HistoryWriter()
+        return _writer
+
+
+def append(channel: str, records) -> list:
+    """Shorthand for get_writer().append(channel, records)."""
+    return get_writer().append(channel, records)
@@ -0,0 +1,461 @@
+"""
+Persisted vector index of person profiles, for top-k match lookup without LLM calls.
+
+Covers every profile JSON in data/ (a dict, or a list whose first item is one, with a
+"profile" or "name" key), plus config/<stem>_persona_prompt.txt when there is one. Each
+profile becomes a unit vector of PROFILE_INDEX_DIM floats: TF-IDF over relevance.tokenize
+tokens, with document frequencies kept in 2^18 hashed buckets and the weights folded into
+the vector with a signed hash (the hashing trick), so no vocabulary is stored.
+
+On disk (PROFILE_INDEX_DIR, default data/profile_index/):
+  vectors.npy    (capacity, dim) float32, memory-mapped; one row per profile slot
+  assign.npy     IVF list of each slot (-1: free slot)
+  centroids.npy  IVF centroids (spherical k-means), once there are PROFILE_INDEX_MIN_IVF profiles
+  df.npy         document frequencies per hashed bucket
+  meta.json      slot names, content hashes of the source files, counts
+
+  lock           flock'd by whichever process is writing (server sync, CLI, profile_matcher.py --top)
+
+A query scores the PROFILE_INDEX_NPROBE lists whose centroids are closest to the query
+(or every row, below PROFILE_INDEX_MIN_IVF profiles). sync() re-reads data/ and only
+re-embeds profiles whose files changed; added rows join their nearest list. Once
+PROFILE_INDEX_RETRAIN_FRACTION of the profiles changed since the last training, the
+centroids are retrained from the stored vectors. Document frequencies grow as profiles
+are added and are only recounted by build() (the "build" command).
+
+Writers hold an exclusive flock on the index directory, and sync() first reloads the
+index if another process saved it since this one last read it, so the memory map never
+points at a vectors.npy another process has replaced.
+
+  python backend/profile_index.py sync
+  python backend/profile_index.py query Gaurav_Atavale -k 3
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are not coordinated across processes
+    fcntl = None
+
+from relevance import tokenize
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DATA_DIR = REPO_ROOT / "data"
+CONFIG_DIR = REPO_ROOT / "config"
+
+INDEX_DIR = Path(os.environ.get("PROFILE_INDEX_DIR", DATA_DIR / "profile_index"))
+DIM = int(os.environ.get("PROFILE_INDEX_DIM", "256"))
+NPROBE = int(os.environ.get("PROFILE_INDEX_NPROBE", "8"))
+MIN_IVF = int(os.environ.get("PROFILE_INDEX_MIN_IVF", "2000"))
+RETRAIN_FRACTION = float(os.environ.get("PROFILE_INDEX_RETRAIN_FRACTION", "0.2"))
+# How often get_index() re-checks data/ for changed profiles
+SYNC_SECONDS = float(os.environ.get("PROFILE_INDEX_SYNC_SECONDS", "60"))
+DF_BUCKETS = 1 << 18
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_PER_LIST = 64
+CHUNK_ROWS = 16384
+
+
+def profile_document(path: Path):
+    """(text, content hash) for a profile JSON and its persona prompt, or None if path is not a profile."""
+    from candidate_rank import profile_fields
+
+    raw = path.read_bytes()
+    try:
+        data = json.loads(raw)
+    except json.JSONDecodeError:
+        return None
+    if isinstance(data, list) and data:
+        data = data[0]
+    if not isinstance(data, dict) or not ("profile" in data or "name" in data):
+        return None  # recommendations.json, email_ids.json, ...
+    h = hashlib.sha1(raw)
+    text = " ".join(v for _, v in profile_fields(data))
+    persona_path = CONFIG_DIR / f"{path.stem}_persona_prompt.txt"
+    if persona_path.exists():
+        persona = persona_path.read_bytes()
+        h.update(persona)
+        text += "\n" + persona.decode("utf-8")
+    return text, h.hexdigest()
+
+
+def _hashed_terms(text: str):
+    """(crc32 hashes, counts) of text's distinct tokens."""
+    counts = Counter(tokenize(text))
+    hashes = np.fromiter((zlib.crc32(t.encode("utf-8")) for t in counts), dtype=np.uint32, count=len(counts))
+    return hashes, np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class ProfileIndex:
+    """Memory-mapped profile vectors with an IVF list per row; see the module docstring."""
+
+    def __init__(self, path: Path = INDEX_DIR, dim: int = DIM):
+        self.path = Path(path)
+        self.dim = dim
+        self._lock_file = None
+        self._reset()
+        if (self.path / "meta.json").exists():
+            with self._locked():
+                self._load()
+
+    def _reset(self) -> None:
+        self.names = []  # slot -> name (None for a free slot)
+        self.hashes = {}  # name -> content hash of its source files
+        self.n_docs = 0  # documents counted in df
+        self.updates_since_train = 0
+        self.df = np.zeros(DF_BUCKETS, dtype=np.int32)
+        self.vectors = np.zeros((0, self.dim), dtype=np.float32)
+        self.assign = np.zeros(0, dtype=np.int32)
+        self.centroids = None
+        self._slots = {}
+        self._lists = None
+        self._stamp = None  # meta.json as last loaded or saved by this object
+
+    # -- persistence --
+
+    @contextmanager
+    def _locked(self):
+        """Exclusive lock on the index directory across processes; re-entrant within this object."""
+        if self._lock_file is not None or fcntl is None:
+            yield
+            return
+        self.path.mkdir(parents=True, exist_ok=True)
+        with open(self.path / "lock", "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            self._lock_file = f
+            try:
+                yield
+            finally:
+                self._lock_file = None
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _meta_stamp(self):
+        try:
+            st = (self.path / "meta.json").stat()
+        except OSError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _reload_if_changed(self) -> None:
+        """Re-read the index if another process saved it since this object last did (call under the lock)."""
+        stamp = self._meta_stamp()
+        if stamp == self._stamp:
+            return
+        self._reset()
+        if stamp is not None:
+            self._load()
+
+    def _load(self) -> None:
+        meta = json.loads((self.path / "meta.json").read_text(encoding="utf-8"))
+        if meta["dim"] != self.dim:
+            raise ValueError(f"Index at {self.path} has dim {meta['dim']}, not {self.dim}; rebuild it")
+        self.names = meta["names"]
+        self.hashes = meta["hashes"]
+        self.n_docs = meta["n_docs"]
+        self.updates_since_train = meta["updates_since_train"]
+        self.df = np.load(self.path / "df.npy")
+        self.assign = np.load(self.path / "assign.npy")
+        self.vectors = np.load(self.path / "vectors.npy", mmap_mode="r+")
+        centroids = self.path / "centroids.npy"
+        self.centroids = np.load(centroids) if centroids.exists() else None
+        self._slots = {name: i for i, name in enumerate(self.names) if name is not None}
+        self._lists = None
+        self._stamp = self._meta_stamp()
+
+    def save(self) -> None:
+        """Write everything but the vectors (updated in place) atomically, after flushing the vectors."""
+        with self._locked():
+            self._save()
+
+    def _save(self) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        if isinstance(self.vectors, np.memmap):
+            self.vectors.flush()
+        elif len(self.vectors):
+            self._grow(len(self.vectors))
+        for name, array in (("df", self.df), ("assign", self.assign), ("centroids", self.centroids)):
+            target = self.path / f"{name}.npy"
+            if array is None:
+                target.unlink(missing_ok=True)
+                continue
+            tmp = self.path / f"{name}.tmp.npy"
+            np.save(tmp, array)
+            os.replace(tmp, target)
+        meta = {"dim": self.dim, "names": self.names, "hashes": self.hashes, "n_docs": self.n_docs,
+                "updates_since_train": self.updates_since_train}
+        tmp = self.path / "meta.json.tmp"
+        tmp.write_text(json.dumps(meta), encoding="utf-8")
+        os.replace(tmp, self.path / "meta.json")
+        self._stamp = self._meta_stamp()
+
+    def _grow(self, capacity: int) -> None:
+        """Move the vectors to a memory-mapped file with room for capacity rows."""
+        with self._locked():
+            self._grow_file(capacity)
+
+    def _grow_file(self, capacity: int) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        tmp = self.path / "vectors.tmp.npy"
+        grown = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32, shape=(capacity, self.dim))
+        grown[:len(self.vectors)] = self.vectors
+        grown.flush()
+        del grown
+        os.replace(tmp, self.path / "vectors.npy")
+        self.vectors = np.load(self.path / "vectors.npy", mmap_mode="r+")
+        if len(self.assign) < capacity:
+            self.assign = np.concatenate([self.assign, np.full(capacity - len(self.assign), -1, np.int32)])
+            self.names += [None] * (capacity - len(self.names))
+
+    # -- vectors --
+
+    def _idf(self, hashes: np.ndarray) -> np.ndarray:
+        df = self.df[hashes & (DF_BUCKETS - 1)]
+        return np.log((1 + self.n_docs) / (1 + df)).astype(np.float32) + 1
+
+    def _embed(self, terms) -> np.ndarray:
+        hashes, counts = terms
+        vec = np.zeros(self.dim, dtype=np.float32)
+        if len(hashes):
+            weights = np.log1p(counts) * self._idf(hashes)
+            signs = np.where((hashes >> 31) & 1, -1.0, 1.0).astype(np.float32)
+            np.add.at(vec, (hashes >> 18) % self.dim, signs * weights)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def _count(self, terms, sign: int = 1) -> None:
+        buckets = np.unique(terms[0] & (DF_BUCKETS - 1))
+        self.df[buckets] += sign
+        self.n_docs += sign
+
+    # -- updates --
+
+    def build(self, docs) -> None:
+        """Replace the index with docs: {name: (text, content hash)}."""
+        names = list(docs)
+        terms = [_hashed_terms(docs[n][0]) for n in names]
+        self.df = np.zeros(DF_BUCKETS, dtype=np.int32)
+        self.n_docs = 0
+        for t in terms:
+            self._count(t)
+        self.vectors = np.zeros((0, self.dim), dtype=np.float32)
+        self.assign = np.zeros(0, dtype=np.int32)
+        self.names = []
+        self._grow(max(len(names), 1))
+        for start in range(0, len(names), CHUNK_ROWS):
+            chunk = terms[start:start + CHUNK_ROWS]
+            self.vectors[start:start + len(chunk)] = np.stack([self._embed(t) for t in chunk]) if chunk else 0
+        self.names = names + [None] * (len(self.vectors) - len(names))
+        self.hashes = {n: docs[n][1] for n in names}
+        self._slots = {n: i for i, n in enumerate(names)}
+        self.assign[:len(names)] = 0
+        self._train()
+
+    def upsert(self, name: str, text: str, content_hash: str = None) -> None:
+        terms = _hashed_terms(text)
+        slot = self._slots.get(name)
+        if slot is None:
+            self._count(terms)  # df only grows here; build()/retraining recounts
+            free = np.flatnonzero(self.assign < 0)
+            if not len(free):
+                self._grow(max(16, 2 * len(self.vectors)))
+                free = np.flatnonzero(self.assign < 0)
+            slot = int(free[0])
+            self.names[slot] = name
+            self._slots[name] = slot
+        vec = self._embed(terms)
+        self.vectors[slot] = vec
+        self.assign[slot] = int(np.argmax(self.centroids @ vec)) if self.centroids is not None else 0
+        self.hashes[name] = content_hash
+        self.updates_since_train += 1
+        self._lists = None
+
+    def remove(self, name: str) -> None:
+        slot = self._slots.pop(name, None)
+        if slot is None:
+            return
+        self.names[slot] = None
+        self.assign[slot] = -1
+        self.hashes.pop(name, None)
+        self.updates_since_train += 1
+        self._lists = None
+
+    def sync(self, data_dir: Path = DATA_DIR) -> dict:
+        """Bring the index in line with data_dir's profiles, re-embedding only changed ones; saves it."""
+        docs = {}
+        for path in sorted(Path(data_dir).glob("*.json")):
+            doc = profile_document(path)
+            if doc is not None:
+                docs[path.stem] = doc
+        with self._locked():
+            self._reload_if_changed()
+            return self._sync(docs)
+
+    def _sync(self, docs) -> dict:
+        if not self._slots and docs:
+            self.build(docs)
+            self.save()
+            return {"added": len(docs), "updated": 0, "removed": 0, "unchanged": 0}
+        stats = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0}
+        for name, (text, content_hash) in docs.items():
+            if self.hashes.get(name) == content_hash:
+                stats["unchanged"] += 1
+                continue
+            stats["updated" if name in self._slots else "added"] += 1
+            self.upsert(name, text, content_hash)
+        for name in [n for n in self._slots if n not in docs]:
+            self.remove(name)
+            stats["removed"] += 1
+        if stats["added"] + stats["updated"] + stats["removed"]:
+            if self.updates_since_train > RETRAIN_FRACTION * max(len(self._slots), 1):
+                self._train()  # from the stored vectors; nothing is re-embedded
+            self.save()
+        return stats
+
+    # -- IVF --
+
+    def _train(self) -> None:
+        """Spherical k-means over a sample of the live rows; every row joins its nearest centroid."""
+        live = np.flatnonzero(self.assign >= 0)
+        self.updates_since_train = 0
+        self._lists = None
+        if len(live) < MIN_IVF:
+            self.centroids = None
+            self.assign[live] = 0
+            return
+        nlist = int(np.sqrt(len(live)))
+        rng = np.random.default_rng(0)
+        sample = np.sort(rng.choice(live, size=min(len(live), nlist * KMEANS_SAMPLE_PER_LIST), replace=False))
+        x = np.asarray(self.vectors[sample])
+        centroids = x[rng.choice(len(x), size=nlist, replace=False)].copy()
+        for _ in range(KMEANS_ITERATIONS):
+            nearest = np.argmax(x @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, nearest, x)
+            empty = np.bincount(nearest, minlength=nlist) == 0
+            sums[empty] = x[rng.choice(len(x), size=int(empty.sum()))]  # reseed empty lists
+            centroids = _normalize_rows(sums)
+        self.centroids = centroids.astype(np.float32)
+        for start in range(0, len(live), CHUNK_ROWS):
+            rows = live[start:start + CHUNK_ROWS]
+            self.assign[rows] = np.argmax(np.asarray(self.vectors[rows]) @ self.centroids.T, axis=1)
+
+    def _inverted_lists(self) -> list:
+        if self._lists is None:
+            order = np.argsort(self.assign, kind="stable")
+            sorted_assign = self.assign[order]
+            nlist = len(self.centroids) if self.centroids is not None else 1
+            bounds = np.searchsorted(sorted_assign, np.arange(nlist + 1))
+            self._lists = [order[bounds[i]:bounds[i + 1]] for i in range(nlist)]
+        return self._lists
+
+    # -- queries --
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def resolve(self, name: str):
+        """The indexed name matching name case-insensitively (gaurav_atavale -> Gaurav_Atavale), or None."""
+        if name in self._slots:
+            return name
+        lowered = name.lower()
+        return next((n for n in self._slots if n.lower() == lowered), None)
+
+    def query_vector(self, vec: np.ndarray, k: int = 10, nprobe: int = NPROBE, exclude: str = None) -> list:
+        """[(name, cosine)] of the k profiles nearest vec, best first."""
+        lists = self._inverted_lists()
+        if self.centroids is None:
+            rows = lists[0]
+        else:
+            probe = np.argsort(-(self.centroids @ vec))[:nprobe]
+            rows = np.concatenate([lists[p] for p in probe])
+        if exclude is not None and exclude in self._slots:
+            rows = rows[rows != self._slots[exclude]]
+        if not len(rows) or k <= 0:
+            return []
+        rows = np.sort(rows)  # sequential reads from the memory map
+        scores = np.asarray(self.vectors[rows]) @ vec
+        k = min(k, len(rows))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [(self.names[rows[i]], float(scores[i])) for i in best]
+
+    def query(self, name: str, k: int = 10, nprobe: int = NPROBE) -> list:
+        """Top-k matches for an indexed profile, excluding itself."""
+        resolved = self.resolve(name)
+        if resolved is None:
+            raise KeyError(f"Profile {name!r} is not in the index")
+        vec = np.asarray(self.vectors[self._slots[resolved]])
+        return self.query_vector(vec, k, nprobe, exclude=resolved)
+
+    def query_text(self, text: str, k: int = 10, nprobe: int = NPROBE) -> list:
+        return self.query_vector(self._embed(_hashed_terms(text)), k, nprobe)
+
+
+_index = None
+_synced_at = 0.0
+_lock = threading.Lock()
+
+
+def get_index() -> ProfileIndex:
+    """The process-wide index, synced with data/ on first use and then every SYNC_SECONDS."""
+    global _index, _synced_at
+    with _lock:
+        if _index is None:
+            _index = ProfileIndex()
+        if time.monotonic() - _synced_at >= SYNC_SECONDS or not _synced_at:
+            _index.sync()
+            _synced_at = time.monotonic()
+        return _index
+
+
+def top_matches(name: str, k: int = 10) -> list:
+    """[(name, cosine)] of the k profiles most similar to name's (GET /api/matches); KeyError if unknown."""
+    index = get_index()
+    with _lock:
+        return index.query(name, k)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Persisted profile vector index (data/*.json)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("sync", help="Index new and changed profiles, drop removed ones")
+    sub.add_parser("build", help="Rebuild the index from scratch")
+    query = sub.add_parser("query", help="Top-k matches for a profile")
+    query.add_argument("name")
+    query.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    index = ProfileIndex()
+    if args.command == "build":
+        docs = {p.stem: d for p in sorted(DATA_DIR.glob("*.json")) if (d := profile_document(p)) is not None}
+        with index._locked():
+            index.build(docs)
+            index.save()
+        print(f"Indexed {len(index)} profiles into {index.path}")
+    elif args.command == "sync":
+        print(json.dumps(index.sync()))
+    else:
+        index.sync()
+        for name, score in index.query(args.name, args.k):
+            print(f"{score:.3f}  {name}")
+
+
+if __name__ == "__main__":
+    main()
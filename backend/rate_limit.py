@@ -0,0 +1,275 @@
+"""
+Rate limiting for LLM calls.
+
+AsyncTokenBucket: `await bucket.acquire()` returns once a token is available. Tokens
+refill continuously at `rate` per second up to `burst`; waiters are served in order.
+
+LLMRateLimiter: requests-per-minute and tokens-per-minute budgets per model, from the
+"limits" section of config/models.json:
+
+  "limits": {"claude-sonnet-4-5-20250929": {"rpm": 50, "tpm": 30000}, ...}
+
+Each budget is a pair of token buckets whose levels live in a small flock'd state file under LLM_LIMIT_DIR (default data/ratelimit/), so
+every run.py process, the engine and the server draw from the same budget. A bucket
+holds LLM_LIMIT_BURST (default 0.2) of the limit and refills at the rest per minute, so
+no 60-second window can exceed the limit. Calls
+reserve their estimated tokens up front and settle to the provider's reported usage
+afterwards; a provider 429 empties the model's buckets so all callers back off.
+
+Priority classes keep a share of each budget for the classes above them: bids stop
+drawing once less than 35% is left, replies at 15%, and interactive calls
+(/api/recommendations) may use all of it. Background simulations therefore slow down
+before the provider limit is reached, and interactive requests still get through.
+LLM_RATE_LIMITS=0 turns the limiter off.
+"""
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: budgets are per process
+    fcntl = None
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+MODELS_PATH = REPO_ROOT / "config" / "models.json"
+
+PRIORITIES = ("interactive", "reply", "bid")
+# Share of each budget a class leaves untouched for the classes above it
+RESERVE = {"interactive": 0.0, "reply": 0.15, "bid": 0.35}
+# Share of a per-minute limit that may be spent at once; the rest is the sustained rate
+BURST = min(0.9, max(0.05, float(os.environ.get("LLM_LIMIT_BURST", "0.2"))))
+# Output tokens reserved per call before the real usage is known
+EXPECTED_OUTPUT_TOKENS = {"interactive": 1024, "reply": 300, "bid": 20}
+
+
+class AsyncTokenBucket:
+    def __init__(self, rate: float, burst: float = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+        self.waits = 0
+        self.wait_seconds = 0.0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        # The lock makes waiters queue in arrival order while the head one sleeps
+        async with self._lock:
+            self._refill()
+            if self._tokens < tokens:
+                delay = (tokens - self._tokens) / self.rate
+                self.waits += 1
+                self.wait_seconds += delay
+                await asyncio.sleep(delay)
+                self._refill()
+            self._tokens -= tokens
+
+
+def estimate_tokens(priority: str, *texts: str) -> int:
+    """Rough token count of a call: ~4 characters per prompt token, plus the expected output."""
+    return sum(len(t or "") for t in texts) // 4 + EXPECTED_OUTPUT_TOKENS.get(priority, 300)
+
+
+class ModelBudget:
+    """RPM and TPM buckets for one model, shared across processes through a locked state file."""
+
+    def __init__(self, model: str, rpm: float = 0, tpm: float = 0, path: Path = None, burst: float = BURST):
+        self.model = model
+        self.limits = {"requests": float(rpm or 0), "tokens": float(tpm or 0)}
+        self.capacity = {kind: limit * burst for kind, limit in self.limits.items()}
+        # Per second; burst + one minute of refill adds up to the limit
+        self.rate = {kind: limit * (1 - burst) / 60.0 for kind, limit in self.limits.items()}
+        self.path = path
+        self._local = {}  # state when there is no state file (path None or no fcntl)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _state(self):
+        """The bucket levels, refilled to now; changes are written back on exit."""
+        with self._lock:
+            f = None
+            if self.path is not None and fcntl is not None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                f = open(self.path, "a+", encoding="utf-8")
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                state = self._local
+                if f is not None:
+                    f.seek(0)
+                    try:
+                        state = json.loads(f.read() or "{}")
+                    except ValueError:
+                        state = {}
+                now = time.time()
+                elapsed = max(0.0, now - state.get("updated", now))
+                for kind, cap in self.capacity.items():
+                    level = state.get(kind, cap)
+                    state[kind] = min(cap, level + elapsed * self.rate[kind])
+                state["updated"] = now
+                yield state
+                if f is not None:
+                    f.seek(0)
+                    f.truncate()
+                    f.write(json.dumps(state))
+                    f.flush()
+                else:
+                    self._local = state
+            finally:
+                if f is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+                    f.close()
+
+    def try_take(self, priority: str, tokens: float) -> float:
+        """Take one request and `tokens` if priority may; else return the seconds to wait first."""
+        want = {"requests": 1.0, "tokens": float(tokens)}
+        reserve = RESERVE.get(priority, 0.0)
+        with self._state() as state:
+            wait = 0.0
+            for kind, cap in self.capacity.items():
+                if cap <= 0:
+                    continue
+                # The bucket never holds more than cap: a call too big to leave the reserve untouched
+                # waits for a full bucket instead of forever
+                need = min(min(want[kind], cap) + reserve * cap, cap)
+                if state[kind] < need:
+                    wait = max(wait, (need - state[kind]) / self.rate[kind])
+            if wait == 0.0:
+                for kind, cap in self.capacity.items():
+                    if cap > 0:
+                        state[kind] -= min(want[kind], cap)
+            return wait
+
+    def settle(self, estimated: float, actual: float) -> None:
+        """Correct the token bucket once the real usage of a call is known."""
+        cap = self.capacity["tokens"]
+        if cap <= 0 or actual is None:
+            return
+        with self._state() as state:
+            state["tokens"] = max(-cap, state["tokens"] - (actual - min(estimated, cap)))
+
+    def exhaust(self) -> None:
+        """The provider said 429: empty both buckets so every caller waits for the refill."""
+        with self._state() as state:
+            for kind, cap in self.capacity.items():
+                if cap > 0:
+                    state[kind] = min(state[kind], 0.0)
+
+    def levels(self) -> dict:
+        with self._state() as state:
+            return {kind: round(state[kind], 1) for kind, cap in self.capacity.items() if cap > 0}
+
+
+class LLMRateLimiter:
+    """Per-model budgets plus counters of calls, queued (had to wait) calls and wait time per priority."""
+
+    def __init__(self, limits: dict, state_dir: Path = None, poll_seconds: float = 0.25):
+        self.budgets = {}
+        for model, spec in (limits or {}).items():
+            rpm, tpm = spec.get("rpm", 0), spec.get("tpm", 0)
+            if rpm or tpm:
+                path = state_dir / f"{re.sub(r'[^A-Za-z0-9_.-]', '_', model)}.json" if state_dir else None
+                self.budgets[model] = ModelBudget(model, rpm, tpm, path)
+        self.poll_seconds = poll_seconds
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def _count(self, model: str, priority: str, **deltas) -> None:
+        with self._lock:
+            c = self._counters.setdefault(model, {}).setdefault(priority, {
+                "calls": 0, "queued": 0, "waiting": 0, "wait_seconds": 0.0, "provider_429s": 0,
+            })
+            for key, value in deltas.items():
+                c[key] += value
+
+    def _wait_plan(self, model: str, priority: str, tokens: float):
+        budget = self.budgets.get(model)
+        return budget, (budget.try_take(priority, tokens) if budget else 0.0)
+
+    def acquire(self, model: str, priority: str, tokens: float) -> None:
+        """Block until model's budget admits this call (returns at once for unlimited models)."""
+        budget, wait = self._wait_plan(model, priority, tokens)
+        if wait > 0:
+            started = time.monotonic()
+            self._count(model, priority, queued=1, waiting=1)
+            try:
+                while wait > 0:
+                    # Re-check at least every poll_seconds: other processes spend and settle too
+                    time.sleep(min(wait, self.poll_seconds))
+                    wait = budget.try_take(priority, tokens)
+            finally:
+                self._count(model, priority, waiting=-1, wait_seconds=time.monotonic() - started)
+        self._count(model, priority, calls=1)
+
+    async def acquire_async(self, model: str, priority: str, tokens: float) -> None:
+        """acquire() for the event loop; the state-file I/O runs in a worker thread."""
+        budget, wait = await asyncio.to_thread(self._wait_plan, model, priority, tokens)
+        if wait > 0:
+            started = time.monotonic()
+            self._count(model, priority, queued=1, waiting=1)
+            try:
+                while wait > 0:
+                    await asyncio.sleep(min(wait, self.poll_seconds))
+                    wait = await asyncio.to_thread(budget.try_take, priority, tokens)
+            finally:
+                self._count(model, priority, waiting=-1, wait_seconds=time.monotonic() - started)
+        self._count(model, priority, calls=1)
+
+    def settle(self, model: str, estimated: float, actual: float) -> None:
+        budget = self.budgets.get(model)
+        if budget is not None:
+            budget.settle(estimated, actual)
+
+    def throttled(self, model: str, priority: str) -> None:
+        """Record a provider 429 and make every process back off."""
+        self._count(model, priority, provider_429s=1)
+        budget = self.budgets.get(model)
+        if budget is not None:
+            budget.exhaust()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            counters = {m: {p: dict(c, wait_seconds=round(c["wait_seconds"], 3)) for p, c in per.items()}
+                        for m, per in self._counters.items()}
+        return {
+            model: {
+                "limits": {"rpm": b.limits["requests"], "tpm": b.limits["tokens"]},
+                "available": b.levels(),
+                "priorities": counters.get(model, {}),
+            }
+            for model, b in self.budgets.items()
+        } | {m: {"priorities": c} for m, c in counters.items() if m not in self.budgets}
+
+
+def load_model_limits(path: Path = MODELS_PATH) -> dict:
+    """The "limits" section of config/models.json ({} if absent)."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get("limits") or {}
+    except (OSError, ValueError):
+        return {}
+
+
+_llm_limiter = None
+_llm_limiter_lock = threading.Lock()
+
+
+def get_llm_limiter() -> LLMRateLimiter:
+    """The process-wide limiter over config/models.json (no budgets if LLM_RATE_LIMITS=0)."""
+    global _llm_limiter
+    with _llm_limiter_lock:
+        if _llm_limiter is None:
+            enabled = os.environ.get("LLM_RATE_LIMITS", "1") != "0"
+            state_dir = Path(os.environ.get("LLM_LIMIT_DIR", REPO_ROOT / "data" / "ratelimit"))
+            _llm_limiter = LLMRateLimiter(load_model_limits() if enabled else {}, state_dir)
+        return _llm_limiter
@@ -0,0 +1,101 @@
+"""
+Background precomputation of coffee-chat recommendations (recommendation.py).
+
+For every profile in server.PROFILE_USER_IDS and every channel in REC_PRECOMPUTE_CHANNELS,
+recommendations are recomputed once the channel has REC_PRECOMPUTE_TURNS new turns since
+the last result (checked every REC_PRECOMPUTE_POLL seconds), and on startup for profiles
+that have no saved result yet. Results land in data/recommendations/<channel>/<profile>.json
+and in the recommendation cache, so GET/POST /api/recommendations answer without an LLM
+wait. While it runs, requests for those slots serve the cached result as is instead of
+revalidating on every new turn. Calls run one at a time at "reply" priority, below
+interactive requests in the shared rate limits. REC_PRECOMPUTE_TURNS=0 turns
+precomputation off.
+"""
+import asyncio
+import os
+import sys
+import time
+
+import recommendation
+from history_store import get_store
+
+EVERY_TURNS = int(os.environ.get("REC_PRECOMPUTE_TURNS", "10"))
+CHANNELS = [c.strip() for c in os.environ.get("REC_PRECOMPUTE_CHANNELS", "world").split(",") if c.strip()]
+POLL_SECONDS = float(os.environ.get("REC_PRECOMPUTE_POLL", "15"))
+
+
+class RecommendationPrecomputer:
+    """Keeps every (profile, channel) recommendation within every_turns turns of its history."""
+
+    def __init__(self, profiles, channels=CHANNELS, every_turns: int = EVERY_TURNS, poll_seconds: float = POLL_SECONDS):
+        self.profiles = list(profiles)
+        self.channels = list(channels)
+        self.every_turns = every_turns
+        self.poll_seconds = poll_seconds
+        self._done_seq = {}  # (profile, channel) -> history seq the saved result was computed at
+        self._task = None
+        self.runs = 0
+        self.errors = 0
+        self.last_error = None
+        self.last_run_at = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.every_turns > 0 and bool(self.profiles) and bool(self.channels)
+
+    def start(self) -> None:
+        if self.enabled and self._task is None:
+            recommendation.PRECOMPUTED.update((p, c) for p in self.profiles for c in self.channels)
+            self._task = asyncio.create_task(self._loop(), name="rec-precompute")
+
+    async def stop(self) -> None:
+        recommendation.PRECOMPUTED.difference_update((p, c) for p in self.profiles for c in self.channels)
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _due(self, profile: str, channel: str, seq: int) -> bool:
+        done = self._done_seq.get((profile, channel))
+        if done is None:
+            saved = recommendation.load_saved(profile, channel) or {}
+            done = saved.get("history_seq")
+            if done is None:
+                return seq > 0  # nothing saved yet
+            self._done_seq[(profile, channel)] = done
+        return seq - done >= self.every_turns
+
+    async def _loop(self) -> None:
+        while True:
+            for channel in self.channels:
+                try:
+                    seq = await asyncio.to_thread(get_store().last_seq, channel)
+                except Exception as e:
+                    print(f"[rec_precompute] {channel}: cannot read history: {e}", file=sys.stderr, flush=True)
+                    continue
+                for profile in self.profiles:
+                    if not self._due(profile, channel, seq):
+                        continue
+                    try:
+                        await asyncio.to_thread(recommendation.get_recommendations, profile, channel,
+                                                refresh=True, priority="reply")
+                        self.runs += 1
+                    except Exception as e:
+                        self.errors += 1
+                        self.last_error = f"{profile}/{channel}: {e}"
+                        print(f"[rec_precompute] {self.last_error}", file=sys.stderr, flush=True)
+                    # Retry on the next N turns after an error too, rather than every poll
+                    self._done_seq[(profile, channel)] = seq
+                    self.last_run_at = time.time()
+            await asyncio.sleep(self.poll_seconds)
+
+    def status(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "every_turns": self.every_turns,
+            "channels": self.channels,
+            "runs": self.runs,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "last_run_at": self.last_run_at,
+        }
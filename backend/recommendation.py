@@ -1,9 +1,21 @@
 #!/usr/bin/env python3
 """
 Generate coffee-chat recommendations for Gaurav_Atavale from conversation history.
-Reads config/recommendation_sys_prompt.txt and data/conversational_history.txt,
+Reads config/recommendation_sys_prompt.txt and the world channel's history (history_store),
 calls the primary/fallback model, and outputs JSON recommendations with likelihood scores.
 
+With REC_TOP_K > 0 (the default), candidate_rank.py first ranks the people in the channel
+locally and only the shortlist, with each person's most relevant messages, goes to the model
+(unless the raw history is shorter).
+
+Results are cached per profile and channel (response_cache.py), keyed on a digest of the
+model, the prompt and the history window, and saved to data/recommendations/<channel>/<profile>.json.
+A result from the fallback model is keyed on that model, so the next request finds it stale
+and retries the primary model rather than serving it as a fresh hit.
+A repeat request for unchanged history is served from the cache. Once the history moves on,
+or after REC_CACHE_TTL seconds, the old result is served for up to REC_CACHE_STALE_SECONDS
+more while a fresh one is computed in the background. REC_CACHE=0 turns the cache off.
+
 Run from repo root: python backend/recommendation.py
 Or from backend: python recommendation.py
 """
@@ -11,16 +23,30 @@ import json
 import os
 import re
 import sys
+import time
+from datetime import datetime, timezone
 from pathlib import Path
 
+import candidate_rank
+from response_cache import ResponseCache, digest
+
 # Paths
 BACKEND_DIR = Path(__file__).resolve().parent
 REPO_ROOT = BACKEND_DIR.parent
 CONFIG_DIR = REPO_ROOT / "config"
 DATA_DIR = REPO_ROOT / "data"
-HISTORY_FILE = DATA_DIR / "conversational_history.txt"
 PROMPT_FILE = CONFIG_DIR / "recommendation_sys_prompt.txt"
-RECOMMENDATIONS_OUTPUT = DATA_DIR / "recommendations.json"
+RECOMMENDATIONS_DIR = DATA_DIR / "recommendations"
+HISTORY_TURNS = 50
+
+REC_CACHE = os.environ.get("REC_CACHE", "1") != "0"
+# (profile, channel) slots rec_precompute.py keeps fresh; requests serve them stale without revalidating
+PRECOMPUTED = set()
+_cache = ResponseCache(
+    ttl=float(os.environ.get("REC_CACHE_TTL", "300")),
+    stale=float(os.environ.get("REC_CACHE_STALE_SECONDS", "3600")),
+    max_entries=int(os.environ.get("REC_CACHE_SIZE", "256")),
+)
 
 
 def load_prompt() -> str:
@@ -30,41 +56,53 @@ def load_prompt() -> str:
     return PROMPT_FILE.read_text(encoding="utf-8").strip()
 
 
-def load_conversation_history(turns: int = 50) -> str:
-    """Load and format conversation history from conversational_history.txt."""
-    if not HISTORY_FILE.exists():
-        return "No conversation history found."
-    lines = []
-    with open(HISTORY_FILE, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                entry = json.loads(line)
-                role = entry.get("role", "Unknown")
-                content = entry.get("content", "")
-                lines.append(f"{role}: {content}")
-            except json.JSONDecodeError:
-                continue
-    # Last N turns
-    lines = lines[-turns:] if len(lines) > turns else lines
+def load_conversation_history(turns: int = 50, channel: str = "world") -> str:
+    """Load and format the last turns of a channel's conversation history."""
+    from history_store import get_store
+
+    lines = [f"{e.get('role', 'Unknown')}: {e.get('content', '')}" for e in get_store().tail(channel, turns)]
     return "\n".join(lines) if lines else "No conversation history found."
 
 
-def get_recommendations(profile_user: str):
-    """
-    Generate coffee-chat recommendations for the given profile user.
-    profile_user: e.g. 'Gaurav_Atavale', 'Anagha_Palandye'. Replaces <user> in the prompt.
-    Returns dict with 'recommendations' array; raises on error.
-    """
-    if BACKEND_DIR not in sys.path:
-        sys.path.insert(0, str(BACKEND_DIR))
-    import utils
+_PROFILE_NAME = re.compile(r"[A-Za-z0-9][A-Za-z0-9_-]*")
+
+
+def recommendations_path(profile_user: str, channel: str = "world") -> Path:
+    if not _PROFILE_NAME.fullmatch(profile_user) or not _PROFILE_NAME.fullmatch(channel):
+        raise ValueError(f"Invalid profile or channel name: {profile_user!r}, {channel!r}")
+    return RECOMMENDATIONS_DIR / channel / f"{profile_user}.json"
+
+
+def load_saved(profile_user: str, channel: str = "world"):
+    """The last saved recommendations for profile_user in channel, or None."""
+    try:
+        return json.loads(recommendations_path(profile_user, channel).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+_SAVED_FIELDS = ("profile", "channel", "generated_at", "history_seq", "cache_key")
+
+
+def _save(profile_user: str, channel: str, key: str, result: dict, computed_at: float, history_seq: int) -> None:
+    path = recommendations_path(profile_user, channel)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    saved = {**result, "profile": profile_user, "channel": channel,
+             "generated_at": _iso(computed_at), "history_seq": history_seq, "cache_key": key}
+    tmp = path.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(saved, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+
 
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def _build_request(profile_user: str, channel: str):
+    """(system prompt, user message) for profile_user's recommendations over channel's recent history."""
     raw_prompt = load_prompt()
     prompt = raw_prompt.replace("<user>", profile_user)
-    history = load_conversation_history()
+    history = load_conversation_history(turns=HISTORY_TURNS, channel=channel)
     user_message = (
         f"Use the following conversation history to generate coffee chat recommendations for {profile_user}.\n\n"
         "Conversation history:\n"
@@ -73,16 +111,97 @@ def get_recommendations(profile_user: str):
         "---\n\n"
         "Output only the JSON object with the 'recommendations' array as specified in your instructions."
     )
+    if candidate_rank.TOP_K > 0:
+        from history_store import get_store
+
+        candidates = candidate_rank.shortlist(profile_user, get_store().tail(channel, candidate_rank.RANK_TURNS))
+        shortlist_message = (
+            f"Use the following people from the conversation history to generate coffee chat recommendations for {profile_user}. "
+            "They are pre-ranked by how similar their profile and messages are to yours, "
+            "with each person's messages most relevant to you.\n\n"
+            "Candidates:\n"
+            "---\n"
+            f"{candidate_rank.format_shortlist(candidates)}\n"
+            "---\n\n"
+            "Output only the JSON object with the 'recommendations' array as specified in your instructions."
+        )
+        # A short history is cheaper to send whole
+        if candidates and len(shortlist_message) < len(user_message):
+            user_message = shortlist_message
+    return prompt, user_message
+
+
+def _generate(prompt: str, user_message: str, priority: str = "interactive") -> dict:
+    """The model's recommendations, plus "model": the model that answered (primary or fallback)."""
+    import utils
 
+    model = utils.PRIMARY_MODEL
     try:
-        response = utils.agent_sim(utils.PRIMARY_MODEL, prompt, user_message)
+        response = utils.agent_sim(model, prompt, user_message, priority=priority)
     except Exception:
-        response = utils.agent_sim(utils.FALLBACK_MODEL, prompt, user_message)
+        model = utils.FALLBACK_MODEL
+        response = utils.agent_sim(model, prompt, user_message, priority=priority)
+    return {**extract_json(response), "model": model}
+
+
+def get_recommendations(profile_user: str, channel: str = "world", refresh: bool = False, priority: str = "interactive"):
+    """
+    Generate coffee-chat recommendations for the given profile user.
+    profile_user: e.g. 'Gaurav_Atavale', 'Anagha_Palandye'. Replaces <user> in the prompt.
+    refresh=True skips the cache lookup and always calls the model (rec_precompute.py uses
+    it with priority="reply", so background work does not take the interactive budget).
+    Returns dict with 'recommendations' array, 'model' (the model that answered),
+    'generated_at' (UTC, ISO 8601) and 'cache' ("hit", "stale" or "miss"); raises on error.
+    """
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, str(BACKEND_DIR))
+    import utils
+
+    from history_store import get_store
+
+    recommendations_path(profile_user, channel)  # reject bad names before calling the model
+    history_seq = get_store().last_seq(channel)
+    prompt, user_message = _build_request(profile_user, channel)
+    key = digest(utils.PRIMARY_MODEL, prompt, user_message)
+    slot = (profile_user, channel)
+
+    def key_for(result):
+        """The key of the call that produced result: a fallback answer never matches the primary key."""
+        return digest(result.get("model", utils.PRIMARY_MODEL), prompt, user_message)
+
+    def compute():
+        result = _generate(prompt, user_message, priority)
+        _save(profile_user, channel, key_for(result), result, time.time(), history_seq)
+        return result
+
+    if not REC_CACHE:
+        result, status, computed_at = compute(), "miss", time.time()
+    elif refresh:
+        result, computed_at = _cache.refresh(slot, key, compute, key_for=key_for)
+        status = "miss"
+    else:
+        if _cache.peek(slot) is None:
+            _seed_from_disk(slot, profile_user, channel)
+        result, status, computed_at = _cache.get(slot, key, compute, revalidate=slot not in PRECOMPUTED,
+                                                 key_for=key_for)
+    return {**result, "generated_at": _iso(computed_at), "cache": status}
+
+
+def _seed_from_disk(slot, profile_user: str, channel: str) -> None:
+    """Start from the saved result after a restart, so it can be served while stale."""
+    saved = load_saved(profile_user, channel)
+    if not saved or "cache_key" not in saved:
+        return
+    try:
+        computed_at = datetime.fromisoformat(saved["generated_at"].replace("Z", "+00:00")).timestamp()
+    except (KeyError, ValueError):
+        return
+    result = {k: v for k, v in saved.items() if k not in _SAVED_FIELDS}
+    _cache.put(slot, saved["cache_key"], result, computed_at)
+
 
-    result = extract_json(response)
-    DATA_DIR.mkdir(parents=True, exist_ok=True)
-    RECOMMENDATIONS_OUTPUT.write_text(json.dumps(result, indent=2), encoding="utf-8")
-    return result
+def cache_metrics() -> dict:
+    return _cache.metrics()
 
 
 def extract_json(text: str) -> dict:
@@ -119,7 +238,7 @@ def main():
     history = load_conversation_history()
     try:
         result = get_recommendations("Gaurav_Atavale")
-        print(f"Saved to {RECOMMENDATIONS_OUTPUT}", file=sys.stderr)
+        print(f"Saved to {recommendations_path('Gaurav_Atavale')}", file=sys.stderr)
         print(json.dumps(result, indent=2))
         return result
     except ValueError as e:
@@ -0,0 +1,110 @@
+"""
+Cheap local relevance check that runs before bidding (bidding.collect_bids*).
+
+Each persona's prompt (config/*_persona_prompt.txt) and the last BID_RELEVANCE_TURNS
+messages are turned into TF-IDF vectors; IDF comes from the persona prompts plus those
+messages, so words every persona shares ("interested", "background") count for little
+and distinguishing ones ("investing", "hospital") for a lot. A persona whose cosine
+similarity to the recent conversation is below BID_RELEVANCE_THRESHOLD times the best
+persona's bids 0 without an LLM call. Always kept:
+  - the BID_MIN_CONTENDERS most relevant personas (so there is a runner-up to pick)
+  - anyone named in the latest message (they were asked something)
+
+BID_RELEVANCE_THRESHOLD=0 (the default) turns the filter off. Measure a threshold on
+the recorded histories with scripts/eval_bid_filter.py.
+"""
+import math
+import os
+import re
+from collections import Counter
+
+import agent
+
+THRESHOLD = float(os.environ.get("BID_RELEVANCE_THRESHOLD", "0"))
+RECENT_TURNS = int(os.environ.get("BID_RELEVANCE_TURNS", "3"))
+MIN_CONTENDERS = int(os.environ.get("BID_MIN_CONTENDERS", "2"))
+
+_WORD = re.compile(r"[a-z][a-z0-9+#'-]{2,}")
+_STOPWORDS = frozenset("""
+about above after again against all also and any are aren't because been before being below between both but
+can can't cannot could couldn't did didn't does doesn't doing don't down during each few for from further had
+hadn't has hasn't have haven't having her here hers herself him himself his how i'd i'll i'm i've into isn't
+it's its itself let's more most mustn't myself nor not off once only other ought our ours ourselves out over own
+same shan't she she'd she'll she's should shouldn't some such than that that's the their theirs them themselves
+then there there's these they they'd they'll they're they've this those through too under until very was wasn't
+we'd we'll we're we've were weren't what what's when when's where where's which while who who's whom why why's
+with won't would wouldn't you you'd you'll you're you've your yours yourself yourselves just like really think
+know get got also well yeah yes hey thanks thank great good way much many things thing something make one two
+lot love
+""".split())
+
+
+def tokenize(text: str) -> list:
+    return [w.strip("'-") for w in _WORD.findall(text.lower()) if w.strip("'-") not in _STOPWORDS]
+
+
+def _tfidf(counts: Counter, idf: dict) -> dict:
+    vec = {t: (1 + math.log(c)) * idf.get(t, 0.0) for t, c in counts.items()}
+    norm = math.sqrt(sum(v * v for v in vec.values())) or 1.0
+    return {t: v / norm for t, v in vec.items()}
+
+
+def _cosine(a: dict, b: dict) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(t, 0.0) for t, v in a.items())
+
+
+class RelevanceFilter:
+    """Scores personas against recent messages and picks the ones worth an LLM bid."""
+
+    def __init__(self, persona_texts: dict, roles: dict = None, threshold: float = THRESHOLD,
+                 recent_turns: int = RECENT_TURNS, min_contenders: int = MIN_CONTENDERS):
+        self.persona_counts = {p: Counter(tokenize(text)) for p, text in persona_texts.items()}
+        self.roles = roles or {}
+        self.threshold = threshold
+        self.recent_turns = recent_turns
+        self.min_contenders = min_contenders
+        self.skipped = 0
+        self.kept = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold > 0
+
+    def scores(self, records) -> dict:
+        """Cosine similarity of each persona to the last recent_turns records."""
+        turns = [Counter(tokenize(r.get("content", ""))) for r in records[-self.recent_turns:]]
+        docs = list(self.persona_counts.values()) + turns
+        df = Counter(t for doc in docs for t in doc)
+        idf = {t: math.log((1 + len(docs)) / (1 + n)) + 1 for t, n in df.items()}
+        recent = _tfidf(sum(turns, Counter()), idf)
+        return {p: _cosine(_tfidf(counts, idf), recent) for p, counts in self.persona_counts.items()}
+
+    def contenders(self, persons, records) -> set:
+        """The subset of persons to ask for a bid; everyone when the filter is off or there is no history."""
+        persons = list(persons)
+        if not self.enabled or not records or len(persons) <= self.min_contenders:
+            return set(persons)
+        scores = self.scores(records)
+        ranked = sorted(persons, key=lambda p: scores.get(p, 0.0), reverse=True)
+        best = scores.get(ranked[0], 0.0)
+        keep = set(ranked[:self.min_contenders])
+        keep.update(p for p in persons if scores.get(p, 0.0) >= self.threshold * best)
+        latest = records[-1].get("content", "")
+        keep.update(p for p in persons if self.roles.get(p) and re.search(rf"\b{re.escape(self.roles[p])}\b", latest, re.I))
+        self.kept += len(keep)
+        self.skipped += len(persons) - len(keep)
+        return keep
+
+
+_filter = None
+
+
+def get_filter() -> RelevanceFilter:
+    """The process-wide filter over the personas in config/agents.json."""
+    global _filter
+    if _filter is None:
+        roles = agent.person_roles()
+        _filter = RelevanceFilter({p: agent.get_agent(p).persona_prompt for p in roles}, roles)
+    return _filter
@@ -0,0 +1,134 @@
+"""
+In-memory cache for slow LLM-backed responses (recommendation.get_recommendations).
+
+Entries live in slots (e.g. one per profile and channel) and remember the key they were
+computed for: a digest of everything that went into the LLM call (model, prompt, history
+window). A lookup is:
+  hit    same key and younger than ttl            -> cached value
+  stale  other key or older, but within the stale
+         window (ttl + stale seconds)              -> cached value now, recomputed in the background
+  miss   no entry, or too old                      -> computed in the caller's thread
+Concurrent lookups for one key share a single computation (single flight), and the least
+recently used slots are dropped beyond max_entries. Failed computations are not cached.
+A computation can be stored under another key than the one asked for (key_for), e.g. when
+a fallback model answered: the next lookup for the original key then finds it stale.
+"""
+import hashlib
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+def digest(*parts) -> str:
+    """Stable key for the inputs of one LLM call."""
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(str(part).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class ResponseCache:
+    """TTL + LRU slots with single-flight computation and stale-while-revalidate."""
+
+    def __init__(self, ttl: float, stale: float = 0.0, max_entries: int = 256):
+        self.ttl = ttl
+        self.stale = stale
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # slot -> (key, value, computed_at)
+        self._inflight = {}  # key -> Future
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "stale": 0, "misses": 0, "computed": 0, "shared": 0, "errors": 0}
+
+    def peek(self, slot):
+        """(key, value, computed_at) stored for slot, or None."""
+        with self._lock:
+            return self._entries.get(slot)
+
+    def put(self, slot, key, value, computed_at: float = None) -> None:
+        with self._lock:
+            self._store(slot, key, value, time.time() if computed_at is None else computed_at)
+
+    def _store(self, slot, key, value, computed_at) -> None:
+        current = self._entries.get(slot)
+        if current is not None and current[2] > computed_at:
+            return  # a newer result already landed
+        self._entries[slot] = (key, value, computed_at)
+        self._entries.move_to_end(slot)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, slot, key, compute, revalidate: bool = True, key_for=None):
+        """
+        (value, status, computed_at) for slot, where compute() produces the value for key.
+        status is "hit", "stale" or "miss"; a miss raises whatever compute() raised.
+        revalidate=False serves stale values without a background refresh (for slots that
+        something else keeps up to date). key_for(value), if given, is the key a computed
+        value is stored under (default: key).
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(slot)
+            if entry is not None:
+                self._entries.move_to_end(slot)
+                entry_key, value, computed_at = entry
+                age = now - computed_at
+                if entry_key == key and age < self.ttl:
+                    self.stats["hits"] += 1
+                    return value, "hit", computed_at
+                if age < self.ttl + self.stale:
+                    self.stats["stale"] += 1
+                    if not revalidate:
+                        return value, "stale", computed_at
+                    future, leader = self._flight(key)
+                    if leader:
+                        threading.Thread(target=self._run, args=(slot, key, compute, future, key_for),
+                                         name="cache-revalidate", daemon=True).start()
+                    return value, "stale", computed_at
+            self.stats["misses"] += 1
+            future, leader = self._flight(key)
+        if leader:
+            self._run(slot, key, compute, future, key_for)
+        value, computed_at = future.result()
+        return value, "miss", computed_at
+
+    def refresh(self, slot, key, compute, key_for=None):
+        """(value, computed_at) from a new computation for key, shared with any already in flight."""
+        with self._lock:
+            future, leader = self._flight(key)
+        if leader:
+            self._run(slot, key, compute, future, key_for)
+        return future.result()
+
+    def _flight(self, key):
+        """(future, leader): the computation in progress for key, or a new one this caller must run."""
+        future = self._inflight.get(key)
+        if future is not None:
+            self.stats["shared"] += 1
+            return future, False
+        future = self._inflight[key] = Future()
+        return future, True
+
+    def _run(self, slot, key, compute, future: Future, key_for=None) -> None:
+        try:
+            value = compute()
+        except BaseException as e:
+            with self._lock:
+                self.stats["errors"] += 1
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            if threading.current_thread().name == "cache-revalidate":
+                print(f"[response_cache] background refresh failed: {e}", file=sys.stderr, flush=True)
+            return
+        computed_at = time.time()
+        with self._lock:
+            self.stats["computed"] += 1
+            self._store(slot, key_for(value) if key_for is not None else key, value, computed_at)
+            self._inflight.pop(key, None)
+        future.set_result((value, computed_at))
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {**self.stats, "entries": len(self._entries), "inflight": len(self._inflight)}
@@ -1,145 +1,127 @@
 """
 Final flow of Agentic Social Simulation.
 Supports per-channel conversations: run with --channel finance (or world, technology, healthcare, architecture, computer_science).
+With --continuous (or SIM_CONTINUOUS=1) credits refill over time and the channel never ends (see credits.py).
 """
 import argparse
 import json
 import re
+import signal
 import sys
+import time
 from pathlib import Path
 import utils
+import bidding
+import agent
+import credits
+import history_store
 
 # Paths relative to repo root
 REPO_ROOT = Path(__file__).resolve().parent.parent
 BACKEND_DIR = Path(__file__).resolve().parent
 DATA_DIR = REPO_ROOT / "data"
 
-# Channel -> history filename (must match server.CHANNEL_FILES)
-CHANNEL_FILES = {
-    "world": "conversational_history.txt",
-    "finance": "finance_convers_history.txt",
-    "technology": "tech_convers_history.txt",
-    "healthcare": "healthcare_convers_history.txt",
-    "architecture": "architecture_convers_history.txt",
-    "computer_science": "computer_science_convers_history.txt",
-}
+# Channel list lives in history_store (shared with server.py)
+CHANNEL_FILES = {c: f for c, f in history_store.CHANNEL_FILES.items() if c != "human"}
 
 def _parse_args():
     p = argparse.ArgumentParser(description="Run agent simulation for a channel")
     p.add_argument("--channel", default="world", help="Channel name (world, finance, technology, healthcare, architecture, computer_science)")
+    p.add_argument("--sequential-bids", action="store_true", help="Collect bids one persona at a time instead of concurrently")
+    p.add_argument("--bid-timeout", type=float, default=bidding.BID_TIMEOUT_SECONDS, help="Seconds to wait for each bid before counting it as 0")
+    p.add_argument("--continuous", action="store_true", default=credits.continuous_from_env(),
+                   help="Refill credits over time and never end (credits persist per channel; see credits.py)")
     return p.parse_args()
 
-def _history_file_for_channel(channel: str) -> Path:
-    filename = CHANNEL_FILES.get(channel, CHANNEL_FILES["world"])
-    return (DATA_DIR / filename).resolve()
-
-def _ensure_channel_has_seed(path: Path) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
-    if not path.exists() or path.stat().st_size == 0:
-        with open(path, "w", encoding="utf-8") as f:
-            f.write('{"role": "Gaurav", "content": "Conversation started."}\n')
-
-# Parse channel and set history file for this process (and for utils)
+# Parse channel and point this process (and utils) at its history
 _args = _parse_args()
-_channel = _args.channel
-HISTORY_FILE = _history_file_for_channel(_channel)
-utils.HISTORY_FILE = HISTORY_FILE
-_ensure_channel_has_seed(HISTORY_FILE)
-
-# Mock data for testing
-person_role_dict = {
-    "Gaurav_Atavale": "Gaurav",
-    "Anagha_Palandye": "Anagha",
-    "Kanishkha_S": "Kanishkha",
-    "Nirbhay_R": "Nirbhay"
-    }
-role_person_dict = {v: k for k, v in person_role_dict.items()}
+_channel = history_store.normalize_channel(_args.channel)
+utils.CHANNEL = _channel
+store = history_store.get_store()
+store.ensure_seed(_channel)
 
-file_names_dict = {
-    "Gaurav_Atavale": BACKEND_DIR / "agent_Gaurav.py",
-    "Anagha_Palandye": BACKEND_DIR / "agent_Anagha.py",
-    "Kanishkha_S": BACKEND_DIR / "agent_Kanishkha.py",
-    "Nirbhay_R": BACKEND_DIR / "agent_Nirbhay.py"
-    }
+# Personas come from config/agents.json
+person_role_dict = agent.person_roles()
+role_person_dict = {v: k for k, v in person_role_dict.items()}
 
 # Loop until NO ONE has credits left (everyone is 0)
 # Run iterations of the simulation
-with open(HISTORY_FILE, "r", encoding="utf-8") as f:
-    lines = [ln.strip() for ln in f.readlines() if ln.strip()]
-if not lines:
+last_entry = store.last_record(_channel)
+last_role = (last_entry or {}).get("role")
+if not last_role or last_role not in role_person_dict:
     init_person = list(person_role_dict.keys())[0]
+    print(f"[run.py channel={_channel}] Role '{last_role}' not in dict, using {init_person}")
 else:
-    try:
-        last_entry = json.loads(lines[-1])
-        last_role = last_entry.get("role")
-        if not last_role or last_role not in role_person_dict:
-            init_person = list(person_role_dict.keys())[0]
-            print(f"[run.py channel={_channel}] Role '{last_role}' not in dict, using {init_person}")
-        else:
-            init_person = role_person_dict[last_role]
-    except (json.JSONDecodeError, KeyError) as e:
-        init_person = list(person_role_dict.keys())[0]
-        print(f"[run.py channel={_channel}] Parse error, using {init_person}. Error: {e}") 
-
-credits_left = {key: 100 for key in person_role_dict.keys()}
-print(f"[run.py channel={_channel}] Started. History file: {HISTORY_FILE}", file=sys.stderr, flush=True)
-
-while any(credits_left[key] > 0 for key in credits_left):
-    
-    # FIX: Generate random bid ONLY if credits > 0, else bid is 0
-    random_numbers = {}
-    for key in person_role_dict:
-        if credits_left[key] > 0:
-            try:
-                llm_bid_score = utils.generate_bid_score_each_user(key, credits_left, utils.PRIMARY_MODEL)
-                random_numbers[key] = int(0.01 * float(json.loads(llm_bid_score)["score"]) * credits_left[key])
-                print("primary model worked. Bid score:", random_numbers[key])
-            except Exception:
-                llm_bid_score = utils.generate_bid_score_each_user(key, credits_left, utils.FALLBACK_MODEL)
-                random_numbers[key] = int(0.01 * float(json.loads(llm_bid_score)["score"]) * credits_left[key])
-                print("fallback model worked. Bid score:", random_numbers[key])
-        else:
-            random_numbers[key] = 0  # Can't bid if no credits
+    init_person = role_person_dict[last_role]
 
+# Classic: 100 credits each, game over at 0. Continuous: refilling balances saved per channel
+bank = credits.CreditBank(_channel, person_role_dict) if _args.continuous else None
+credits_left = bank.credits() if bank else {key: 100 for key in person_role_dict.keys()}
 
-    # Check if everyone is out of credits (bids are all 0) to avoid infinite loop or errors
-    if all(val == 0 for val in random_numbers.values()):
-        break
+# SIGTERM (the server's supervisor stopping us) ends the game after the current turn
+_stop_requested = False
 
-    # Select winner
-    selected_person = max(random_numbers, key=random_numbers.get)
-    winning_bid = random_numbers[selected_person]
 
-    # Deduct credits
-    if winning_bid > 0 and selected_person != init_person:
-        # Only deduct if they actually bid something
-        credits_left[selected_person] = max(0, credits_left[selected_person] - winning_bid)
-        print(f"{selected_person} wins with bid {winning_bid} and will chat now.", "Credits left:", credits_left) 
-        agent_script = file_names_dict[selected_person]
-        if not agent_script.exists():
-            print(f"Warning: Agent script not found: {agent_script}")
-            continue
-        with open(agent_script, "r") as f:
-            exec(f.read(), {"REPO_ROOT": REPO_ROOT, "HISTORY_FILE": HISTORY_FILE, "__file__": str(agent_script)})
-        init_person = selected_person
-    elif selected_person == init_person:
-        # second highest value from random_numbers dict
-        second_highest_person = max((k for k in random_numbers if k != selected_person), key=random_numbers.get)
-        selected_person = second_highest_person
-        winning_bid = random_numbers[selected_person]
-        credits_left[selected_person] = max(0, credits_left[selected_person] - winning_bid)
-        print(f"{selected_person} wins with bid {winning_bid} and will chat now.", "Credits left:", credits_left) 
-        agent_script = file_names_dict[selected_person]
-        if not agent_script.exists():
-            print(f"Warning: Agent script not found: {agent_script}")
+def _request_stop(signum, frame):
+    global _stop_requested
+    _stop_requested = True
+
+
+signal.signal(signal.SIGTERM, _request_stop)
+
+
+def _pause(seconds: float) -> None:
+    """Sleep in short steps so SIGTERM still stops us promptly."""
+    deadline = time.monotonic() + seconds
+    while not _stop_requested and time.monotonic() < deadline:
+        time.sleep(min(1.0, deadline - time.monotonic()))
+
+
+print(f"[run.py channel={_channel}] Started. History store: {type(store).__name__}", file=sys.stderr, flush=True)
+
+round_num = 0
+while not _stop_requested and (bank is not None or any(credits_left[key] > 0 for key in credits_left)):
+    round_num += 1
+    if round_num % 10 == 0:
+        print(f"[run.py channel={_channel}] LLM metrics: {json.dumps(utils.llm_metrics())}", file=sys.stderr, flush=True)
+
+    if bank is not None:
+        # Only personas who can afford a turn bid; if nobody can, wait for the refill
+        credits_left = bank.biddable()
+        if not any(credits_left.values()):
+            _pause(bank.seconds_until_biddable())
             continue
-        with open(agent_script, "r") as f:
-            exec(f.read(), {"REPO_ROOT": REPO_ROOT, "HISTORY_FILE": HISTORY_FILE, "__file__": str(agent_script)})
-        init_person = selected_person        
-    else:
+
+    # Bid only if credits > 0 (else bid is 0); all bids go out at once unless --sequential-bids
+    random_numbers = bidding.collect_bids(
+        list(person_role_dict), credits_left,
+        concurrent=not _args.sequential_bids, timeout=_args.bid_timeout, channel=_channel,
+        last_person=init_person,
+    )
+
+    # Check if everyone is out of credits (bids are all 0) to avoid infinite loop or errors
+    if all(val == 0 for val in random_numbers.values()):
+        if bank is None:
+            break
+        _pause(bank.turn_interval())  # nobody wants to talk; ask again at the sustained turn rate
+        continue
+
+    # Highest bidder speaks; if they spoke last, the runner-up does
+    choice = bidding.select_speaker(random_numbers, init_person)
+    if choice is None:
         print("No valid bids this round.")
         continue
+    selected_person, winning_bid = choice
+    if bank is not None:
+        bank.spend(selected_person, winning_bid)
+        credits_left = bank.credits()
+    else:
+        credits_left[selected_person] = max(0, credits_left[selected_person] - winning_bid)
+    print(f"{selected_person} wins with bid {winning_bid} and will chat now.", "Credits left:", credits_left) 
+    agent.get_agent(selected_person).speak(_channel)
+    init_person = selected_person
         
     # time.sleep(3)
 
-print("Game Over. Final Credits:", credits_left)
\ No newline at end of file
+print("Stopped." if _stop_requested else "Game Over.", "Final Credits:", bank.credits() if bank else credits_left)
+print(f"[run.py channel={_channel}] LLM metrics: {json.dumps(utils.llm_metrics())}", file=sys.stderr, flush=True)
\ No newline at end of file
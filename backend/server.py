@@ -9,7 +9,6 @@ import signal
 import socket
 import subprocess
 import sys
-import threading
 import time
 from pathlib import Path
 
@@ -68,97 +67,50 @@ DATA_DIR = REPO_ROOT / "data"
 FRONTEND_DIR = REPO_ROOT / "frontend"
 CONFIG_DIR = REPO_ROOT / "config"
 
-# Channel -> history filename (under data/)
-CHANNEL_FILES = {
-    "world": "conversational_history.txt",
-    "finance": "finance_convers_history.txt",
-    "technology": "tech_convers_history.txt",
-    "healthcare": "healthcare_convers_history.txt",
-    "architecture": "architecture_convers_history.txt",
-    "computer_science": "computer_science_convers_history.txt",
-    "human": "human_convers_history.txt",
-}
-
-def _history_file_for_channel(channel: str) -> Path:
-    """Resolve channel to absolute path of its history file; default to world if unknown."""
-    filename = CHANNEL_FILES.get(channel, CHANNEL_FILES["world"])
-    return (DATA_DIR / filename).resolve()
+# Channel -> history filename (under data/); defined once in history_store
+from history_store import CHANNEL_FILES, get_store, normalize_channel
+from history_writer import get_writer
 
 from fastapi import FastAPI, Request
-from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 
+from broadcaster import ChannelBroadcaster
+from engine import SimulationEngine
+from supervisor import EngineWorker, ProcessWorker, Supervisor
+from utils import llm_metrics
+from recommendation import cache_metrics as recommendation_cache_metrics
+from rec_precompute import RecommendationPrecomputer
+
 app = FastAPI(title="Agentic Social – world_chat")
 
-# One run.py process per channel (world, finance, technology, healthcare, architecture, computer_science)
+# One simulation per channel (world, finance, technology, healthcare, architecture, computer_science)
 SIMULATION_CHANNELS = [c for c in CHANNEL_FILES if c != "human"]
-_run_processes: dict = {}
+# "process": one run.py per channel; "engine": all channels as tasks in this process (engine.py)
+SIMULATION_MODE = os.environ.get("SIMULATION_MODE", "process").strip().lower()
+_engine = None
+# Restarts, backs off and drains the per-channel simulations (supervisor.py)
+_supervisor = None
 
+# One history watcher per channel, shared by all SSE connections to that channel
+_broadcasters: dict = {}
+# Recomputes every profile's recommendations as channels grow (rec_precompute.py)
+_precomputer = None
 
-def _load_history(history_path: Path):
-    """Return list of {role, content, timestamp} from the given history file."""
-    if not history_path.exists():
-        return []
-    out = []
-    try:
-        with open(history_path, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-            for i, line in enumerate(lines):
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    entry = json.loads(line)
-                    timestamp = entry.get("timestamp")
-                    if not timestamp:
-                        from datetime import datetime, timedelta
-                        base_time = datetime.utcnow() - timedelta(seconds=len(lines) * 3)
-                        timestamp = (base_time + timedelta(seconds=i * 3)).isoformat() + "Z"
-                    out.append({
-                        "role": entry.get("role", ""),
-                        "content": entry.get("content", ""),
-                        "timestamp": timestamp
-                    })
-                except json.JSONDecodeError:
-                    continue
-    except OSError:
-        return []
-    return out
-
-
-def _stream_new_lines(history_path: Path):
-    """Generator: poll history_path and yield SSE only for new lines (since connection)."""
-    try:
-        if history_path.exists():
-            with open(history_path, "r", encoding="utf-8") as f:
-                last_count = sum(1 for ln in f if ln.strip())
-        else:
-            last_count = 0
-    except OSError:
-        last_count = 0
-    while True:
-        try:
-            if history_path.exists():
-                with open(history_path, "r", encoding="utf-8") as f:
-                    lines = [ln.strip() for ln in f if ln.strip()]
-                for i in range(last_count, len(lines)):
-                    try:
-                        entry = json.loads(lines[i])
-                        from datetime import datetime
-                        timestamp = entry.get("timestamp") or datetime.utcnow().isoformat() + "Z"
-                        ev = {
-                            "type": "message",
-                            "role": entry.get("role", ""),
-                            "content": entry.get("content", ""),
-                            "timestamp": timestamp
-                        }
-                        yield f"data: {json.dumps(ev)}\n\n"
-                    except json.JSONDecodeError:
-                        pass
-                last_count = len(lines)
-        except OSError:
-            pass
-        time.sleep(0.5)
+
+def _broadcaster_for_channel(channel: str) -> ChannelBroadcaster:
+    """Return the channel's broadcaster (unknown channels share world's)."""
+    channel = normalize_channel(channel)
+    b = _broadcasters.get(channel)
+    if b is None:
+        b = ChannelBroadcaster(channel, get_store().follower(channel))
+        _broadcasters[channel] = b
+        b.start()
+    return b
+
+
+HISTORY_PAGE_DEFAULT = 100
+HISTORY_PAGE_MAX = 1000
 
 
 @app.get("/")
@@ -174,51 +126,105 @@ async def serve_index():
 
 
 @app.get("/api/history")
-async def api_history(channel: str = "world"):
-    """Return full conversation history for the given channel (world, finance, technology, healthcare, architecture, computer_science, human)."""
-    path = _history_file_for_channel(channel)
-    messages = _load_history(path)
+async def api_history(
+    request: Request,
+    channel: str = "world",
+    limit: int = HISTORY_PAGE_DEFAULT,
+    before: int | None = None,
+    after: int | None = None,
+):
+    """Return one page of conversation history for the given channel (world, finance, technology, healthcare, architecture, computer_science, human).
+    Default is the latest `limit` messages; `before=<seq>` pages back, `after=<seq>` pages forward.
+    Served from the history store; the ETag changes only when the channel's history does (304 otherwise)."""
+    channel = normalize_channel(channel)
+    store = get_store()
+    version = await asyncio.to_thread(store.version, channel)
+    etag = f'"{version or "empty"}"'
+    headers = {"Cache-Control": "no-cache", "ETag": etag}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    limit = max(1, min(limit, HISTORY_PAGE_MAX))
+    records, has_older, has_newer = await asyncio.to_thread(store.page, channel, limit, before, after)
+    messages = [
+        {
+            "role": entry.get("role", ""),
+            "content": entry.get("content", ""),
+            "timestamp": entry.get("timestamp"),
+            "seq": entry["seq"],
+        }
+        for entry in records
+    ]
     return JSONResponse(
-        content={"messages": messages},
-        headers={"Cache-Control": "no-store, no-cache, must-revalidate"},
+        content={"messages": messages, "has_older": has_older, "has_newer": has_newer},
+        headers=headers,
     )
 
 
 @app.get("/api/history/stream")
-async def api_history_stream(channel: str = "world"):
-    """SSE: emit new messages as they are appended to the channel's history file."""
-    path = _history_file_for_channel(channel)
-
-    def gen():
-        for chunk in _stream_new_lines(path):
-            yield chunk
-
+async def api_history_stream(request: Request, channel: str = "world", after: int | None = None):
+    """SSE: emit new messages as they are appended to the channel's history file.
+    Each event's id is the record's seq. On reconnect the browser sends Last-Event-ID (or the
+    client passes ?after=<seq>) and only the missed records are replayed before live events;
+    more than broadcaster.REPLAY_LIMIT missed records get a "reset" event (reload /api/history).
+    Async end to end (no threadpool worker per connection); idle connections get heartbeat comments."""
+    last_event_id = request.headers.get("last-event-id", "").strip()
+    after_seq = int(last_event_id) if last_event_id.isdigit() else after
+    broadcaster = _broadcaster_for_channel(channel)
+    sub = broadcaster.subscribe()
     return StreamingResponse(
-        gen(),
+        broadcaster.stream(sub, after_seq=after_seq, is_disconnected=request.is_disconnected),
         media_type="text/event-stream",
         headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "Connection": "keep-alive"},
     )
 
 
+@app.get("/metrics")
+async def metrics():
+    """Per-channel SSE fan-out stats (subscribers, events published, dropped events), history writer batches, LLM rate limits, this process's LLM calls and prompt-cache usage, and the recommendation cache."""
+    # One read of the rate-limit state files (flock'd I/O), off the event loop
+    llm = await asyncio.to_thread(llm_metrics)
+    return {
+        "channels": {ch: b.metrics() for ch, b in _broadcasters.items()},
+        "history_writer": get_writer().metrics(),
+        "engine": _engine.status() if _engine is not None else None,
+        "llm_rate_limits": llm.pop("rate_limits"),
+        "llm": llm,
+        "recommendation_cache": recommendation_cache_metrics(),
+        "recommendation_precompute": _precomputer.status() if _precomputer is not None else None,
+    }
+
+
+@app.get("/api/workers")
+async def api_workers():
+    """Per-channel simulation workers: state, pid, uptime, restarts, turn rate, last error."""
+    if _supervisor is None:
+        return {"mode": SIMULATION_MODE, "workers": {}}
+    return {"mode": SIMULATION_MODE, **_supervisor.status()}
+
+
+@app.post("/api/workers/{channel}/restart")
+async def api_restart_worker(channel: str):
+    """Restart one channel's worker now (also clears a "failed" state after too many crashes)."""
+    if _supervisor is None or not await _supervisor.restart(channel):
+        return JSONResponse(content={"ok": False, "error": f"no worker for channel {channel!r}"}, status_code=404)
+    return {"ok": True, "channel": channel}
+
+
 @app.post("/api/history/human")
 async def api_human_message(request: Request):
-    """Append a human user message to human_convers_history.txt and return it."""
+    """Append a human user message to the human channel's history and return it."""
     try:
         body = await request.json()
         content = (body.get("content") or body.get("text") or "").strip()
         if not content:
             return {"ok": False, "error": "content required"}
-        path = _history_file_for_channel("human")
-        path.parent.mkdir(parents=True, exist_ok=True)
         from datetime import datetime
         entry = {
             "role": "Human",
             "content": content,
             "timestamp": datetime.utcnow().isoformat() + "Z",
         }
-        line = json.dumps(entry) + "\n"
-        with open(path, "a", encoding="utf-8") as f:
-            f.write(line)
+        [entry] = await get_writer().append_async("human", [entry])
         return {"ok": True, "message": entry}
     except Exception as e:
         return {"ok": False, "error": str(e)}
@@ -233,41 +239,62 @@ PROFILE_USER_IDS = {
 }
 
 
-def _run_recommendations_sync(profile_user_id: str):
+def _run_recommendations_sync(profile_user_id: str, channel: str = "world", refresh: bool = False):
     """Run blocking get_recommendations in a way safe for async."""
     from recommendation import get_recommendations
-    return get_recommendations(profile_user_id)
+    return get_recommendations(profile_user_id, channel=channel, refresh=refresh)
 
 
 @app.get("/api/recommendations")
-async def api_get_recommendations():
-    """Return last saved recommendations from data/recommendations.json (for quick display or fallback)."""
-    rec_file = DATA_DIR / "recommendations.json"
-    if not rec_file.exists():
-        return {"recommendations": []}
-    try:
-        data = json.loads(rec_file.read_text(encoding="utf-8"))
-        return data
-    except Exception:
-        return {"recommendations": []}
+async def api_get_recommendations(user: str = "Gaurav", channel: str = "world"):
+    """
+    Return the profile's precomputed recommendations (data/recommendations/<channel>/<profile>.json)
+    without an LLM call, with their freshness: generated_at, age_seconds and turns_behind
+    (messages added to the channel since). Empty with generated_at null if none exist yet.
+    """
+    from datetime import datetime
+    from recommendation import load_saved
+    profile_user_id = PROFILE_USER_IDS.get(user) or user
+    channel = normalize_channel(channel)
+    saved = await asyncio.to_thread(load_saved, profile_user_id, channel)
+    if not saved:
+        return {"recommendations": [], "generated_at": None, "age_seconds": None, "turns_behind": None}
+    last_seq = await asyncio.to_thread(get_store().last_seq, channel)
+    generated = datetime.fromisoformat(saved["generated_at"].replace("Z", "+00:00"))
+    saved["age_seconds"] = round(time.time() - generated.timestamp(), 1)
+    saved["turns_behind"] = max(0, last_seq - saved["history_seq"]) if "history_seq" in saved else None
+    return saved
 
 
 @app.post("/api/recommendations")
 async def api_recommendations(request: Request):
-    """Generate coffee-chat recommendations for the selected profile. Body: { \"user\": \"Gaurav\" } or internal id."""
+    """Generate coffee-chat recommendations for the selected profile. Body: { \"user\": \"Gaurav\", \"channel\"?: \"world\", \"refresh\"?: false } or internal id. Cached per profile and channel."""
     try:
         body = await request.json()
     except Exception:
         body = {}
     profile = (body.get("user") or "").strip() or "Gaurav"
     profile_user_id = PROFILE_USER_IDS.get(profile) or profile
+    channel = normalize_channel(body.get("channel") or "world")
     try:
-        result = await asyncio.to_thread(_run_recommendations_sync, profile_user_id)
+        result = await asyncio.to_thread(_run_recommendations_sync, profile_user_id, channel, bool(body.get("refresh")))
         return result
     except Exception as e:
         return JSONResponse(content={"error": str(e), "recommendations": []}, status_code=500)
 
 
+@app.get("/api/matches")
+async def api_matches(user: str = "Gaurav", k: int = 5):
+    """The k profiles most similar to user's, from the profile index over data/*.json (profile_index.py); no LLM call."""
+    from profile_index import top_matches
+    profile_user_id = PROFILE_USER_IDS.get(user) or user
+    try:
+        matches = await asyncio.to_thread(top_matches, profile_user_id, max(1, min(k, 100)))
+    except KeyError as e:
+        return JSONResponse(content={"error": str(e.args[0]), "matches": []}, status_code=404)
+    return {"user": profile_user_id, "matches": [{"user": name, "score": round(score, 4)} for name, score in matches]}
+
+
 @app.get("/health")
 async def health():
     return {"status": "ok"}
@@ -546,56 +573,40 @@ PROFILE_PICTURES_DIR.mkdir(parents=True, exist_ok=True)
 app.mount("/profile_pictures", StaticFiles(directory=str(PROFILE_PICTURES_DIR)), name="profile_pictures")
 
 
-def _ensure_history_file_exists(channel: str):
-    """Ensure the channel's history file exists with at least one line so run.py can read last speaker."""
-    path = _history_file_for_channel(channel)
-    path.parent.mkdir(parents=True, exist_ok=True)
-    if not path.exists() or path.stat().st_size == 0:
-        with open(path, "w", encoding="utf-8") as f:
-            f.write('{"role": "Gaurav", "content": "Conversation started."}\n')
-        print(f"Created seed line for channel: {channel}")
-
-
-def _start_run_py_for_channel(channel: str):
-    """Start run.py for one channel in the background (bidding + agents write to that channel's history file)."""
-    global _run_processes
-    if channel in _run_processes and _run_processes[channel].poll() is None:
-        return
-    run_py = BASE_DIR / "run.py"
-    if not run_py.exists():
-        print("Warning: run.py not found, skipping auto-start")
-        return
-    _ensure_history_file_exists(channel)
-    env = os.environ.copy()
-    proc = subprocess.Popen(
-        [sys.executable, str(run_py), "--channel", channel],
-        cwd=str(BASE_DIR),
-        env=env,
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.PIPE,
-    )
-    _run_processes[channel] = proc
-
-    def log_stderr():
-        if proc.stderr:
-            for line in iter(proc.stderr.readline, ""):
-                if line:
-                    sys.stderr.write("[run.py %s] " % channel + line.decode("utf-8", errors="replace"))
-            proc.stderr.close()
-
-    t = threading.Thread(target=log_stderr, daemon=True)
-    t.start()
-    print("Started run.py for channel '%s' (PID %s)." % (channel, proc.pid))
-
-
 @app.on_event("startup")
 async def startup():
-    global _PORT
-    for ch in SIMULATION_CHANNELS:
-        _start_run_py_for_channel(ch)
+    global _PORT, _engine, _supervisor, _precomputer
+    if SIMULATION_MODE == "engine":
+        _engine = SimulationEngine()
+        _supervisor = Supervisor(SIMULATION_CHANNELS, lambda ch: EngineWorker(_engine, ch))
+    else:
+        _supervisor = Supervisor(SIMULATION_CHANNELS, ProcessWorker)
+    _supervisor.start()
+    for ch in CHANNEL_FILES:
+        _broadcaster_for_channel(ch)
+    _precomputer = RecommendationPrecomputer(PROFILE_USER_IDS.values())
+    _precomputer.start()
     print("Agentic Social – world_chat")
     print(f"  UI: http://localhost{'' if _PORT == 80 else ':' + str(_PORT)}")
-    print("  One run.py per tab (world, finance, technology, healthcare, architecture, computer_science); each stream updates its tab.")
+    if _engine is not None:
+        print(f"  In-process engine: {len(SIMULATION_CHANNELS)} channel simulations in this server process; each stream updates its tab.")
+    else:
+        print("  One run.py per tab (world, finance, technology, healthcare, architecture, computer_science); each stream updates its tab. Workers: /api/workers")
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    # Let every simulation finish its current turn (up to WORKER_DRAIN_SECONDS) before closing the writer
+    if _supervisor is not None:
+        await _supervisor.stop()
+    if _engine is not None:
+        await _engine.stop()
+    if _precomputer is not None:
+        await _precomputer.stop()
+    for b in list(_broadcasters.values()):
+        await b.stop()
+    _broadcasters.clear()
+    await asyncio.to_thread(get_writer().close)
 
 
 def main():
@@ -0,0 +1,314 @@
+"""
+Keeps one simulation worker per channel alive: a run.py process, or an engine task.
+
+  - A worker that ends is started again: after RESTART_DELAY when it ended cleanly
+    (credits ran out, so a new game begins), or after an exponential backoff with
+    jitter (BACKOFF_BASE doubling up to BACKOFF_MAX) when it crashed. The backoff
+    resets once a worker has stayed up for STABLE_SECONDS.
+  - A channel that crashes more than RESTART_BUDGET times within BUDGET_WINDOW seconds
+    is marked "failed" and left stopped until restarted by hand
+    (POST /api/workers/<channel>/restart), instead of crash-looping.
+  - At most MAX_STARTING workers start at the same time, so a cold boot or a burst of
+    restarts cannot starve the server of CPU.
+  - stop() asks every worker to finish its current turn (SIGTERM for run.py), waits
+    up to DRAIN_SECONDS, then kills whatever is left.
+
+status() (GET /api/workers) reports each channel's state, pid, uptime, restarts,
+turn rate and last error.
+"""
+import asyncio
+import collections
+import os
+import random
+import signal
+import sys
+import time
+from pathlib import Path
+
+from history_store import get_store
+
+BACKEND_DIR = Path(__file__).resolve().parent
+RUN_PY = BACKEND_DIR / "run.py"
+
+RESTART_DELAY = float(os.environ.get("WORKER_RESTART_DELAY", "5"))
+BACKOFF_BASE = float(os.environ.get("WORKER_BACKOFF_BASE", "2"))
+BACKOFF_MAX = float(os.environ.get("WORKER_BACKOFF_MAX", "300"))
+STABLE_SECONDS = float(os.environ.get("WORKER_STABLE_SECONDS", "60"))
+RESTART_BUDGET = int(os.environ.get("WORKER_RESTART_BUDGET", "5"))
+BUDGET_WINDOW = float(os.environ.get("WORKER_BUDGET_WINDOW", "600"))
+MAX_STARTING = int(os.environ.get("WORKER_MAX_STARTING", "2"))
+START_TIMEOUT = 60.0
+DRAIN_SECONDS = float(os.environ.get("WORKER_DRAIN_SECONDS", "30"))
+# How often turn counts are sampled, and the window the turn rate is averaged over
+SAMPLE_SECONDS = 5.0
+RATE_WINDOW = 300.0
+
+
+class ProcessWorker:
+    """One `run.py --channel <channel>` process; its stderr is forwarded to ours."""
+
+    def __init__(self, channel: str):
+        self.channel = channel
+        self.proc = None
+        self.stderr_tail = collections.deque(maxlen=20)
+        self._ready = asyncio.Event()
+        self._reader = None
+
+    @property
+    def pid(self):
+        return self.proc.pid if self.proc else None
+
+    async def start(self) -> None:
+        """Launch run.py; return once it reports it has started (or has already exited)."""
+        await asyncio.to_thread(get_store().ensure_seed, self.channel)
+        self.proc = await asyncio.create_subprocess_exec(
+            sys.executable, str(RUN_PY), "--channel", self.channel,
+            cwd=str(BACKEND_DIR), env=os.environ.copy(),
+            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE,
+            start_new_session=True,  # Ctrl-C reaches only the server, which drains us with SIGTERM
+        )
+        self._reader = asyncio.create_task(self._read_stderr())
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout=START_TIMEOUT)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _read_stderr(self) -> None:
+        async for raw in self.proc.stderr:
+            line = raw.decode("utf-8", errors="replace")
+            sys.stderr.write(f"[run.py {self.channel}] {line}")
+            self.stderr_tail.append(line.rstrip())
+            if "Started." in line:
+                self._ready.set()
+        self._ready.set()
+
+    async def wait(self):
+        """Wait for the process to exit. Returns (clean, error)."""
+        code = await self.proc.wait()
+        await self._reader
+        if code == 0:
+            return True, None
+        detail = next((ln for ln in reversed(self.stderr_tail) if ln and not ln.startswith(" ")), "")
+        return False, f"exit code {code}" + (f": {detail}" if detail else "")
+
+    async def stop(self, drain_seconds: float) -> None:
+        """SIGTERM (run.py finishes its turn), then SIGKILL after drain_seconds."""
+        if self.proc is None or self.proc.returncode is not None:
+            return
+        self.proc.send_signal(signal.SIGTERM)
+        try:
+            await asyncio.wait_for(self.proc.wait(), timeout=drain_seconds)
+        except asyncio.TimeoutError:
+            self.proc.kill()
+            await self.proc.wait()
+
+
+class EngineWorker:
+    """One channel of an in-process SimulationEngine (engine.py)."""
+
+    def __init__(self, engine, channel: str):
+        self.engine = engine
+        self.channel = channel
+        self.sim = None
+        self.pid = os.getpid()
+
+    async def start(self) -> None:
+        self.sim = self.engine.start_channel(self.channel)
+        while self.sim.state == "starting" and not self.sim.task.done():
+            await asyncio.sleep(0.05)
+
+    async def wait(self):
+        try:
+            await asyncio.shield(self.sim.task)
+        except asyncio.CancelledError:
+            if not self.sim.task.cancelled():
+                raise  # we were cancelled, not the simulation
+        if self.sim.state == "failed":
+            return False, self.sim.last_error
+        return True, None
+
+    async def stop(self, drain_seconds: float) -> None:
+        if self.sim is None or self.sim.task.done():
+            return
+        self.sim.request_stop()
+        try:
+            await asyncio.wait_for(asyncio.shield(self.sim.task), timeout=drain_seconds)
+        except asyncio.TimeoutError:
+            self.sim.task.cancel()
+            await asyncio.gather(self.sim.task, return_exceptions=True)
+
+
+class WorkerRecord:
+    """Supervision state and stats for one channel (what /api/workers shows)."""
+
+    def __init__(self, channel: str):
+        self.channel = channel
+        self.state = "pending"  # starting, running, backoff, restarting, failed, stopping, stopped
+        self.worker = None
+        self.started_at = None
+        self.starts = 0
+        self.clean_exits = 0
+        self.crashes = 0
+        self.consecutive_crashes = 0
+        self.crash_times = collections.deque()
+        self.last_error = None
+        self.last_error_at = None
+        self.next_start_at = None
+        self.samples = collections.deque()  # (time, last seq)
+        self.wake = asyncio.Event()  # manual restart
+
+    def turn_stats(self) -> dict:
+        if len(self.samples) < 2:
+            return {"turns_per_minute": None, "last_turn_seq": self.samples[-1][1] if self.samples else None}
+        (t0, s0), (t1, s1) = self.samples[0], self.samples[-1]
+        rate = (s1 - s0) / (t1 - t0) * 60 if t1 > t0 else None
+        return {"turns_per_minute": round(rate, 2) if rate is not None else None, "last_turn_seq": s1}
+
+    def status(self) -> dict:
+        now = time.time()
+        running = self.state == "running" and self.started_at
+        return {
+            "state": self.state,
+            "pid": self.worker.pid if self.worker and running else None,
+            "uptime_seconds": round(now - self.started_at, 1) if running else None,
+            "starts": self.starts,
+            "restarts": max(0, self.starts - 1),
+            "clean_exits": self.clean_exits,
+            "crashes": self.crashes,
+            "crashes_in_budget_window": len(self.crash_times),
+            "next_start_in_seconds": round(max(0.0, self.next_start_at - now), 1) if self.next_start_at else None,
+            "last_error": self.last_error,
+            "last_error_at": self.last_error_at,
+            **self.turn_stats(),
+        }
+
+
+class Supervisor:
+    def __init__(self, channels, make_worker):
+        """make_worker(channel) builds a fresh worker (ProcessWorker or EngineWorker) for each start."""
+        self.channels = list(channels)
+        self.make_worker = make_worker
+        self.records = {ch: WorkerRecord(ch) for ch in self.channels}
+        self._starting = asyncio.Semaphore(MAX_STARTING)
+        self._stopping = False
+        self._tasks = []
+
+    def start(self) -> None:
+        for ch in self.channels:
+            self._tasks.append(asyncio.create_task(self._supervise(self.records[ch]), name=f"supervise-{ch}"))
+        self._tasks.append(asyncio.create_task(self._sample_turns(), name="supervise-turns"))
+
+    async def _pause(self, rec: WorkerRecord, seconds: float = None) -> None:
+        """Sleep until seconds pass (forever if None) or restart() wakes the channel."""
+        rec.next_start_at = time.time() + seconds if seconds is not None else None
+        try:
+            await asyncio.wait_for(rec.wake.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+        rec.next_start_at = None
+
+    async def _supervise(self, rec: WorkerRecord) -> None:
+        while not self._stopping:
+            rec.state = "starting"
+            rec.wake.clear()
+            worker = self.make_worker(rec.channel)
+            rec.worker = worker
+            try:
+                async with self._starting:
+                    await worker.start()
+                rec.state = "running"
+                rec.started_at = time.time()
+                rec.starts += 1
+                clean, error = await worker.wait()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                clean, error = False, f"{type(e).__name__}: {e}"
+            if self._stopping:
+                break
+
+            now = time.time()
+            uptime = now - rec.started_at if rec.started_at else 0.0
+            rec.started_at = None
+            if clean:
+                rec.clean_exits += 1
+                rec.consecutive_crashes = 0
+                rec.state = "restarting"
+                await self._pause(rec, RESTART_DELAY)
+                continue
+
+            rec.crashes += 1
+            rec.last_error, rec.last_error_at = error, now
+            print(f"[supervisor] {rec.channel} crashed: {error}", file=sys.stderr, flush=True)
+            if uptime >= STABLE_SECONDS:
+                rec.consecutive_crashes = 0
+            rec.consecutive_crashes += 1
+            rec.crash_times.append(now)
+            while rec.crash_times and rec.crash_times[0] < now - BUDGET_WINDOW:
+                rec.crash_times.popleft()
+            if len(rec.crash_times) > RESTART_BUDGET:
+                rec.state = "failed"
+                print(f"[supervisor] {rec.channel}: {len(rec.crash_times)} crashes in {BUDGET_WINDOW:.0f}s, "
+                      f"not restarting (POST /api/workers/{rec.channel}/restart)", file=sys.stderr, flush=True)
+                await self._pause(rec)
+                rec.crash_times.clear()
+                rec.consecutive_crashes = 0
+                continue
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (rec.consecutive_crashes - 1))
+            rec.state = "backoff"
+            await self._pause(rec, delay * random.uniform(0.8, 1.2))
+        rec.state = "stopped"
+
+    async def _sample_turns(self) -> None:
+        """Record each channel's last seq periodically, for turns_per_minute."""
+        store = get_store()
+        while True:
+            now = time.time()
+            for rec in self.records.values():
+                try:
+                    seq = await asyncio.to_thread(store.last_seq, rec.channel)
+                except Exception:
+                    continue
+                rec.samples.append((now, seq))
+                while len(rec.samples) > 2 and rec.samples[0][0] < now - RATE_WINDOW:
+                    rec.samples.popleft()
+            await asyncio.sleep(SAMPLE_SECONDS)
+
+    async def restart(self, channel: str) -> bool:
+        """Restart channel now: stop a running worker gracefully, or skip a pending backoff / failed state."""
+        rec = self.records.get(channel)
+        if rec is None:
+            return False
+        if rec.state == "running" and rec.worker is not None:
+            await rec.worker.stop(DRAIN_SECONDS)
+            # Its exit is seen as clean; skip the usual restart delay
+        rec.crash_times.clear()
+        rec.consecutive_crashes = 0
+        rec.wake.set()
+        return True
+
+    async def stop(self, drain_seconds: float = DRAIN_SECONDS) -> None:
+        """Stop supervising, drain every running worker (finish the current turn), then cancel."""
+        self._stopping = True
+        running = [rec for rec in self.records.values() if rec.worker is not None and rec.state in ("starting", "running")]
+        for rec in running:
+            rec.state = "stopping"
+        await asyncio.gather(*(rec.worker.stop(drain_seconds) for rec in running), return_exceptions=True)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for rec in self.records.values():
+            rec.state = "stopped"
+
+    def status(self) -> dict:
+        return {
+            "workers": {ch: rec.status() for ch, rec in self.records.items()},
+            "policy": {
+                "restart_delay_seconds": RESTART_DELAY,
+                "backoff_base_seconds": BACKOFF_BASE,
+                "backoff_max_seconds": BACKOFF_MAX,
+                "restart_budget": RESTART_BUDGET,
+                "budget_window_seconds": BUDGET_WINDOW,
+                "drain_seconds": DRAIN_SECONDS,
+            },
+        }
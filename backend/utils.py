@@ -1,11 +1,18 @@
+import asyncio
 import json
 import os
 import re
+import sys
+import threading
+import time
 from pathlib import Path
 
+from history_store import get_store
+
 # Paths relative to repo root
 REPO_ROOT = Path(__file__).resolve().parent.parent
-HISTORY_FILE = REPO_ROOT / "data" / "conversational_history.txt"
+# Channel whose history bids and replies read (run.py sets this from --channel)
+CHANNEL = "world"
 CONFIG_DIR = REPO_ROOT / "config"
 
 # Model config: single source of truth from config/models.json (used for bidding + agent responses)
@@ -28,16 +35,18 @@ except ImportError:
     pass
 
 import anthropic
-from groq import Groq
+import groq
+from groq import AsyncGroq, Groq
+
+from rate_limit import estimate_tokens, get_llm_limiter
+
+# Provider 429s; they make the limiter back off every process (see rate_limit.py)
+_RATE_LIMIT_ERRORS = (anthropic.RateLimitError, groq.RateLimitError)
 
 
 def read_recent_history(turns=10):
-    if not HISTORY_FILE.exists():
-        return []
-    with open(HISTORY_FILE, "r", encoding="utf-8") as f:
-        lines = f.readlines()
-        recent_history = [json.loads(line) for line in lines[-turns:] if line.strip()]  # Last 'turns' turns
-    return recent_history
+    # Last 'turns' turns of the current channel
+    return get_store().tail(CHANNEL, turns)
 
 
 # def format_history_as_string(turns = 10):
@@ -51,37 +60,16 @@ def read_recent_history(turns=10):
 #             formatted_string += f"{entry['role'].capitalize()}: {entry['content']}\n"
             
 #     return formatted_string
-def format_history_as_string(turns=10):
-    formatted_string = ""
-    
-    try:
-        if not HISTORY_FILE.exists():
-            return "No history found."
-        with open(HISTORY_FILE, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-            # Take the last N lines
-            lines = lines[-turns:]
-            
-            for line in lines:
-                # 1. Strip whitespace
-                line = line.strip()
-                
-                # 2. Skip if empty
-                if not line:
-                    continue
-                
-                try:
-                    entry = json.loads(line)
-                    role = entry.get('role', 'Unknown').capitalize()
-                    content = entry.get('content', '')
-                    formatted_string += f"{role}: {content}\n"
-                except json.JSONDecodeError:
-                    print(f"Skipping invalid JSON line: {line}")
-                    continue
-                    
-    except FileNotFoundError:
+def format_history_as_string(turns=10, channel=None):
+    # Only the last N records are read, however long the channel is
+    records = get_store().tail(channel or CHANNEL, turns)
+    if not records:
         return "No history found."
-            
+    formatted_string = ""
+    for entry in records:
+        role = entry.get('role', 'Unknown').capitalize()
+        content = entry.get('content', '')
+        formatted_string += f"{role}: {content}\n"
     return formatted_string
 
 
@@ -100,62 +88,275 @@ def _get_groq_key():
     return key
 
 
-def agent_sim(model_LLM, plan_sys_prompt, user_query):
-    if model_LLM.split("-")[0] == 'claude':
-        client = anthropic.Anthropic(api_key=_get_anthropic_key())    
-        response = client.messages.create(
-            model=model_LLM,
-            max_tokens=2048,
-            temperature=1.0,  # Claude supports temperature
-            system=plan_sys_prompt,  # System prompt goes here (not in messages)
-            messages=[
-                {
-                    "role": "user",
-                    "content": user_query
-                }
+# ================================== LLM client pool ==================================
+# One long-lived client per (provider, api key) so calls reuse keep-alive connections
+# instead of paying a new connection pool + TLS handshake every time.
+# Set LLM_CLIENT_POOL=0 to build a fresh client per call (old behaviour, for comparison).
+POOL_CLIENTS = os.environ.get("LLM_CLIENT_POOL", "1") != "0"
+
+_clients: dict = {}
+_clients_lock = threading.Lock()
+
+# Per provider: calls on a freshly built client ("cold") vs a pooled one ("warm"), and token usage
+_metrics_lock = threading.Lock()
+_llm_metrics: dict = {}
+
+# Provider-side prompt caching: the system prompt and a call's static_prefix are marked as
+# cache breakpoints (Anthropic cache_control; Groq caches matching prefixes by itself).
+# Claude only caches prefixes of 1024+ tokens (2048 on Haiku); shorter ones are sent as usual.
+PROMPT_CACHE = os.environ.get("LLM_PROMPT_CACHE", "1") != "0"
+# LLM_LOG_USAGE=1 prints each call's token usage (uncached, cache read/write, output) to stderr
+LOG_USAGE = os.environ.get("LLM_LOG_USAGE", "0") == "1"
+
+
+def _provider_for_model(model_LLM):
+    prefix = model_LLM.split("-")[0]
+    if prefix == 'claude':
+        return "anthropic"
+    if prefix in ['llama', 'meta']:
+        return "groq"
+    return None
+
+
+def _build_client(provider, api_key, is_async):
+    if provider == "anthropic":
+        cls = anthropic.AsyncAnthropic if is_async else anthropic.Anthropic
+    else:
+        cls = AsyncGroq if is_async else Groq
+    return cls(api_key=api_key)
+
+
+def _get_client(provider, is_async=False):
+    """Return (client, cold) where cold is True when the client was just built."""
+    api_key = _get_anthropic_key() if provider == "anthropic" else _get_groq_key()
+    if not POOL_CLIENTS:
+        return _build_client(provider, api_key, is_async), True
+    key = (provider, api_key, is_async)
+    if is_async:
+        # Async clients are tied to the event loop they first connected on
+        key += (id(asyncio.get_running_loop()),)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is not None:
+            return client, False
+        client = _build_client(provider, api_key, is_async)
+        _clients[key] = client
+        return client, True
+
+
+def _record_call(provider, cold, seconds, ok, usage=None):
+    with _metrics_lock:
+        m = _llm_metrics.setdefault(provider, {
+            "cold_calls": 0, "cold_seconds": 0.0,
+            "warm_calls": 0, "warm_seconds": 0.0,
+            "errors": 0,
+            "input_tokens": 0, "cache_read_tokens": 0, "cache_write_tokens": 0, "output_tokens": 0,
+            "cache_hit_calls": 0, "cache_hit_seconds": 0.0, "cache_miss_calls": 0, "cache_miss_seconds": 0.0,
+        })
+        kind = "cold" if cold else "warm"
+        m[f"{kind}_calls"] += 1
+        m[f"{kind}_seconds"] += seconds
+        if not ok:
+            m["errors"] += 1
+        if usage:
+            for key in ("input_tokens", "cache_read_tokens", "cache_write_tokens", "output_tokens"):
+                m[key] += usage[key]
+            hit = "hit" if usage["cache_read_tokens"] else "miss"
+            m[f"cache_{hit}_calls"] += 1
+            m[f"cache_{hit}_seconds"] += seconds
+
+
+def llm_metrics():
+    """
+    Snapshot of call counts, latency and token usage per provider. The gap between
+    avg_cold_seconds and avg_warm_seconds is the per-call connection-setup cost the pool
+    saves; cache_hit_ratio is the share of prompt tokens served from the provider's
+    prompt cache, and avg_cache_hit/miss_seconds the latency with and without a hit.
+    """
+    with _metrics_lock:
+        out = {}
+        for provider, m in _llm_metrics.items():
+            out[provider] = dict(m)
+            for kind in ("cold", "warm", "cache_hit", "cache_miss"):
+                n = m[f"{kind}_calls"]
+                out[provider][f"avg_{kind}_seconds"] = round(m[f"{kind}_seconds"] / n, 4) if n else None
+            prompt = m["input_tokens"] + m["cache_read_tokens"] + m["cache_write_tokens"]
+            out[provider]["cache_hit_ratio"] = round(m["cache_read_tokens"] / prompt, 4) if prompt else None
+        out["pooled_clients"] = len(_clients)
+        out["pooling_enabled"] = POOL_CLIENTS
+        out["rate_limits"] = get_llm_limiter().metrics()
+        return out
+
+
+def _anthropic_request(model_LLM, plan_sys_prompt, user_query, static_prefix=""):
+    system = plan_sys_prompt
+    content = static_prefix + user_query
+    if PROMPT_CACHE:
+        # Static parts first, each ending in a cache breakpoint; the per-call text goes last
+        cache = {"type": "ephemeral"}
+        system = [{"type": "text", "text": plan_sys_prompt, "cache_control": cache}]
+        if static_prefix:
+            content = [
+                {"type": "text", "text": static_prefix, "cache_control": cache},
+                {"type": "text", "text": user_query},
             ]
-        )
-        return response.content[0].text
-
-    elif model_LLM.split("-")[0] in ['llama', 'meta']:
-        client = Groq(api_key=_get_groq_key())
-        completion = client.chat.completions.create(
-            model= model_LLM, #"llama-3.1-8b-instant", #"llama-3.3-70b-versatile",
-            messages=[
-                {
-                    "role": "system",
-                    "content": plan_sys_prompt  # Your system prompt here
-                },
-                {
+    return dict(
+        model=model_LLM,
+        max_tokens=2048,
+        temperature=1.0,  # Claude supports temperature
+        system=system,  # System prompt goes here (not in messages)
+        messages=[
+            {
                 "role": "user",
-                "content": user_query          
-                },
-            ],
-            temperature=1,
-            max_completion_tokens=1024,
-            top_p=1,
-            stream=True,
-            stop=None
-        )
+                "content": content
+            }
+        ]
+    )
+
+
+def _groq_request(model_LLM, plan_sys_prompt, user_query, static_prefix=""):
+    user_query = static_prefix + user_query
+    return dict(
+        model= model_LLM, #"llama-3.1-8b-instant", #"llama-3.3-70b-versatile",
+        messages=[
+            {
+                "role": "system",
+                "content": plan_sys_prompt  # Your system prompt here
+            },
+            {
+            "role": "user",
+            "content": user_query          
+            },
+        ],
+        temperature=1,
+        max_completion_tokens=1024,
+        top_p=1,
+        stream=True,
+        stop=None
+    )
+
+
+def _anthropic_usage(response):
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return None
+    return {
+        "input_tokens": usage.input_tokens,  # prompt tokens not read from or written to the cache
+        "cache_read_tokens": getattr(usage, "cache_read_input_tokens", None) or 0,
+        "cache_write_tokens": getattr(usage, "cache_creation_input_tokens", None) or 0,
+        "output_tokens": usage.output_tokens,
+    }
+
+
+def _groq_usage(chunk):
+    """Token usage from a Groq stream chunk (only the final one carries it)."""
+    usage = getattr(getattr(chunk, "x_groq", None), "usage", None)
+    if usage is None:
+        return None
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) or 0
+    return {
+        "input_tokens": usage.prompt_tokens - cached,
+        "cache_read_tokens": cached,
+        "cache_write_tokens": 0,
+        "output_tokens": usage.completion_tokens,
+    }
 
+
+def _finish_call(limiter, provider, model_LLM, priority, cold, started, ok, estimated, usage):
+    """Metrics, the per-call usage line, and settling the rate limit (cache reads do not count against it)."""
+    seconds = time.perf_counter() - started
+    _record_call(provider, cold, seconds, ok, usage)
+    limiter.settle(model_LLM, estimated,
+                   usage["input_tokens"] + usage["cache_write_tokens"] + usage["output_tokens"] if usage else None)
+    if LOG_USAGE and usage:
+        print(f"[llm] {model_LLM} {priority} {seconds:.2f}s input={usage['input_tokens']} "
+              f"cache_read={usage['cache_read_tokens']} cache_write={usage['cache_write_tokens']} "
+              f"output={usage['output_tokens']}", file=sys.stderr, flush=True)
+
+
+def agent_sim(model_LLM, plan_sys_prompt, user_query, priority="reply", static_prefix=""):
+    """
+    One completion. priority ("interactive", "reply" or "bid") is the call's class in the
+    shared per-model rate limits; the call waits here until its budget admits it.
+    static_prefix is user text that is the same across calls (e.g. a persona); it is sent
+    before user_query and cached by the provider along with plan_sys_prompt.
+    """
+    provider = _provider_for_model(model_LLM)
+    if provider is None:
+        return None
+    limiter = get_llm_limiter()
+    estimated = estimate_tokens(priority, plan_sys_prompt, static_prefix, user_query)
+    # The client first: a provider that cannot be set up (e.g. no API key) spends no budget
+    client, cold = _get_client(provider)
+    limiter.acquire(model_LLM, priority, estimated)
+    started = time.perf_counter()
+    ok = False
+    usage = None
+    try:
+        if provider == "anthropic":
+            response = client.messages.create(**_anthropic_request(model_LLM, plan_sys_prompt, user_query, static_prefix))
+            usage = _anthropic_usage(response)
+            ok = True
+            return response.content[0].text
+
+        completion = client.chat.completions.create(**_groq_request(model_LLM, plan_sys_prompt, user_query, static_prefix))
         response_content = ""
         for chunk in completion:
             chunk_content = chunk.choices[0].delta.content or ""
             response_content += chunk_content
+            usage = _groq_usage(chunk) or usage
             # print(chunk_content, end="")  # Optional: Still print to console if you want to see it live
+        ok = True
         return response_content
+    except _RATE_LIMIT_ERRORS:
+        limiter.throttled(model_LLM, priority)
+        raise
+    finally:
+        _finish_call(limiter, provider, model_LLM, priority, cold, started, ok, estimated, usage)
 
-def generate_bid_score_each_user(person_name, credits_left, model_LLM):
-    """
-    Generate bid score for a persona. Reads persona prompt and bidding prompt from config/.
-    """
+
+async def agent_sim_async(model_LLM, plan_sys_prompt, user_query, priority="reply", static_prefix=""):
+    """Async agent_sim on the providers' async clients; concurrent calls share the pooled connections."""
+    provider = _provider_for_model(model_LLM)
+    if provider is None:
+        return None
+    limiter = get_llm_limiter()
+    estimated = estimate_tokens(priority, plan_sys_prompt, static_prefix, user_query)
+    client, cold = _get_client(provider, is_async=True)
+    await limiter.acquire_async(model_LLM, priority, estimated)
+    started = time.perf_counter()
+    ok = False
+    usage = None
+    try:
+        if provider == "anthropic":
+            response = await client.messages.create(**_anthropic_request(model_LLM, plan_sys_prompt, user_query, static_prefix))
+            usage = _anthropic_usage(response)
+            ok = True
+            return response.content[0].text
+
+        completion = await client.chat.completions.create(**_groq_request(model_LLM, plan_sys_prompt, user_query, static_prefix))
+        response_content = ""
+        async for chunk in completion:
+            response_content += chunk.choices[0].delta.content or ""
+            usage = _groq_usage(chunk) or usage
+        ok = True
+        return response_content
+    except _RATE_LIMIT_ERRORS:
+        limiter.throttled(model_LLM, priority)
+        raise
+    finally:
+        _finish_call(limiter, provider, model_LLM, priority, cold, started, ok, estimated, usage)
+
+def _bid_prompts(person_name, credits_left, channel=None):
+    """(system prompt, static persona part, user query) for one persona's bid. Reads persona prompt and bidding prompt from config/."""
     persona_prompt_path = CONFIG_DIR / f"{person_name}_persona_prompt.txt"
     if not persona_prompt_path.exists():
         raise FileNotFoundError(f"Persona prompt not found: {persona_prompt_path}")
     with open(persona_prompt_path, "r", encoding="utf-8") as f:
         persona_prompt = f.read()
     
-    conversation_hist_format = format_history_as_string(turns=10)
+    conversation_hist_format = format_history_as_string(turns=10, channel=channel)
     
     bidding_prompt_path = CONFIG_DIR / "bidding_sys_prompt.txt"
     if not bidding_prompt_path.exists():
@@ -163,19 +364,29 @@ def generate_bid_score_each_user(person_name, credits_left, model_LLM):
     with open(bidding_prompt_path, "r", encoding="utf-8") as f:
         bidding_system_prompt = f.read()
     
-    bidding_system_prompt = bidding_system_prompt.replace("||", str(credits_left[person_name]))
+    # Credits change every round, so they go after the cached system prompt and persona
+    # (as in _batch_bid_prompts); a "||" placeholder in the prompt file points to them
+    bidding_system_prompt = bidding_system_prompt.replace("||", "the credits given below")
     
     # bidding_system_prompt = bidding_system_prompt + "\n\n" + "Persona: " + persona_prompt + "\n\n" + "Conversation History: \n" + conversation_hist_format
     plan_sys_prompt = bidding_system_prompt
-    user_query = "Persona: " + persona_prompt + "\n\n" + "Conversation History: \n" + conversation_hist_format
+    # The persona is the same every round (a cacheable prefix); credits and history come after it
+    persona_part = "Persona: " + persona_prompt + "\n\n"
+    user_query = f"Credits: {credits_left[person_name]}\n\n" + "Conversation History: \n" + conversation_hist_format
+    return plan_sys_prompt, persona_part, user_query
+
 
-    history = []
-    history.append({"role": "user", "content": bidding_system_prompt})
-    bid_score = agent_sim(model_LLM, plan_sys_prompt, user_query) #conversation(history)        
+def generate_bid_score_each_user(person_name, credits_left, model_LLM, channel=None):
+    """
+    Generate bid score for a persona from the last turns of channel (default CHANNEL).
+    """
+    plan_sys_prompt, persona_part, user_query = _bid_prompts(person_name, credits_left, channel)
+    bid_score = agent_sim(model_LLM, plan_sys_prompt, user_query, priority="bid", static_prefix=persona_part) #conversation(history)        
     # bid_scores[person_name] = bid_score
 
     return bid_score
 
+
     # bid_scores = {}
     # for person_name, person_role in person_role_dict.items():
     #     with open(f"{person_name}_persona_prompt.txt", "r") as f:
@@ -198,3 +409,57 @@ def generate_bid_score_each_user(person_name, credits_left, model_LLM):
     #     bid_scores[person_name] = bid_score
 
     # return bid_scores
+
+
+async def generate_bid_score_each_user_async(person_name, credits_left, model_LLM, channel=None):
+    """generate_bid_score_each_user on the async client pool."""
+    plan_sys_prompt, persona_part, user_query = _bid_prompts(person_name, credits_left, channel)
+    return await agent_sim_async(model_LLM, plan_sys_prompt, user_query, priority="bid", static_prefix=persona_part)
+
+
+# ================================== Batched bidding ==================================
+# One request scores every eligible persona: the bidding instructions and the history are
+# sent once, with a short summary of each persona (the start of its persona prompt).
+BATCH_SUMMARY_CHARS = int(os.environ.get("BID_BATCH_SUMMARY_CHARS", "1200"))
+_persona_summaries: dict = {}
+
+
+def persona_summary(person_name, max_chars=BATCH_SUMMARY_CHARS):
+    """The persona prompt cut to max_chars at a sentence end (whole prompt if max_chars is 0)."""
+    summary = _persona_summaries.get((person_name, max_chars))
+    if summary is None:
+        persona_prompt_path = CONFIG_DIR / f"{person_name}_persona_prompt.txt"
+        if not persona_prompt_path.exists():
+            raise FileNotFoundError(f"Persona prompt not found: {persona_prompt_path}")
+        summary = " ".join(persona_prompt_path.read_text(encoding="utf-8").split())
+        if max_chars and len(summary) > max_chars:
+            cut = summary.rfind(". ", 0, max_chars)
+            summary = summary[:cut + 1] if cut > 0 else summary[:max_chars]
+        _persona_summaries[(person_name, max_chars)] = summary
+    return summary
+
+
+def _batch_bid_prompts(persons, credits_left, channel=None):
+    """(system prompt, static persona list, user query) scoring all persons in one call."""
+    batch_prompt_path = CONFIG_DIR / "batch_bidding_sys_prompt.txt"
+    if not batch_prompt_path.exists():
+        raise FileNotFoundError(f"Batch bidding prompt not found: {batch_prompt_path}")
+    plan_sys_prompt = batch_prompt_path.read_text(encoding="utf-8")
+    # Summaries first (cacheable while the same personas bid); credits and history change every round
+    personas = "Personas:\n" + "\n".join(f"- {p}: {persona_summary(p)}" for p in persons) + "\n\n"
+    credits = "Credits: " + ", ".join(f"{p}={credits_left[p]}" for p in persons)
+    conversation_hist_format = format_history_as_string(turns=10, channel=channel)
+    user_query = credits + "\n\n" + "Conversation History: \n" + conversation_hist_format
+    return plan_sys_prompt, personas, user_query
+
+
+def generate_bid_scores_batch(persons, credits_left, model_LLM, channel=None):
+    """Raw model output for one batched bid ({"scores": {person: 0-100}}); parsed in bidding.py."""
+    plan_sys_prompt, personas, user_query = _batch_bid_prompts(persons, credits_left, channel)
+    return agent_sim(model_LLM, plan_sys_prompt, user_query, priority="bid", static_prefix=personas)
+
+
+async def generate_bid_scores_batch_async(persons, credits_left, model_LLM, channel=None):
+    """generate_bid_scores_batch on the async client pool."""
+    plan_sys_prompt, personas, user_query = _batch_bid_prompts(persons, credits_left, channel)
+    return await agent_sim_async(model_LLM, plan_sys_prompt, user_query, priority="bid", static_prefix=personas)
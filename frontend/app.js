@@ -387,6 +387,32 @@
     }
   }
 
+  // "Load earlier messages" at the top of a channel: fetches the page before the oldest shown seq
+  function addLoadEarlierButton(channel, container, firstSeq) {
+    const btn = document.createElement('button');
+    btn.type = 'button';
+    btn.className = 'load-earlier-btn';
+    btn.textContent = 'Load earlier messages';
+    btn.addEventListener('click', function () {
+      btn.disabled = true;
+      get('/api/history?channel=' + encodeURIComponent(channel) + '&before=' + encodeURIComponent(firstSeq))
+        .then(function (data) {
+          const older = (data && data.messages) || [];
+          const holder = document.createElement('div');
+          renderAll(holder, older);
+          const prevHeight = container.scrollHeight;
+          btn.remove();
+          while (holder.lastChild) container.insertBefore(holder.lastChild, container.firstChild);
+          if (data && data.has_older && older.length) addLoadEarlierButton(channel, container, older[0].seq);
+          container.scrollTop += container.scrollHeight - prevHeight;
+        })
+        .catch(function () {
+          btn.disabled = false;
+        });
+    });
+    container.insertBefore(btn, container.firstChild);
+  }
+
   function loadChannelChat(channel, container) {
     container.innerHTML = 'Loading…';
     if (evtSource) {
@@ -401,8 +427,14 @@
           container.innerHTML = '<p class="empty-msg">' + (EMPTY_MSG_BY_CHANNEL[channel] || 'No messages yet.') + '</p>';
         } else {
           renderAll(container, messages);
+          if (data.has_older) addLoadEarlierButton(channel, container, messages[0].seq);
         }
-        evtSource = new EventSource('/api/history/stream?channel=' + encodeURIComponent(channel));
+        // Stream from the last seq we rendered; on reconnect the browser sends Last-Event-ID
+        // itself and the server replays only the missed messages (no history refetch).
+        const lastSeq = messages.length ? messages[messages.length - 1].seq : null;
+        let streamUrl = '/api/history/stream?channel=' + encodeURIComponent(channel);
+        if (lastSeq != null) streamUrl += '&after=' + encodeURIComponent(lastSeq);
+        evtSource = new EventSource(streamUrl);
         evtSource.onmessage = function (e) {
           const empty = container.querySelector('.empty-msg');
           if (empty) empty.remove();
@@ -419,8 +451,16 @@
             }
           } catch (err) {}
         };
+        // Sent instead of a replay when we missed too many messages: reload the history
+        evtSource.addEventListener('reset', function () {
+          loadChannelChat(channel, container);
+        });
         evtSource.onerror = function () {
-          if (evtSource) evtSource.close();
+          // EventSource retries on its own (with Last-Event-ID); give up only if it was closed for good
+          if (evtSource && evtSource.readyState === EventSource.CLOSED) {
+            evtSource.close();
+            evtSource = null;
+          }
         };
       })
       .catch(function (err) {
@@ -615,22 +655,29 @@
       recommendationsTitle.textContent = 'Coffee Chat Recommendations for ' + profile;
       openRecommendationsPushbar();
 
-      fetch('/api/recommendations', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ user: profile }),
-      })
-        .then(function (r) {
-          return r.json()
-            .then(function (data) {
-              if (!r.ok) {
-                var err = (data && data.error) ? data.error : r.statusText;
-                return { error: err, recommendations: [] };
-              }
-              return data;
-            })
-            .catch(function () {
-              return { error: r.statusText || 'Server error', recommendations: [] };
+      // Precomputed results come back instantly; only fall back to generating when there are none yet
+      fetch('/api/recommendations?user=' + encodeURIComponent(profile))
+        .then(function (r) { return r.ok ? r.json() : {}; })
+        .catch(function () { return {}; })
+        .then(function (saved) {
+          if (saved && saved.generated_at) return saved;
+          return fetch('/api/recommendations', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ user: profile }),
+          })
+            .then(function (r) {
+              return r.json()
+                .then(function (data) {
+                  if (!r.ok) {
+                    var err = (data && data.error) ? data.error : r.statusText;
+                    return { error: err, recommendations: [] };
+                  }
+                  return data;
+                })
+                .catch(function () {
+                  return { error: r.statusText || 'Server error', recommendations: [] };
+                });
             });
         })
         .then(function (data) {
@@ -1,8 +1,8 @@
 """
 Coffee Chat Profile Matcher (Agentic data only)
 ================================================
-Uses only profiles under Agentic_coffee_chat_friend_finder/data/:
-  Anagha_Palandye.json, Gaurav_Atavale.json, Kanishkha_S.json, Nirbhay_R.json
+Uses the profiles under data/ (every *.json with a "profile" or "name" entry, e.g.
+Anagha_Palandye.json, Gaurav_Atavale.json, Kanishkha_S.json, Nirbhay_R.json).
 
 For one profile ("you"), matches with all other profiles and produces a summary:
   1. What you can learn from the other person
@@ -13,7 +13,16 @@ Usage:
   python profile_matcher.py --user anagha_palandye   # You = Anagha, match with everyone else
   python profile_matcher.py --user gaurav_atavale    # You = Gaurav, match with everyone else
   python profile_matcher.py --user anagha_palandye --other gaurav_atavale  # Single pair
+  python profile_matcher.py --user anagha_palandye --top 5  # Only the 5 most similar (profile index)
   python profile_matcher.py --list                   # List profiles
+  python profile_matcher.py --user gaurav --workers 4  # 4 summaries in flight at once
+
+Summaries are cached in outputs/match_cache/ (MATCH_CACHE_DIR), one file per pair named by
+the hash of both profiles' content, the model and PROMPT_VERSION. A pair whose profiles are
+unchanged is never regenerated; editing one profile only recomputes the pairs it is in.
+--refresh ignores the cache. Calls draw from the shared LLM budget of backend/rate_limit.py
+("limits" in config/models.json) at reply priority, so parallel runs stay under the
+provider limits and leave room for the server's interactive requests.
 
 Requires: pip install anthropic rich; export ANTHROPIC_API_KEY="..."
 """
@@ -21,8 +30,12 @@ Requires: pip install anthropic rich; export ANTHROPIC_API_KEY="..."
 import os
 import sys
 import json
+import time
+import hashlib
 import argparse
 import textwrap
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 try:
@@ -42,16 +55,18 @@ except ImportError:
     HAS_RICH = False
 
 BASE_DIR = Path(__file__).resolve().parent
-AGENTIC_DATA_DIR = BASE_DIR / "Agentic_coffee_chat_friend_finder" / "data"
+AGENTIC_DATA_DIR = BASE_DIR / "data"
 OUTPUT_DIR = BASE_DIR / "outputs"
+MATCH_CACHE_DIR = Path(os.environ.get("MATCH_CACHE_DIR", OUTPUT_DIR / "match_cache"))
+sys.path.insert(0, str(BASE_DIR / "backend"))
 
-# Only these 4 files under agentic*/data
-AGENTIC_PROFILE_FILES = [
-    "Anagha_Palandye.json",
-    "Gaurav_Atavale.json",
-    "Kanishkha_S.json",
-    "Nirbhay_R.json",
-]
+MODEL = "claude-sonnet-4-20250514"
+# Bump whenever the system prompt or prompt template of generate_match_summary changes:
+# it is part of every cache key, so old summaries are no longer served.
+PROMPT_VERSION = "1"
+PRIORITY = "reply"
+# Output tokens reserved in the rate limiter before the real usage is known
+EXPECTED_OUTPUT_TOKENS = 1500
 
 PROFILE_ALIASES = {
     "anagha": "anagha_palandye",
@@ -116,10 +131,9 @@ def build_profile_summary(profile: dict) -> str:
 
 
 def load_profiles() -> dict[str, dict]:
-    """Load only the 4 Agentic data files; each profile = full JSON (no LinkedIn/GitHub)."""
+    """Load every profile JSON under data/; each profile = full JSON (no LinkedIn/GitHub)."""
     profiles = {}
-    for filename in AGENTIC_PROFILE_FILES:
-        path = AGENTIC_DATA_DIR / filename
+    for path in sorted(AGENTIC_DATA_DIR.glob("*.json")):
         raw = _load_json(path)
         if raw is None:
             continue
@@ -129,6 +143,8 @@ def load_profiles() -> dict[str, dict]:
             data = raw
         else:
             continue
+        if not isinstance(data, dict) or not ("profile" in data or "name" in data):
+            continue  # recommendations.json, email_ids.json, ...
         key = _stem_to_key(path.stem)
         name = (data.get("profile") or {}).get("fullName") or data.get("name") or key.replace("_", " ").title()
         profiles[key] = {"name": name, "agentic": data}
@@ -146,24 +162,89 @@ def _resolve_key(key: str, profiles: dict) -> str:
     return key
 
 
-def call_claude(system: str, user_prompt: str, max_tokens: int = 4096) -> str:
-    try:
-        from dotenv import load_dotenv
-        load_dotenv(BASE_DIR / ".env")
-    except ImportError:
-        pass
-    api_key = os.environ.get("ANTHROPIC_API_KEY")
-    if not api_key:
-        print("❌  ANTHROPIC_API_KEY not set (e.g. in .env).")
-        sys.exit(1)
-    client = anthropic.Anthropic(api_key=api_key)
-    msg = client.messages.create(
-        model="claude-sonnet-4-20250514",
-        max_tokens=max_tokens,
-        system=system,
-        messages=[{"role": "user", "content": user_prompt}],
-    )
-    return msg.content[0].text
+def nearest_profiles(user_key: str, profiles: dict, k: int) -> list[str]:
+    """Keys of the k profiles most similar to user_key, from backend/profile_index.py (no LLM call)."""
+    from profile_index import top_matches
+    keys = [_stem_to_key(name) for name, _ in top_matches(user_key, k)]
+    return [key for key in keys if key in profiles and key != user_key]
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def _get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            try:
+                from dotenv import load_dotenv
+                load_dotenv(BASE_DIR / ".env")
+            except ImportError:
+                pass
+            api_key = os.environ.get("ANTHROPIC_API_KEY")
+            if not api_key:
+                print("❌  ANTHROPIC_API_KEY not set (e.g. in .env).")
+                sys.exit(1)
+            _client = anthropic.Anthropic(api_key=api_key)
+        return _client
+
+
+def call_claude(system: str, user_prompt: str, max_tokens: int = 4096, attempts: int = 3) -> str:
+    """One Claude call, admitted by the shared per-model rate limiter; retried after a provider 429."""
+    from rate_limit import get_llm_limiter
+    limiter = get_llm_limiter()
+    client = _get_client()
+    estimated = (len(system) + len(user_prompt)) // 4 + EXPECTED_OUTPUT_TOKENS
+    for attempt in range(attempts):
+        limiter.acquire(MODEL, PRIORITY, estimated)
+        try:
+            msg = client.messages.create(
+                model=MODEL,
+                max_tokens=max_tokens,
+                system=system,
+                messages=[{"role": "user", "content": user_prompt}],
+            )
+        except anthropic.RateLimitError:
+            limiter.throttled(MODEL, PRIORITY)
+            if attempt == attempts - 1:
+                raise
+            continue
+        limiter.settle(MODEL, estimated, msg.usage.input_tokens + msg.usage.output_tokens)
+        return msg.content[0].text
+
+
+def profile_hash(profile: dict) -> str:
+    """Content hash of a loaded profile (its JSON, canonicalised); changes whenever the file's content does."""
+    return hashlib.sha256(json.dumps(profile["agentic"], sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def match_cache_path(user_profile: dict, other_profile: dict) -> Path:
+    """Cache file of the (you, them) summary: the hash of both profiles, the model and PROMPT_VERSION."""
+    key = "\n".join([PROMPT_VERSION, MODEL, profile_hash(user_profile), profile_hash(other_profile)])
+    return MATCH_CACHE_DIR / f"{hashlib.sha256(key.encode('utf-8')).hexdigest()}.json"
+
+
+def cached_match_summary(user_profile: dict, other_profile: dict, refresh: bool = False) -> tuple[str, bool]:
+    """(summary, from_cache): the cached summary of this pair, or a new one (then cached) if none or refresh."""
+    path = match_cache_path(user_profile, other_profile)
+    if not refresh:
+        cached = _load_json(path)
+        if isinstance(cached, dict) and cached.get("summary"):
+            return cached["summary"], True
+    summary = generate_match_summary(user_profile, other_profile)
+    MATCH_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_text(json.dumps({
+        "user": user_profile["name"],
+        "other": other_profile["name"],
+        "model": MODEL,
+        "prompt_version": PROMPT_VERSION,
+        "created_at": time.time(),
+        "summary": summary,
+    }, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+    return summary, False
 
 
 def generate_match_summary(user_profile: dict, other_profile: dict) -> str:
@@ -237,18 +318,26 @@ def main():
           python profile_matcher.py --user anagha --other gaurav   # Single pair
           python profile_matcher.py --list
           python profile_matcher.py --user anagha --save       # Save each summary to outputs/
+          python profile_matcher.py --user anagha --top 3      # Anagha vs her 3 nearest profiles
+          python profile_matcher.py --user anagha --workers 4  # Up to 4 LLM calls at once
+          python profile_matcher.py --user anagha --refresh    # Regenerate even cached pairs
         """)
     )
     parser.add_argument("--user", default="anagha_palandye", help="Your profile (you match with others)")
     parser.add_argument("--other", default=None, help="If set, only match with this one profile")
     parser.add_argument("--list", action="store_true", help="List profiles")
     parser.add_argument("--save", action="store_true", help="Save summaries to outputs/")
+    parser.add_argument("--top", type=int, default=None,
+                        help="Only match with the N most similar profiles (profile index; no LLM call to pick them)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Summaries generated concurrently (rate limited by config/models.json)")
+    parser.add_argument("--refresh", action="store_true", help="Ignore cached summaries and regenerate them")
     args = parser.parse_args()
 
     profiles = load_profiles()
     if not profiles:
-        print("❌ No profiles found under Agentic_coffee_chat_friend_finder/data/")
-        print("   Expected: Anagha_Palandye.json, Gaurav_Atavale.json, Kanishkha_S.json, Nirbhay_R.json")
+        print(f"❌ No profiles found under {AGENTIC_DATA_DIR}/")
+        print("   Expected e.g.: Anagha_Palandye.json, Gaurav_Atavale.json, Kanishkha_S.json, Nirbhay_R.json")
         sys.exit(1)
 
     user_key = _resolve_key(args.user, profiles)
@@ -275,6 +364,11 @@ def main():
             print("❌ --user and --other must be different.")
             sys.exit(1)
         others = [other_key]
+    elif args.top:
+        others = nearest_profiles(user_key, profiles, args.top)
+        if not others:
+            print("❌ No other profiles to match with.")
+            sys.exit(1)
     else:
         others = [k for k in profiles if k != user_key]
         if not others:
@@ -292,15 +386,31 @@ def main():
     else:
         print(f"\n☕ Profile match: {user_name} with {', '.join(others)}\n")
 
-    for other_key in others:
-        other_profile = profiles[other_key]
-        other_name = other_profile["name"]
-        print(f"🔍 Matching {user_name} ↔ {other_name}...")
-        summary = generate_match_summary(user_profile, other_profile)
-        display_rich(f"Summary: {user_name} ↔ {other_name}", summary, style="green")
-        if args.save:
-            path = save_output(f"match_{user_key}_{other_key}.md", summary)
-            print(f"✅ Saved: {path}")
+    if args.refresh or any(not match_cache_path(user_profile, profiles[k]).exists() for k in others):
+        _get_client()  # fail once on a missing API key, before any worker starts
+    generated = cached = failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = [pool.submit(cached_match_summary, user_profile, profiles[k], args.refresh) for k in others]
+        # Shown in order; later pairs keep generating while earlier ones are displayed
+        for other_key, future in zip(others, futures):
+            other_name = profiles[other_key]["name"]
+            print(f"🔍 Matching {user_name} ↔ {other_name}...")
+            try:
+                summary, from_cache = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"❌ {user_name} ↔ {other_name}: {e}")
+                continue
+            if from_cache:
+                cached += 1
+            else:
+                generated += 1
+            display_rich(f"Summary: {user_name} ↔ {other_name}" + (" (cached)" if from_cache else ""),
+                         summary, style="green")
+            if args.save:
+                path = save_output(f"match_{user_key}_{other_key}.md", summary)
+                print(f"✅ Saved: {path}")
+    print(f"☕ {generated} generated, {cached} from cache ({MATCH_CACHE_DIR})" + (f", {failed} failed" if failed else ""))
 
     if HAS_RICH and len(others) > 1:
         tips = Table(box=box.ROUNDED, title="💡 Next steps", show_header=False, border_style="yellow")
@@ -308,8 +418,11 @@ def main():
         tips.add_column(style="white")
         tips.add_row("1.", "Use --save to write each summary to outputs/")
         tips.add_row("2.", "Use --other <key> to match with a single person only")
+        tips.add_row("3.", "Use --workers N to generate several summaries at once")
         Console(width=100).print(tips)
         Console(width=100).print()
+    if failed:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
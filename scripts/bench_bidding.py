@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Requests and tokens per bidding round: one bid request per persona vs one batched request.
+
+Runs --rounds rounds of bidding.collect_bids for all personas against a mocked provider
+(utils' Anthropic client replaced by a fake that sleeps --latency seconds and counts
+prompt tokens at ~4 characters each). The history is a recorded channel from
+backup_previous/, copied to a temporary HISTORY_DIR. --bad-rate makes that share of
+batched replies unparseable, to exercise the per-persona fallback. Reports per round:
+requests, input tokens, output tokens and wall time.
+
+Usage:
+  python scripts/bench_bidding.py --rounds 50 --bad-rate 0.1
+"""
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+BACKEND_DIR = REPO_ROOT / "backend"
+
+
+def _text(value) -> str:
+    """A system prompt or message content, whether a string or a list of text blocks."""
+    return value if isinstance(value, str) else "".join(block["text"] for block in value)
+
+
+class FakeAnthropic:
+    """Just enough of anthropic.Anthropic for utils.agent_sim, with request/token counters."""
+
+    def __init__(self, latency: float, bad_rate: float):
+        self.latency = latency
+        self.bad_rate = bad_rate
+        self.requests = self.input_tokens = self.output_tokens = 0
+        self.messages = self
+
+    def create(self, **request):
+        time.sleep(self.latency)
+        system, query = _text(request["system"]), _text(request["messages"][0]["content"])
+        credits_line = re.search(r"^Credits: (.*)$", query, re.M)
+        personas = re.findall(r"(\S+)=\d+", credits_line.group(1)) if credits_line else []
+        if personas:
+            if random.random() < self.bad_rate:
+                text = "Sure! Here are the scores you asked for."
+            else:
+                text = json.dumps({"scores": {p: random.randint(0, 100) for p in personas}})
+        else:
+            text = json.dumps({"score": random.randint(0, 100)})
+        usage = SimpleNamespace(input_tokens=(len(system) + len(query)) // 4, output_tokens=len(text) // 4)
+        self.requests += 1
+        self.input_tokens += usage.input_tokens
+        self.output_tokens += usage.output_tokens
+        return SimpleNamespace(content=[SimpleNamespace(text=text)], usage=usage)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-persona vs batched bidding against a mocked provider")
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake provider latency (seconds)")
+    parser.add_argument("--bad-rate", type=float, default=0.0, help="Share of batched replies that cannot be parsed")
+    parser.add_argument("--history", type=Path, default=REPO_ROOT / "backup_previous" / "finance_convers_history.txt")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    shutil.copy(args.history, Path(tmp) / "conversational_history.txt")
+    os.environ["HISTORY_DIR"] = tmp
+    os.environ["LLM_RATE_LIMITS"] = "0"
+    sys.path.insert(0, str(BACKEND_DIR))
+    import agent
+    import bidding
+    import utils
+
+    persons = list(agent.person_roles())
+    credits = {p: 100 for p in persons}
+    print(f"{len(persons)} personas, {args.rounds} rounds, history {args.history.name}")
+    print(f"{'mode':<12} {'requests':>9} {'input tok':>10} {'output tok':>11} {'seconds':>8}   (per round)")
+    try:
+        for batched in (False, True):
+            fake = FakeAnthropic(args.latency, args.bad_rate)
+            utils._get_client = lambda provider, is_async=False: (fake, False)
+            bidding.BATCH_BIDS = batched
+            started = time.perf_counter()
+            for _ in range(args.rounds):
+                bidding.collect_bids(persons, credits, channel="world")
+            elapsed = time.perf_counter() - started
+            n = args.rounds
+            print(f"{'batched' if batched else 'per-persona':<12} {fake.requests / n:>9.2f} {fake.input_tokens / n:>10.0f} "
+                  f"{fake.output_tokens / n:>11.1f} {elapsed / n:>8.3f}", flush=True)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
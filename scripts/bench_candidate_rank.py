@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Local candidate ranking before the recommendation LLM call (backend/candidate_rank.py):
+prompt size with and without it, and ranking time as the number of people grows.
+
+1. Prompt tokens (~4 characters each) of recommendation._build_request for each profile
+   over each recorded history (backup_previous/*_history.txt), with REC_TOP_K=0 (raw
+   history, as before) and with the shortlist.
+2. Ranking time for --profiles synthetic people, each with a profile and --messages
+   messages drawn from the persona prompts' vocabulary: shortlist() on a cold cache
+   (every text hashed), on a warm one (profiles and messages already hashed, as in a
+   running server), and the cosine top-k alone on a built index.
+No LLM calls are made.
+
+Usage:
+  python scripts/bench_candidate_rank.py --profiles 10000
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+BACKEND_DIR = REPO_ROOT / "backend"
+
+
+def _ms(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times) * 1000
+
+
+def prompt_sizes(recommendation, candidate_rank, profiles, histories):
+    print(f"{'history':<36} {'raw history':>12} {'shortlist':>10} {'saved':>7}   (prompt tokens, avg over profiles)")
+    tmp = tempfile.mkdtemp()
+    os.environ["HISTORY_DIR"] = tmp
+    import history_store
+    try:
+        for path in histories:
+            shutil.copy(path, Path(tmp) / "conversational_history.txt")
+            history_store._store = None
+            sizes = {}
+            for top_k in (0, candidate_rank.TOP_K or 5):
+                candidate_rank.TOP_K = top_k
+                total = 0
+                for p in profiles:
+                    prompt, message = recommendation._build_request(p, "world")
+                    total += (len(prompt) + len(message)) // 4
+                sizes[top_k] = total / len(profiles)
+            raw, short = sizes.values()
+            print(f"{path.name:<36} {raw:>12.0f} {short:>10.0f} {1 - short / raw:>6.0%}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def scale(candidate_rank, n, messages, repeat):
+    vocab = sorted({w for f in (REPO_ROOT / "config").glob("*_persona_prompt.txt")
+                    for w in candidate_rank.tokenize(f.read_text(encoding="utf-8"))})
+    rng = random.Random(0)
+
+    def text(words):
+        return " ".join(rng.choice(vocab) for _ in range(words))
+
+    # Synthetic people have no profile files: cached under (None, None) modification times
+    for i in range(n):
+        candidate_rank._profiles[f"p{i}"] = ((None, None), (text(20), text(120)))
+    candidate_rank._profiles["me"] = ((None, None), (text(20), text(120)))
+    records = [{"role": f"p{i % n}", "content": text(50)} for i in range(n * messages)]
+    records += [{"role": "me", "content": text(50)} for _ in range(5)]
+
+    candidate_rank._counts.cache_clear()
+    started = time.perf_counter()
+    candidate_rank.shortlist("me", records)
+    cold = (time.perf_counter() - started) * 1000
+    warm = _ms(lambda: candidate_rank.shortlist("me", records), repeat)
+    names = [f"p{i}" for i in range(n)]
+    index = candidate_rank.CandidateIndex(names, [candidate_rank.profile(p)[1] for p in names])
+    query = candidate_rank.profile("me")[1]
+    top = _ms(lambda: index.top(query, candidate_rank.TOP_K or 5), repeat)
+    matrix_mb = index.matrix.nbytes / 1e6
+    print(f"{n} people x {messages} messages, dim {candidate_rank.DIM} ({matrix_mb:.0f} MB matrix): "
+          f"shortlist cold {cold:.0f} ms, warm {warm:.1f} ms; top-k on a built index {top:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Candidate ranking: prompt size and ranking time")
+    parser.add_argument("--profiles", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--messages", type=int, default=2, help="Messages per synthetic person")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(BACKEND_DIR))
+    import agent
+    import candidate_rank
+    import recommendation
+
+    histories = sorted((REPO_ROOT / "backup_previous").glob("*_history.txt"))
+    prompt_sizes(recommendation, candidate_rank, list(agent.person_roles()), histories)
+    print()
+    candidate_rank.TOP_K = candidate_rank.TOP_K or 5
+    for n in args.profiles:
+        scale(candidate_rank, n, args.messages, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
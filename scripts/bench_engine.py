@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Startup time, memory and turn rate: one run.py process per channel vs the in-process engine.
+
+For each channel count, starts the simulation both ways against a mocked LLM provider
+(utils.agent_sim / agent_sim_async replaced by a sleep of --latency seconds returning a
+random bid or a canned reply) and reports:
+  startup  seconds until every channel has started its bidding loop
+  RSS      total resident memory of the simulation process(es) after --duration seconds
+  turns/s  replies written per second over that window
+
+History goes to a temporary HISTORY_DIR; data/ is not touched. Process mode above
+--process-limit channels is skipped (each process holds its own interpreter and clients).
+
+Usage:
+  python scripts/bench_engine.py --channels 6 50 500
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+BACKEND_DIR = REPO_ROOT / "backend"
+
+
+def install_fake_llm(latency: float) -> None:
+    """Replace the provider calls with a fixed-latency fake (bids get a random score)."""
+    import utils
+
+    def reply(plan_sys_prompt):
+        if "Score your interest" in plan_sys_prompt:
+            return json.dumps({"score": random.randint(0, 100)})
+        return "Fake reply for the benchmark."
+
+    def agent_sim(model_LLM, plan_sys_prompt, user_query, priority=None, static_prefix=""):
+        time.sleep(latency)
+        return reply(plan_sys_prompt)
+
+    async def agent_sim_async(model_LLM, plan_sys_prompt, user_query, priority=None, static_prefix=""):
+        await asyncio.sleep(latency)
+        return reply(plan_sys_prompt)
+
+    utils.agent_sim = agent_sim
+    utils.agent_sim_async = agent_sim_async
+
+
+def _child_process(channel: str, latency: float) -> None:
+    """One run.py, as server.py starts it, with the fake provider."""
+    import runpy
+    sys.path.insert(0, str(BACKEND_DIR))
+    install_fake_llm(latency)
+    sys.argv = ["run.py", "--channel", channel]
+    runpy.run_path(str(BACKEND_DIR / "run.py"), run_name="__main__")
+
+
+def _child_engine(n: int, latency: float) -> None:
+    """The engine with n channels; prints READY when every channel is running."""
+    sys.path.insert(0, str(BACKEND_DIR))
+    install_fake_llm(latency)
+    from engine import SimulationEngine
+
+    async def run():
+        engine = SimulationEngine()
+        sims = [engine.start_channel(f"bench_{i:04d}") for i in range(n)]
+        while any(s.state == "starting" for s in sims):
+            await asyncio.sleep(0.01)
+        print("READY", flush=True)
+        await engine.wait()
+
+    asyncio.run(run())
+
+
+def _rss_kb(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except FileNotFoundError:
+        pass
+    return 0
+
+
+def _count_turns(history_dir: str) -> int:
+    """Replies written so far (seed lines excluded)."""
+    total = 0
+    for path in Path(history_dir).glob("*_history.txt"):
+        with open(path, "rb") as f:
+            total += sum(1 for line in f if b'"Conversation started."' not in line)
+    return total
+
+
+def _wait_for_line(proc, marker: bytes, ready: threading.Event) -> None:
+    """Set ready when marker appears on proc's stream, then keep draining it."""
+    stream = proc.stdout
+    for line in iter(stream.readline, b""):
+        if marker in line:
+            ready.set()
+    ready.set()
+
+
+def _measure(procs, marker: bytes, history_dir: str, duration: float, started: float):
+    events = []
+    for proc in procs:
+        ev = threading.Event()
+        threading.Thread(target=_wait_for_line, args=(proc, marker, ev), daemon=True).start()
+        events.append(ev)
+    for ev in events:
+        ev.wait()
+    startup = time.perf_counter() - started
+    turns_before = _count_turns(history_dir)
+    time.sleep(duration)
+    rss_mb = sum(_rss_kb(p.pid) for p in procs) / 1024
+    turns = _count_turns(history_dir) - turns_before
+    for p in procs:
+        p.kill()
+    for p in procs:
+        p.wait()
+    return startup, rss_mb, turns / duration
+
+
+def run_process_mode(n: int, args):
+    known = ["world", "finance", "technology", "healthcare", "architecture", "computer_science"]
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, HISTORY_DIR=tmp, PYTHONUNBUFFERED="1")
+        started = time.perf_counter()
+        procs = [
+            subprocess.Popen(
+                [sys.executable, __file__, "--child-process", known[i % len(known)], "--latency", str(args.latency)],
+                cwd=str(BACKEND_DIR), env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            )
+            for i in range(n)
+        ]
+        return _measure(procs, b"Started.", tmp, args.duration, started)
+
+
+def run_engine_mode(n: int, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, HISTORY_DIR=tmp, PYTHONUNBUFFERED="1")
+        started = time.perf_counter()
+        proc = subprocess.Popen(
+            [sys.executable, __file__, "--child-engine", str(n), "--latency", str(args.latency)],
+            cwd=str(BACKEND_DIR), env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        )
+        return _measure([proc], b"READY", tmp, args.duration, started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Process-per-channel vs in-process engine benchmark")
+    parser.add_argument("--channels", type=int, nargs="+", default=[6, 50, 500])
+    parser.add_argument("--latency", type=float, default=0.3, help="Fake LLM call latency (seconds)")
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds to run after startup")
+    parser.add_argument("--process-limit", type=int, default=50, help="Skip process mode above this many channels")
+    parser.add_argument("--child-process", help=argparse.SUPPRESS)
+    parser.add_argument("--child-engine", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child_process:
+        return _child_process(args.child_process, args.latency)
+    if args.child_engine:
+        return _child_engine(args.child_engine, args.latency)
+
+    print(f"{'channels':>8}  {'mode':<8} {'startup':>9} {'RSS':>10} {'turns/s':>8}")
+    for n in args.channels:
+        modes = [("engine", run_engine_mode)]
+        if n <= args.process_limit:
+            modes.insert(0, ("process", run_process_mode))
+        else:
+            print(f"{n:>8}  {'process':<8} {'skipped (> --process-limit)':>30}")
+        for name, fn in modes:
+            startup, rss_mb, rate = fn(n, args)
+            print(f"{n:>8}  {name:<8} {startup:>8.2f}s {rss_mb:>8.0f}MB {rate:>8.1f}", flush=True)
+
+
+if __name__ == "__main__":
+    main()
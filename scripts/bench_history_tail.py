@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Benchmark: last-N history reads via backend/history.py vs readlines() of the whole file.
+
+Writes a synthetic channel history (default 1M lines) to a temp file and times both
+approaches for a few values of N.
+
+Usage:
+  python scripts/bench_history_tail.py
+  python scripts/bench_history_tail.py --lines 200000 --repeat 5
+"""
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT / "backend"))
+
+import history  # noqa: E402
+
+
+def _readlines_tail(path: Path, n: int) -> list:
+    """The old approach: read every line, keep the last n."""
+    with open(path, "r", encoding="utf-8") as f:
+        lines = f.readlines()
+    return [json.loads(ln) for ln in lines[-n:] if ln.strip()]
+
+
+def _time(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark tail reads of a channel history file")
+    parser.add_argument("--lines", type=int, default=1_000_000, help="Lines in the synthetic history file")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement (best is reported)")
+    args = parser.parse_args()
+
+    roles = ["Gaurav", "Anagha", "Kanishkha", "Nirbhay"]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "bench_convers_history.txt"
+        with open(path, "w", encoding="utf-8") as f:
+            for i in range(args.lines):
+                f.write(json.dumps({"role": roles[i % 4], "content": f"Message {i} about markets, AI and coffee."}) + "\n")
+        size_mb = path.stat().st_size / 1e6
+        print(f"History file: {args.lines:,} lines, {size_mb:.1f} MB")
+        print(f"{'N':>5} {'readlines (ms)':>16} {'tail_records (ms)':>18} {'speedup':>9}")
+        for n in (1, 10, 50):
+            assert _readlines_tail(path, n) == history.tail_records(path, n)
+            old = _time(lambda: _readlines_tail(path, n), args.repeat)
+            new = _time(lambda: history.tail_records(path, n), args.repeat)
+            print(f"{n:>5} {old * 1000:>16.2f} {new * 1000:>18.3f} {old / new:>8.0f}x")
+
+
+if __name__ == "__main__":
+    main()
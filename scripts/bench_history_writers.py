@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Stress test for concurrent history appends: many writer processes, many readers.
+
+Starts --writers processes, each appending --records records to one channel from
+--threads threads through history_writer (so appends are group-committed), while
+--readers threads in this process follow the channel like SSE broadcasters do.
+Records carry random-size padding (up to --max-pad bytes) so a torn or interleaved
+write would show up. Checks that:
+  - every reader sees strictly consecutive seqs with intact payloads (no torn line skipped),
+  - the final history holds every record exactly once, numbered 1..N.
+
+With --segment-bytes the JSONL log rotates into sealed segments while all this runs.
+
+Runs in a temporary directory; data/ is not touched.
+
+Usage:
+  python scripts/bench_history_writers.py --writers 8 --readers 100
+  python scripts/bench_history_writers.py --backend sqlite --durability batch
+  python scripts/bench_history_writers.py --segment-bytes 1000000 --compression gzip
+"""
+import argparse
+import multiprocessing as mp
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from history_store import JsonlHistoryStore, SqliteHistoryStore  # noqa: E402
+from history_writer import DURABILITY_MODES, HistoryWriter  # noqa: E402
+
+CHANNEL = "world"
+
+
+def _make_store(backend: str, tmp: str, segment_bytes: int = 0, compression: str = "none"):
+    if backend == "sqlite":
+        return SqliteHistoryStore(Path(tmp) / "history.db")
+    return JsonlHistoryStore(Path(tmp), segment_bytes=segment_bytes, compression=compression)
+
+
+def _payload(writer_id: int, i: int, max_pad: int) -> dict:
+    pad = random.Random(writer_id * 1_000_003 + i).randint(0, max_pad)
+    return {"role": f"writer{writer_id}", "content": f"w{writer_id}-{i}", "pad": "x" * pad}
+
+
+def _check(entry: dict, max_pad: int) -> bool:
+    """True if the record is exactly what _payload wrote."""
+    try:
+        writer_id, i = (int(x) for x in entry["content"][1:].split("-"))
+    except (KeyError, ValueError):
+        return False
+    return entry == dict(_payload(writer_id, i, max_pad), seq=entry["seq"])
+
+
+def _writer_process(writer_id, args, tmp, start):
+    writer = HistoryWriter(_make_store(args.backend, tmp, args.segment_bytes, args.compression), args.durability)
+    threads, records, max_pad = args.threads, args.records, args.max_pad
+    per_thread = records // threads
+
+    def work(t):
+        for k in range(per_thread):
+            i = t * per_thread + k
+            writer.append(CHANNEL, [_payload(writer_id, i, max_pad)])
+
+    start.wait()
+    pool = [threading.Thread(target=work, args=(t,)) for t in range(threads)]
+    for th in pool:
+        th.start()
+    for th in pool:
+        th.join()
+    stats = writer.metrics()["channels"].get(CHANNEL, {})
+    writer.close()
+    return stats
+
+
+class Reader(threading.Thread):
+    def __init__(self, store, max_pad: int, done: threading.Event):
+        super().__init__(daemon=True)
+        self.follower = store.follower(CHANNEL)
+        self.max_pad = max_pad
+        self.done = done
+        self.seen = 0
+        self.errors = []
+
+    def run(self):
+        self.follower.refresh()
+        last = self.follower.last_seq
+        while True:
+            finished = self.done.is_set()
+            for entry in self.follower.refresh():
+                if entry["seq"] != last + 1:
+                    self.errors.append(f"seq {entry['seq']} after {last}")
+                elif not _check(entry, self.max_pad):
+                    self.errors.append(f"corrupt record at seq {entry['seq']}")
+                last = entry["seq"]
+                self.seen += 1
+            if finished:
+                return
+            time.sleep(0.002)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent history writer/reader stress test")
+    parser.add_argument("--backend", choices=("jsonl", "sqlite"), default="jsonl")
+    parser.add_argument("--durability", choices=DURABILITY_MODES, default="none")
+    parser.add_argument("--writers", type=int, default=8, help="Writer processes")
+    parser.add_argument("--threads", type=int, default=4, help="Appending threads per writer process")
+    parser.add_argument("--records", type=int, default=500, help="Records per writer process")
+    parser.add_argument("--readers", type=int, default=100, help="Follower threads")
+    parser.add_argument("--max-pad", type=int, default=16384, help="Max padding bytes per record")
+    parser.add_argument("--segment-bytes", type=int, default=0, help="JSONL: rotate the active file at this size (0 = never)")
+    parser.add_argument("--compression", choices=("none", "gzip", "zstd"), default="none", help="JSONL: sealed segment compression")
+    args = parser.parse_args()
+    args.records -= args.records % args.threads
+    total = args.writers * args.records
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = _make_store(args.backend, tmp, args.segment_bytes, args.compression)
+        store.append(CHANNEL, [{"role": "seed", "content": "start"}])
+        done = threading.Event()
+        readers = [Reader(store, args.max_pad, done) for _ in range(args.readers)]
+        for r in readers:
+            r.start()
+
+        ctx = mp.get_context("fork" if sys.platform.startswith("linux") else "spawn")
+        start = ctx.Manager().Event()
+        with ctx.Pool(args.writers) as pool:
+            results = [
+                pool.apply_async(_writer_process, (w, args, tmp, start))
+                for w in range(args.writers)
+            ]
+            t0 = time.perf_counter()
+            start.set()
+            stats = [r.get() for r in results]
+            elapsed = time.perf_counter() - t0
+
+        done.set()
+        for r in readers:
+            r.join()
+
+        # Final state: seed + every record exactly once, seqs 1..N+1
+        records, _, _ = store.page(CHANNEL, total + 1)
+        seqs = [e["seq"] for e in records]
+        keys = [e["content"] for e in records[1:]]
+        expected = {f"w{w}-{i}" for w in range(args.writers) for i in range(args.records)}
+        problems = []
+        if seqs != list(range(1, total + 2)):
+            problems.append(f"seqs are not 1..{total + 1} (got {len(seqs)} records)")
+        if len(keys) != len(set(keys)) or set(keys) != expected:
+            problems.append(f"{len(expected - set(keys))} records lost, {len(keys) - len(set(keys))} duplicated")
+        if any(not _check(e, args.max_pad) for e in records[1:]):
+            problems.append("corrupt records in final history")
+        reader_errors = sum(len(r.errors) for r in readers)
+        if reader_errors:
+            problems.append(f"{reader_errors} reader errors, e.g. {next(e for r in readers for e in r.errors)}")
+        behind = [r.seen for r in readers if r.seen != total]
+        if behind:
+            problems.append(f"{len(behind)} readers saw fewer than {total} new records (min {min(behind)})")
+
+        segments = len(store.log(CHANNEL).segments()) if args.backend == "jsonl" else 0
+
+    batches = sum(s.get("batches", 0) for s in stats)
+    print(f"{args.backend}, durability={args.durability}: {args.writers} writers x {args.threads} threads, {args.readers} readers")
+    print(f"  {total} records in {elapsed:.2f}s ({total / elapsed:.0f} records/s), {batches} batches ({total / max(batches, 1):.1f} records/batch)" + (f", {segments} sealed segments" if segments else ""))
+    if problems:
+        print("FAIL")
+        for p in problems:
+            print(f"  {p}")
+        sys.exit(1)
+    print("OK: no lost, duplicated, torn or out-of-order records")
+
+
+if __name__ == "__main__":
+    main()
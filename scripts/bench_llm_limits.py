@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Shared LLM rate limits under load: do background channels stay under the provider
+limit, and do interactive calls still get through quickly?
+
+Starts --channels processes, each looping like run.py (four bid calls, then one reply)
+through utils.agent_sim against a fake provider client that answers after --latency
+seconds and reports token usage. The parent process makes an interactive call every
+--interactive-every seconds. All processes share one budget (--rpm / --tpm) through
+the limiter's state files. Reports, with the limiter on and off:
+  calls/min       per priority class over the run
+  over limit      calls a provider enforcing --rpm would have rejected (sliding 60s window)
+  interactive     p50 / max seconds an interactive call waited for the budget
+
+First checks that a call too big to leave a priority's reserve untouched (e.g. a ~2100
+token bid against the 12000 TPM fallback model) is admitted on a full bucket instead of
+waiting forever.
+
+Usage:
+  python scripts/bench_llm_limits.py --channels 6 --rpm 60 --duration 90
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+BACKEND_DIR = REPO_ROOT / "backend"
+MODEL = "claude-bench-model"
+
+
+def _text(value) -> str:
+    """A system prompt or message content, whether a string or a list of text blocks."""
+    return value if isinstance(value, str) else "".join(block["text"] for block in value)
+
+
+def _install_fake_provider(latency: float, rpm: float, tpm: float, state_dir: str, enabled: bool) -> None:
+    """Route utils' anthropic calls to a fixed-latency fake, under a limiter with the bench's budget."""
+    sys.path.insert(0, str(BACKEND_DIR))
+    import rate_limit
+    import utils
+
+    class Messages:
+        def create(self, **request):
+            time.sleep(latency)
+            text = json.dumps({"score": 50}) if "Score your interest" in _text(request["system"]) else "Bench reply."
+            prompt_tokens = (len(_text(request["system"])) + len(_text(request["messages"][0]["content"]))) // 4
+            return SimpleNamespace(content=[SimpleNamespace(text=text)],
+                                   usage=SimpleNamespace(input_tokens=prompt_tokens, output_tokens=40))
+
+    fake = SimpleNamespace(messages=Messages())
+    utils._get_client = lambda provider, is_async=False: (fake, False)
+    limits = {MODEL: {"rpm": rpm, "tpm": tpm}} if enabled else {}
+    rate_limit._llm_limiter = rate_limit.LLMRateLimiter(limits, Path(state_dir))
+
+
+def _channel(args, state_dir: str, enabled: bool, events, stop_at: float) -> None:
+    _install_fake_provider(args.latency, args.rpm, args.tpm, state_dir, enabled)
+    import utils
+    bid_prompt = "Score your interest in speaking next. " + "x" * 2000
+    while time.time() < stop_at:
+        for _ in range(4):
+            utils.agent_sim(MODEL, bid_prompt, "Conversation History:\n" + "y" * 2000, priority="bid")
+            events.put(("bid", time.time(), 0.0))
+        utils.agent_sim(MODEL, "You are a persona.", "Conversation History:\n" + "y" * 2000, priority="reply")
+        events.put(("reply", time.time(), 0.0))
+    events.put(("metrics", os.getpid(), json.dumps(utils.llm_metrics()["rate_limits"])))
+
+
+def check_oversize_calls() -> None:
+    """Calls above (1 - reserve) * capacity are admitted once the bucket is full, at every priority."""
+    sys.path.insert(0, str(BACKEND_DIR))
+    import rate_limit
+    for model, rpm, tpm in (("llama-3.3-70b-versatile", 30, 12000), ("claude-sonnet-4-5-20250929", 50, 30000)):
+        for priority in rate_limit.PRIORITIES:
+            cap = tpm * rate_limit.BURST
+            for tokens in (cap * 0.9, cap, cap * 3):
+                budget = rate_limit.ModelBudget(model, rpm, tpm)
+                wait = budget.try_take(priority, tokens)
+                assert wait == 0.0, f"{model} {priority} {tokens:.0f} tokens on a full bucket: wait {wait:.2f}s"
+            limiter = rate_limit.LLMRateLimiter({model: {"rpm": rpm, "tpm": tpm}})
+            started = time.monotonic()
+            limiter.acquire(model, priority, cap * 0.9)
+            assert time.monotonic() - started < 1.0
+    print("oversize calls: admitted on a full bucket at every priority")
+
+
+def _over_limit(times, rpm: float) -> int:
+    """Calls beyond rpm within any trailing 60s window."""
+    times = sorted(times)
+    over, start = 0, 0
+    for i, t in enumerate(times):
+        while times[start] < t - 60:
+            start += 1
+        if i - start + 1 > rpm:
+            over += 1
+    return over
+
+
+def run(args, enabled: bool) -> dict:
+    with tempfile.TemporaryDirectory() as state_dir:
+        ctx = mp.get_context("fork")
+        events = ctx.Queue()
+        stop_at = time.time() + args.duration
+        procs = [ctx.Process(target=_channel, args=(args, state_dir, enabled, events, stop_at)) for _ in range(args.channels)]
+        for p in procs:
+            p.start()
+
+        _install_fake_provider(args.latency, args.rpm, args.tpm, state_dir, enabled)
+        import utils
+        interactive_waits, interactive_times = [], []
+        next_call = time.time() + args.interactive_every
+        while time.time() < stop_at:
+            time.sleep(max(0.0, next_call - time.time()))
+            started = time.time()
+            utils.agent_sim(MODEL, "Recommend coffee chats.", "z" * 4000, priority="interactive")
+            interactive_waits.append(time.time() - started - args.latency)
+            interactive_times.append(time.time())
+            next_call += args.interactive_every
+
+        calls = {"bid": [], "reply": [], "interactive": interactive_times}
+        finished = 0
+        while finished < len(procs):
+            kind, t, extra = events.get()
+            if kind == "metrics":
+                finished += 1
+            else:
+                calls[kind].append(t)
+        for p in procs:
+            p.join()
+        minutes = args.duration / 60
+        all_times = [t for ts in calls.values() for t in ts]
+        return {
+            "per_min": {k: len(v) / minutes for k, v in calls.items()},
+            "over_limit": _over_limit(all_times, args.rpm),
+            "interactive_p50": statistics.median(interactive_waits) if interactive_waits else 0.0,
+            "interactive_max": max(interactive_waits, default=0.0),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared LLM rate limiter under multi-channel load")
+    parser.add_argument("--channels", type=int, default=6)
+    parser.add_argument("--rpm", type=float, default=60)
+    parser.add_argument("--tpm", type=float, default=100000)
+    parser.add_argument("--latency", type=float, default=0.2, help="Fake provider latency (seconds)")
+    parser.add_argument("--duration", type=float, default=90.0)
+    parser.add_argument("--interactive-every", type=float, default=5.0)
+    args = parser.parse_args()
+
+    check_oversize_calls()
+    print(f"{'limiter':<8} {'bid/min':>8} {'reply/min':>10} {'inter/min':>10} {'over limit':>11} {'inter p50':>10} {'inter max':>10}")
+    for enabled in (False, True):
+        r = run(args, enabled)
+        pm = r["per_min"]
+        print(f"{'on' if enabled else 'off':<8} {pm['bid']:>8.1f} {pm['reply']:>10.1f} {pm['interactive']:>10.1f} "
+              f"{r['over_limit']:>11} {r['interactive_p50']:>9.2f}s {r['interactive_max']:>9.2f}s", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Profile vector index (backend/profile_index.py) at scale: build time, size on disk,
+query latency and recall of the IVF lists against scoring every profile, and the cost
+of an incremental update vs a rebuild.
+
+Generates --profiles synthetic profiles from the persona prompts' vocabulary, each
+drawn mostly from one of --topics word groups (so there are real neighbourhoods),
+indexes them in a temporary directory, and reopens the index from disk (memory-mapped)
+before querying. recall@k is the share of the exact top-k (all rows scored) that the
+IVF query returns. No LLM calls are made.
+
+Usage:
+  python scripts/bench_profile_index.py --profiles 100000 --queries 200
+"""
+import argparse
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+BACKEND_DIR = REPO_ROOT / "backend"
+
+
+def synthetic_profiles(n, topics, words, tokenize, rng):
+    vocab = np.array(sorted({w for f in (REPO_ROOT / "config").glob("*_persona_prompt.txt")
+                             for w in tokenize(f.read_text(encoding="utf-8"))}))
+    groups = [rng.choice(len(vocab), size=40, replace=False) for _ in range(topics)]
+    docs = {}
+    for i in range(n):
+        topic = groups[rng.integers(topics)]
+        picks = np.where(rng.random(words) < 0.7, topic[rng.integers(len(topic), size=words)],
+                         rng.integers(len(vocab), size=words))
+        docs[f"user_{i:06d}"] = (" ".join(vocab[picks]), str(i))
+    return docs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile index: build, size, IVF latency/recall, updates")
+    parser.add_argument("--profiles", type=int, default=100000)
+    parser.add_argument("--topics", type=int, default=300)
+    parser.add_argument("--words", type=int, default=80, help="Words per synthetic profile")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(BACKEND_DIR))
+    import profile_index
+    from relevance import tokenize
+
+    rng = np.random.default_rng(0)
+    started = time.perf_counter()
+    docs = synthetic_profiles(args.profiles, args.topics, args.words, tokenize, rng)
+    print(f"{args.profiles} synthetic profiles generated in {time.perf_counter() - started:.1f}s")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = profile_index.ProfileIndex(Path(tmp))
+        started = time.perf_counter()
+        index.build(docs)
+        index.save()
+        build_seconds = time.perf_counter() - started
+        size_mb = sum(p.stat().st_size for p in Path(tmp).iterdir()) / 1e6
+        nlist = len(index.centroids) if index.centroids is not None else 1
+        print(f"build {build_seconds:.1f}s, {size_mb:.0f} MB on disk, dim {index.dim}, {nlist} IVF lists")
+
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        started = time.perf_counter()
+        index = profile_index.ProfileIndex(Path(tmp))
+        print(f"reopen {1000 * (time.perf_counter() - started):.0f} ms (vectors memory-mapped)")
+
+        names = list(docs)
+        queries = [names[i] for i in rng.choice(len(names), size=args.queries, replace=False)]
+        exact, exact_ms = {}, []
+        for q in queries:
+            t = time.perf_counter()
+            exact[q] = {n for n, _ in index.query(q, args.k, nprobe=nlist)}
+            exact_ms.append(time.perf_counter() - t)
+        print(f"{'nprobe':>8} {'p50 ms':>8} {'recall@' + str(args.k):>10}")
+        print(f"{'all':>8} {statistics.median(exact_ms) * 1000:>8.2f} {1.0:>10.3f}")
+        for nprobe in args.nprobe:
+            ms, hits = [], 0
+            for q in queries:
+                t = time.perf_counter()
+                got = index.query(q, args.k, nprobe=nprobe)
+                ms.append(time.perf_counter() - t)
+                hits += len(exact[q] & {n for n, _ in got})
+            print(f"{nprobe:>8} {statistics.median(ms) * 1000:>8.2f} {hits / (args.k * len(queries)):>10.3f}")
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        print(f"max RSS grew {max(0, rss_after - rss_before) / 1024:.0f} MB while querying")
+
+        changed = names[0]
+        started = time.perf_counter()
+        index.upsert(changed, docs[names[1]][0] + " changed", "edited")
+        index.upsert("user_new", docs[names[2]][0], "new")
+        index.save()
+        update_ms = 1000 * (time.perf_counter() - started)
+        top = index.query("user_new", 1, nprobe=nlist)
+        print(f"incremental: 1 edit + 1 add + save {update_ms:.0f} ms (vs {build_seconds:.1f}s rebuild); "
+              f"user_new's nearest is {top[0][0]}")
+
+
+if __name__ == "__main__":
+    main()
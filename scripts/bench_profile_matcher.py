@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+profile_matcher.py --user X: wall time and LLM calls with --workers and the pair cache.
+
+Copies the profiles in data/ into a temporary directory (plus synthetic variants up to
+--profiles) and runs profile_matcher.main() against a fake Claude client that answers
+after --latency seconds. Runs, in order, sharing one temporary cache:
+  cold, 1 worker       every pair generated one at a time (the old behaviour)
+  cold, N workers      every pair generated, --workers at once (--refresh)
+  cold, N workers, rpm same, under a limiter allowing --rpm calls per minute (if --rpm)
+  warm                 nothing changed: every pair from the cache
+  edit one other       one other profile edited: only its pair is regenerated
+  edit user            the user's own profile edited: every pair is regenerated
+No real LLM calls are made.
+
+Usage:
+  python scripts/bench_profile_matcher.py --profiles 12 --workers 4 --latency 1.0 --rpm 30
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+sys.path.insert(0, str(REPO_ROOT / "backend"))
+
+
+class FakeMessages:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def create(self, **request):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        return SimpleNamespace(content=[SimpleNamespace(text="### 1. What you can learn from them\n- Bench.")],
+                               usage=SimpleNamespace(input_tokens=len(request["messages"][0]["content"]) // 4,
+                                                     output_tokens=1200))
+
+
+def write_profiles(data_dir: Path, n: int) -> list:
+    """Real profiles from data/, then copies with a marker field until there are n; returns the file paths."""
+    import profile_matcher
+    real = []
+    for source in sorted((REPO_ROOT / "data").glob("*.json")):
+        raw = profile_matcher._load_json(source)
+        data = raw[0] if isinstance(raw, list) and raw else raw
+        if isinstance(data, dict) and ("profile" in data or "name" in data):
+            real.append((source, data))
+    paths = []
+    for i in range(n):
+        source, data = real[i % len(real)]
+        path = data_dir / (source.name if i < len(real) else f"{source.stem}_{i}.json")
+        if i >= len(real):
+            data = dict(data, bench_copy=i)
+        path.write_text(json.dumps(data), encoding="utf-8")
+        paths.append(path)
+    return paths
+
+
+def edit(path: Path) -> None:
+    data = json.loads(path.read_text(encoding="utf-8"))
+    data["bench_edit"] = data.get("bench_edit", 0) + 1
+    path.write_text(json.dumps(data), encoding="utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="profile_matcher: --workers and the content-addressed pair cache")
+    parser.add_argument("--profiles", type=int, default=12)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=1.0, help="Fake Claude latency (seconds)")
+    parser.add_argument("--rpm", type=float, default=0, help="Also run the parallel cold case under this RPM limit")
+    args = parser.parse_args()
+
+    import profile_matcher
+    import rate_limit
+
+    fake = FakeMessages(args.latency)
+    profile_matcher._get_client = lambda: SimpleNamespace(messages=fake)
+    tmp = Path(tempfile.mkdtemp())
+    try:
+        data_dir = tmp / "data"
+        data_dir.mkdir()
+        paths = write_profiles(data_dir, args.profiles)
+        profile_matcher.AGENTIC_DATA_DIR = data_dir
+        profile_matcher.MATCH_CACHE_DIR = tmp / "match_cache"
+        user = profile_matcher._stem_to_key(paths[0].stem)
+
+        def run(label, workers, refresh=False, rpm=0):
+            limits = {profile_matcher.MODEL: {"rpm": rpm}} if rpm else {}
+            rate_limit._llm_limiter = rate_limit.LLMRateLimiter(limits, None)
+            argv = ["profile_matcher.py", "--user", user, "--workers", str(workers)] + (["--refresh"] if refresh else [])
+            before = fake.calls
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()), _argv(argv):
+                profile_matcher.main()
+            seconds = time.perf_counter() - started
+            print(f"{label:<28} {workers:>7} {fake.calls - before:>6} {seconds:>8.1f}s")
+
+        print(f"{user} vs {len(paths) - 1} others, fake latency {args.latency}s")
+        print(f"{'run':<28} {'workers':>7} {'calls':>6} {'wall':>9}")
+        run("cold, 1 worker", 1, refresh=True)
+        run(f"cold, {args.workers} workers", args.workers, refresh=True)
+        if args.rpm:
+            run(f"cold, {args.workers} workers, {args.rpm:g} rpm", args.workers, refresh=True, rpm=args.rpm)
+        run("warm (nothing changed)", args.workers)
+        edit(paths[1])
+        run("edit one other profile", args.workers)
+        edit(paths[0])
+        run("edit the user's profile", args.workers)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+@contextlib.contextmanager
+def _argv(argv):
+    saved = sys.argv
+    sys.argv = argv
+    try:
+        yield
+    finally:
+        sys.argv = saved
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("ANTHROPIC_API_KEY", "bench")
+    main()
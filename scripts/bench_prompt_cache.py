@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Prompt caching: how much of each round's prompt is served from the provider's cache,
+and what that does to billed input tokens and time to first token.
+
+Runs --rounds rounds of bidding.collect_bids plus the winner's reply (agent.respond)
+against a mocked provider. The fake mirrors Anthropic's prompt cache: a prefix ending
+at a cache_control breakpoint is cached if it is at least --min-tokens long, a later
+request whose prompt starts with the same bytes reads it back, and entries expire after
+--ttl seconds without use. Tokens are ~4 characters; the fake answers after --latency
+seconds plus --per-token seconds for every prompt token not read from the cache.
+The history is a recorded channel from backup_previous/ that grows by one recorded
+message per round, as a live channel does.
+
+Reports per mode (per-persona or batched bids, LLM_PROMPT_CACHE off and on), per round:
+  uncached / read / write   prompt tokens by cache outcome (from utils.llm_metrics)
+  billed                    input tokens at Anthropic's prices (writes 1.25x, reads 0.1x)
+  hit ratio                 share of prompt tokens read from the cache
+  ttft                      average fake time to first token per call
+
+Usage:
+  python scripts/bench_prompt_cache.py --rounds 40
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+BACKEND_DIR = REPO_ROOT / "backend"
+
+
+def _blocks(value) -> list:
+    """A system prompt or message content as a list of text blocks."""
+    return [{"type": "text", "text": value}] if isinstance(value, str) else value
+
+
+class FakeAnthropic:
+    """Just enough of anthropic.Anthropic for utils.agent_sim, with a prefix prompt cache."""
+
+    def __init__(self, latency: float, per_token: float, min_tokens: int, ttl: float):
+        self.latency = latency
+        self.per_token = per_token
+        self.min_tokens = min_tokens
+        self.ttl = ttl
+        self.cache = {}  # prefix text -> last used (time.monotonic)
+        self.calls = 0
+        self.ttft = 0.0
+        self.messages = self
+
+    def create(self, **request):
+        blocks = _blocks(request["system"]) + _blocks(request["messages"][0]["content"])
+        now = time.monotonic()
+        prefix, breakpoints = "", []
+        for block in blocks:
+            prefix += block["text"]
+            if block.get("cache_control") and len(prefix) // 4 >= self.min_tokens:
+                breakpoints.append(prefix)
+        total = len(prefix) // 4
+        read = 0
+        for candidate in reversed(breakpoints):
+            if now - self.cache.get(candidate, -self.ttl) < self.ttl:
+                read = len(candidate) // 4
+                break
+        write = (len(breakpoints[-1]) // 4 - read) if breakpoints else 0
+        for candidate in breakpoints:
+            self.cache[candidate] = now
+
+        ttft = self.latency + (total - read) * self.per_token
+        time.sleep(ttft)
+        self.calls += 1
+        self.ttft += ttft
+        text = "Fake reply for the benchmark."
+        if "Score your interest" in blocks[0]["text"] or "For EVERY persona" in blocks[0]["text"]:
+            text = json.dumps({"score": random.randint(0, 100)})
+            if "For EVERY persona" in blocks[0]["text"]:
+                line = prefix[prefix.rindex("Credits: ") + 9:].split("\n", 1)[0]
+                text = json.dumps({"scores": {item.split("=")[0]: random.randint(0, 100) for item in line.split(", ")}})
+        usage = SimpleNamespace(input_tokens=total - read - write, cache_read_input_tokens=read,
+                                cache_creation_input_tokens=write, output_tokens=len(text) // 4)
+        return SimpleNamespace(content=[SimpleNamespace(text=text)], usage=usage)
+
+
+def check_bid_prefixes(utils, persons) -> None:
+    """The cached part of a bid (up to its last breakpoint) is byte-identical whatever the credits are."""
+    def cached_prefix(request):
+        blocks = _blocks(request["system"]) + _blocks(request["messages"][0]["content"])
+        last = max(i for i, block in enumerate(blocks) if block.get("cache_control"))
+        return "".join(block["text"] for block in blocks[:last + 1])
+
+    for person in persons:
+        prefixes = {cached_prefix(utils._anthropic_request("m", *_reorder(utils._bid_prompts(person, {person: c}, "world"))))
+                    for c in (0, 37, 100)}
+        assert len(prefixes) == 1, f"{person}: bid cache prefix changes with credits"
+    prefixes = {cached_prefix(utils._anthropic_request("m", *_reorder(utils._batch_bid_prompts(
+        persons, {p: c for p in persons}, "world")))) for c in (0, 37, 100)}
+    assert len(prefixes) == 1, "batched bid cache prefix changes with credits"
+    print("bid cache prefixes: identical across credit values")
+
+
+def _reorder(prompts):
+    """(system, static prefix, query) as _anthropic_request's (system, query, static prefix)."""
+    system, static, query = prompts
+    return system, query, static
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prompt cache hits and billed tokens against a mocked provider")
+    parser.add_argument("--rounds", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.01, help="Fake time to first token with a full cache hit (seconds)")
+    parser.add_argument("--per-token", type=float, default=0.00002, help="Fake seconds per uncached prompt token")
+    parser.add_argument("--min-tokens", type=int, default=1024, help="Shortest cacheable prefix")
+    parser.add_argument("--ttl", type=float, default=300.0, help="Cache entry lifetime without use (seconds)")
+    parser.add_argument("--history", type=Path, default=REPO_ROOT / "backup_previous" / "finance_convers_history.txt")
+    args = parser.parse_args()
+
+    recorded = [json.loads(line) for line in args.history.read_text(encoding="utf-8").splitlines() if line.strip()]
+    tmp = tempfile.mkdtemp()
+    os.environ["HISTORY_DIR"] = tmp
+    os.environ["LLM_RATE_LIMITS"] = "0"
+    sys.path.insert(0, str(BACKEND_DIR))
+    import agent
+    import bidding
+    import utils
+
+    history_file = Path(tmp) / "conversational_history.txt"
+    persons = list(agent.person_roles())
+    credits = {p: 100 for p in persons}
+    utils.PROMPT_CACHE = True
+    check_bid_prefixes(utils, persons)
+    print(f"{len(persons)} personas, {args.rounds} rounds, history {args.history.name}")
+    print(f"{'mode':<18} {'uncached':>9} {'read':>7} {'write':>7} {'billed':>8} {'hit ratio':>10} {'ttft':>7}   (per round)")
+    try:
+        for batched in (False, True):
+            for cached in (False, True):
+                history_file.write_text("".join(json.dumps(r) + "\n" for r in recorded[:10]), encoding="utf-8")
+                fake = FakeAnthropic(args.latency, args.per_token, args.min_tokens, args.ttl)
+                utils._get_client = lambda provider, is_async=False: (fake, False)
+                utils._llm_metrics.clear()
+                utils.PROMPT_CACHE = cached
+                bidding.BATCH_BIDS = batched
+                last = None
+                for i in range(args.rounds):
+                    bids = bidding.collect_bids(persons, credits, channel="world", last_person=last)
+                    last = max(bids, key=bids.get)
+                    agent.get_agent(last).respond(utils.format_history_as_string(turns=10, channel="world"))
+                    with history_file.open("a", encoding="utf-8") as f:
+                        f.write(json.dumps(recorded[(10 + i) % len(recorded)]) + "\n")
+                m = utils.llm_metrics()["anthropic"]
+                n = args.rounds
+                billed = m["input_tokens"] + 1.25 * m["cache_write_tokens"] + 0.1 * m["cache_read_tokens"]
+                mode = f"{'batched' if batched else 'per-persona'} {'cache' if cached else 'no cache'}"
+                print(f"{mode:<18} {m['input_tokens'] / n:>9.0f} {m['cache_read_tokens'] / n:>7.0f} "
+                      f"{m['cache_write_tokens'] / n:>7.0f} {billed / n:>8.0f} {m['cache_hit_ratio'] or 0:>10.1%} "
+                      f"{fake.ttft / fake.calls:>6.3f}s", flush=True)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Recommendation cache: latency of repeat clicks, concurrent identical requests, and
+requests after the history moves on.
+
+Calls recommendation.get_recommendations with utils.agent_sim replaced by a fake that
+answers after --latency seconds (and counts calls). The world channel's history is a
+recorded one from backup_previous/, copied to a temporary HISTORY_DIR; results go to a
+temporary data/recommendations/. Reports, for each step, the wall time, the cache status
+returned and the LLM calls made:
+  first click          cold cache
+  repeat click         same profile, unchanged history
+  N concurrent         --concurrent identical requests at once on a cold cache
+  new turn             one message appended (served stale, refreshed in the background)
+  all profiles         one request per profile; each keeps its own saved file
+
+Usage:
+  python scripts/bench_rec_cache.py --latency 2 --concurrent 20
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+BACKEND_DIR = REPO_ROOT / "backend"
+PROFILES = ["Gaurav_Atavale", "Anagha_Palandye", "Kanishkha_S", "Nirbhay_R"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recommendation cache against a mocked provider")
+    parser.add_argument("--latency", type=float, default=1.0, help="Fake LLM latency (seconds)")
+    parser.add_argument("--concurrent", type=int, default=20)
+    parser.add_argument("--ttl", type=float, default=1.0, help="REC_CACHE_TTL for the run (seconds)")
+    parser.add_argument("--history", type=Path, default=REPO_ROOT / "backup_previous" / "finance_convers_history.txt")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    shutil.copy(args.history, Path(tmp) / "conversational_history.txt")
+    os.environ["HISTORY_DIR"] = tmp
+    os.environ["REC_CACHE_TTL"] = str(args.ttl)
+    sys.path.insert(0, str(BACKEND_DIR))
+    import recommendation
+    import utils
+
+    recommendation.RECOMMENDATIONS_DIR = Path(tmp) / "recommendations"
+    calls = []
+    lock = threading.Lock()
+
+    def fake_agent_sim(model_LLM, plan_sys_prompt, user_query, priority="reply", static_prefix=""):
+        time.sleep(args.latency)
+        with lock:
+            calls.append(time.time())
+        user = user_query.split("recommendations for ", 1)[1].split(".", 1)[0]
+        return json.dumps({"recommendations": [{"name": f"match for {user}", "likelihood": len(calls)}]})
+
+    utils.agent_sim = fake_agent_sim
+
+    def step(label, fn):
+        before = len(calls)
+        started = time.perf_counter()
+        statuses = fn()
+        elapsed = time.perf_counter() - started
+        print(f"{label:<22} {elapsed * 1000:>10.1f} ms  {','.join(sorted(set(statuses))):<10} {len(calls) - before:>5}", flush=True)
+
+    def one(profile="Gaurav_Atavale"):
+        return recommendation.get_recommendations(profile)["cache"]
+
+    print(f"{'step':<22} {'wall':>13}  {'cache':<10} {'calls':>5}")
+    try:
+        step("first click", lambda: [one()])
+        step("repeat click", lambda: [one()])
+        time.sleep(args.ttl + 0.1)
+        recommendation._cache._entries.clear()
+        recommendation.recommendations_path("Gaurav_Atavale").unlink()  # a true cold start
+        with ThreadPoolExecutor(args.concurrent) as pool:
+            step(f"{args.concurrent} concurrent", lambda: list(pool.map(lambda _: one(), range(args.concurrent))))
+        with open(Path(tmp) / "conversational_history.txt", "a", encoding="utf-8") as f:
+            f.write(json.dumps({"role": "Human", "content": "Anyone here working on payments infra?"}) + "\n")
+        step("new turn", lambda: [one()])
+        time.sleep(args.latency + 0.2)
+        step("after refresh", lambda: [one()])
+        step("all profiles", lambda: [one(p) for p in PROFILES])
+        saved = {p: recommendation.load_saved(p)["recommendations"][0]["name"] for p in PROFILES}
+        print("saved files:", json.dumps(saved))
+        print(f"LLM calls in total: {len(calls)} (including background refreshes)")
+        print("cache:", json.dumps(recommendation.cache_metrics()))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Background recommendation precomputation: how stale are the results a user gets, and
+how long do they wait for them?
+
+Appends a recorded message to a temporary world channel every --turn-seconds and runs
+rec_precompute.RecommendationPrecomputer for the four profiles, with utils.agent_sim
+replaced by a fake that answers after --latency seconds. Every --check-seconds a "user"
+asks for a random profile through the server's GET /api/recommendations handler
+(precomputed, no LLM) and the cached POST path (recommendation.get_recommendations).
+Reports the wait and the freshness (turns behind, age) of what they got, and the number
+of LLM calls made in the background.
+
+Usage:
+  python scripts/bench_rec_precompute.py --duration 30 --every-turns 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+BACKEND_DIR = REPO_ROOT / "backend"
+PROFILES = {"Gaurav": "Gaurav_Atavale", "Anagha": "Anagha_Palandye", "Kanishkha": "Kanishkha_S", "Nirbhay": "Nirbhay_R"}
+
+
+async def run(args, recorded, history_file):
+    import rec_precompute
+    import recommendation
+    import server
+
+    pre = rec_precompute.RecommendationPrecomputer(PROFILES.values(), ["world"], args.every_turns, poll_seconds=0.2)
+    pre.start()
+    get_waits, post_waits, behind, ages = [], [], [], []
+    stop_at = time.time() + args.duration
+    next_turn = next_check = time.time()
+    i = 0
+    while time.time() < stop_at:
+        now = time.time()
+        if now >= next_turn:
+            with history_file.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(recorded[i % len(recorded)]) + "\n")
+            i += 1
+            next_turn += args.turn_seconds
+        if now >= next_check and i > args.every_turns:
+            user = random.choice(list(PROFILES))
+            started = time.perf_counter()
+            got = await server.api_get_recommendations(user=user, channel="world")
+            get_waits.append(time.perf_counter() - started)
+            if got["generated_at"]:
+                behind.append(got["turns_behind"])
+                ages.append(got["age_seconds"])
+            started = time.perf_counter()
+            await asyncio.to_thread(recommendation.get_recommendations, PROFILES[user], "world")
+            post_waits.append(time.perf_counter() - started)
+            next_check += args.check_seconds
+        await asyncio.sleep(0.05)
+    await pre.stop()
+    return i, pre.status(), get_waits, post_waits, behind, ages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recommendation precomputation against a mocked provider")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--latency", type=float, default=1.0, help="Fake LLM latency (seconds)")
+    parser.add_argument("--turn-seconds", type=float, default=1.0, help="One new message every this many seconds")
+    parser.add_argument("--every-turns", type=int, default=5, help="REC_PRECOMPUTE_TURNS")
+    parser.add_argument("--check-seconds", type=float, default=0.5)
+    parser.add_argument("--history", type=Path, default=REPO_ROOT / "backup_previous" / "finance_convers_history.txt")
+    args = parser.parse_args()
+
+    recorded = [json.loads(line) for line in args.history.read_text(encoding="utf-8").splitlines() if line.strip()]
+    tmp = tempfile.mkdtemp()
+    history_file = Path(tmp) / "conversational_history.txt"
+    history_file.write_text("", encoding="utf-8")
+    os.environ["HISTORY_DIR"] = tmp
+    os.environ["LLM_RATE_LIMITS"] = "0"
+    sys.path.insert(0, str(BACKEND_DIR))
+    import recommendation
+    import utils
+
+    recommendation.RECOMMENDATIONS_DIR = Path(tmp) / "recommendations"
+    calls = []
+
+    def fake_agent_sim(model_LLM, plan_sys_prompt, user_query, priority="reply", static_prefix=""):
+        time.sleep(args.latency)
+        calls.append(priority)
+        return json.dumps({"recommendations": [{"name": "someone", "likelihood": 50}]})
+
+    utils.agent_sim = fake_agent_sim
+    try:
+        turns, status, get_waits, post_waits, behind, ages = asyncio.run(run(args, recorded, history_file))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    def ms(values):
+        return f"p50 {statistics.median(values) * 1000:.1f} ms, max {max(values) * 1000:.1f} ms" if values else "-"
+
+    print(f"{turns} turns, {len(get_waits)} user requests, REC_PRECOMPUTE_TURNS={args.every_turns}, LLM latency {args.latency}s")
+    print(f"GET (precomputed)   {ms(get_waits)}")
+    print(f"POST (cached)       {ms(post_waits)}")
+    if behind:
+        print(f"freshness           turns behind p50 {statistics.median(behind)}, max {max(behind)}; "
+              f"age p50 {statistics.median(ages):.1f}s, max {max(ages):.1f}s")
+    print(f"LLM calls           {calls.count('reply')} background, {calls.count('interactive')} on a user's request")
+    print(f"precomputer         {json.dumps(status)}")
+
+
+if __name__ == "__main__":
+    main()
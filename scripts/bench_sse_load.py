@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Load test for /api/history/stream: hold many concurrent SSE clients on one server
+and measure fan-out latency.
+
+Opens --clients EventSource-style connections to the human channel, posts one
+message through /api/history/human, and reports how long it took every client to
+receive it. Start the server first (python backend/run_web.py).
+
+Note: this appends a test message to data/human_convers_history.txt.
+
+First checks, in process, the reconnect replay of broadcaster.py: a Last-Event-ID gap
+within REPLAY_LIMIT is replayed in full, and a bigger one gets a single "reset" event
+(the client reloads /api/history) instead of a partial replay.
+
+Usage:
+  python scripts/bench_sse_load.py --url http://localhost:8002 --clients 2000
+"""
+import argparse
+import asyncio
+import resource
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+try:
+    import httpx
+except ImportError:
+    print("Install httpx: pip install httpx", file=sys.stderr)
+    sys.exit(1)
+
+
+async def _client(http: httpx.AsyncClient, url: str, ready: list, marker: str, received: list):
+    """One SSE connection: note when it is connected and when the marker message arrives."""
+    async with http.stream("GET", url) as resp:
+        resp.raise_for_status()
+        async for line in resp.aiter_lines():
+            if line.startswith(": connected"):
+                ready.append(1)
+            elif line.startswith("data:") and marker in line:
+                received.append(time.perf_counter())
+                return
+
+
+async def check_replay_reset() -> None:
+    """Gaps up to REPLAY_LIMIT are replayed in full; bigger ones get one reset event and the stream ends."""
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+    import broadcaster
+
+    records = [{"seq": seq, "role": "A", "content": f"m{seq}"} for seq in range(1, 2 * broadcaster.REPLAY_LIMIT + 1)]
+    follower = SimpleNamespace(
+        last_seq=records[-1]["seq"],
+        read_after=lambda after, limit=None: [r for r in records if r["seq"] > after][:limit],
+    )
+    b = broadcaster.ChannelBroadcaster("check", follower)
+    b._ready.set()
+
+    async def replay(after_seq):
+        chunks = []
+        stream = b.stream(b.subscribe(), after_seq=after_seq, heartbeat=0.05)
+        async for chunk in stream:
+            if chunk.startswith(": keep-alive"):
+                break
+            chunks.append(chunk)
+        await stream.aclose()
+        return chunks[1:]  # after ": connected"
+
+    last = records[-1]["seq"]
+    full = await replay(last - broadcaster.REPLAY_LIMIT)
+    assert len(full) == broadcaster.REPLAY_LIMIT and all(c.startswith("id: ") for c in full), len(full)
+    reset = await replay(last - broadcaster.REPLAY_LIMIT - 1)
+    assert len(reset) == 1 and reset[0].startswith(f"event: reset\nid: {last}\n"), reset[:2]
+    assert b.replay_resets == 1
+    print(f"replay: gap of {broadcaster.REPLAY_LIMIT} replayed in full, bigger gap gets one reset event")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="SSE fan-out load test")
+    parser.add_argument("--url", default="http://localhost:8002", help="Server base URL")
+    parser.add_argument("--clients", type=int, default=1000, help="Concurrent SSE connections")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Seconds to wait for delivery")
+    args = parser.parse_args()
+
+    await check_replay_reset()
+
+    # Each connection is a file descriptor on both sides
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, max(soft, args.clients * 2 + 256)), hard))
+
+    marker = f"sse-load-{time.time_ns()}"
+    stream_url = f"{args.url}/api/history/stream?channel=human"
+    limits = httpx.Limits(max_connections=args.clients + 10, max_keepalive_connections=0)
+    ready: list = []
+    received: list = []
+    async with httpx.AsyncClient(timeout=httpx.Timeout(args.timeout), limits=limits) as http:
+        t0 = time.perf_counter()
+        tasks = [
+            asyncio.create_task(_client(http, stream_url, ready, marker, received))
+            for _ in range(args.clients)
+        ]
+        while len(ready) < args.clients and time.perf_counter() - t0 < args.timeout:
+            failed = sum(1 for t in tasks if t.done() and t.exception())
+            if failed:
+                print(f"{failed} connections failed, e.g. {next(t.exception() for t in tasks if t.done() and t.exception())!r}")
+                break
+            await asyncio.sleep(0.1)
+        print(f"Connected {len(ready)}/{args.clients} clients in {time.perf_counter() - t0:.2f}s")
+
+        metrics = (await http.get(f"{args.url}/metrics")).json()
+        print(f"Server reports {metrics['channels']['human']['subscribers']} subscribers on 'human'")
+
+        sent = time.perf_counter()
+        r = await http.post(f"{args.url}/api/history/human", json={"content": marker})
+        r.raise_for_status()
+        await asyncio.wait(tasks, timeout=args.timeout)
+        for t in tasks:
+            t.cancel()
+
+    if received:
+        lat = sorted(x - sent for x in received)
+        print(f"Delivered to {len(received)}/{args.clients} clients")
+        print(f"  p50 {lat[len(lat) // 2] * 1000:.1f} ms, p99 {lat[int(len(lat) * 0.99) - 1] * 1000:.1f} ms, max {lat[-1] * 1000:.1f} ms")
+    else:
+        print("No client received the message")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Offline evaluation of the bid relevance pre-filter (backend/relevance.py) on recorded
+channel histories (backup_previous/*_history.txt by default).
+
+Replays every recorded turn: the messages before it are the context, and the persona
+who actually spoke next is the recorded choice. For each threshold, reports:
+  calls    LLM bid calls made with the filters, out of one per persona per turn
+  saved    share of bid calls skipped
+  changed  turns whose recorded speaker would have been filtered out (bid 0), so the
+           turn order must differ from the recording from that point on
+  top-1    turns where the recorded speaker was the most relevant candidate
+
+With deferral (the default, as in bidding.py) the previous speaker is not asked up front;
+their bid is only requested when every other bid is 0, which a recording cannot show, so
+those calls are not counted. --no-defer evaluates the relevance filter alone.
+No LLM calls are made; personas are assumed to all have credits.
+
+Usage:
+  python scripts/eval_bid_filter.py --thresholds 0.2 0.4 0.6 --turns 3
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT / "backend"))
+
+import agent  # noqa: E402
+from relevance import RelevanceFilter  # noqa: E402
+
+
+def load_histories(paths):
+    histories = {}
+    for path in paths:
+        records = []
+        for line in path.read_text(encoding="utf-8").splitlines():
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+        if len(records) > 1:
+            histories[path.name] = records
+    return histories
+
+
+def evaluate(histories, persona_texts, roles, threshold, turns, min_contenders, defer):
+    role_person = {r: p for p, r in roles.items()}
+    f = RelevanceFilter(persona_texts, roles, threshold=threshold, recent_turns=turns, min_contenders=min_contenders)
+    total = calls = changed = top1 = 0
+    for records in histories.values():
+        for i in range(1, len(records)):
+            speaker = role_person.get(records[i].get("role"))
+            if speaker is None:
+                continue  # a human or unknown role spoke
+            context = records[:i]
+            previous = role_person.get(context[-1].get("role"))
+            candidates = [p for p in roles if not (defer and p == previous)]
+            keep = f.contenders(candidates, context)
+            scores = f.scores(context)
+            total += 1
+            calls += len(keep)
+            changed += speaker not in keep
+            top1 += max(candidates, key=lambda p: scores[p]) == speaker
+    return total, calls, changed, top1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the bid relevance pre-filter on recorded histories")
+    parser.add_argument("paths", nargs="*", type=Path, help="History files (default: backup_previous/*_history.txt)")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.0, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8])
+    parser.add_argument("--turns", type=int, nargs="+", default=[1, 3, 5], help="Recent messages compared (BID_RELEVANCE_TURNS)")
+    parser.add_argument("--min-contenders", type=int, default=2)
+    parser.add_argument("--no-defer", action="store_true", help="Ask the previous speaker up front too")
+    args = parser.parse_args()
+
+    paths = args.paths or sorted((REPO_ROOT / "backup_previous").glob("*_history.txt"))
+    histories = load_histories(paths)
+    roles = agent.person_roles()
+    persona_texts = {p: agent.get_agent(p).persona_prompt for p in roles}
+    print(f"{len(histories)} histories, {sum(len(r) - 1 for r in histories.values())} recorded turns, {len(roles)} personas")
+    print(f"{'turns':>5} {'threshold':>9} {'calls':>12} {'saved':>7} {'changed':>8} {'top-1':>6}")
+    for turns in args.turns:
+        for threshold in args.thresholds:
+            total, calls, changed, top1 = evaluate(histories, persona_texts, roles, threshold, turns,
+                                                   args.min_contenders, not args.no_defer)
+            baseline = total * len(roles)
+            print(f"{turns:>5} {threshold:>9.2f} {calls:>5}/{baseline:<6} {1 - calls / baseline:>6.1%} "
+                  f"{changed / total:>7.1%} {top1 / total:>5.1%}")
+
+
+if __name__ == "__main__":
+    main()